@@ -6,7 +6,16 @@ from sqlmodel import SQLModel
 from alembic import context
 
 # Import all models so SQLModel.metadata is populated
-from src.models import SearchFilter, TelegramUser, UserSearchFilters  # noqa: F401
+from src.models import (  # noqa: F401
+    Digest,
+    DigestOffer,
+    FSMState,
+    PollerLease,
+    PollerWorker,
+    SearchFilter,
+    TelegramUser,
+    UserSearchFilters,
+)
 
 config = context.config
 fileConfig(config.config_file_name)
@@ -0,0 +1,29 @@
+"""Unique index on telegramuser.telegram_id
+
+Revision ID: 4b8e2f1a9c3d
+Revises: c60cc46d9379
+Create Date: 2025-09-20 12:10:31.417205
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "4b8e2f1a9c3d"
+down_revision: Union[str, Sequence[str], None] = "c60cc46d9379"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Drop duplicates left by the old select-then-insert path, keep the oldest row.
+    op.execute("DELETE FROM telegramuser a USING telegramuser b WHERE a.telegram_id = b.telegram_id AND a.id > b.id")
+    op.create_index(op.f("ix_telegramuser_telegram_id"), "telegramuser", ["telegram_id"], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f("ix_telegramuser_telegram_id"), table_name="telegramuser")
@@ -0,0 +1,31 @@
+"""Add paused flag to subscriptions and a (user_id, id) index for /filters
+
+Revision ID: d4f81c6a2e93
+Revises: b7d2e94c5a16
+Create Date: 2025-10-14 20:17:42.509318
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "d4f81c6a2e93"
+down_revision: Union[str, Sequence[str], None] = "b7d2e94c5a16"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("usersearchfilters", sa.Column("paused", sa.Boolean(), server_default=sa.false(), nullable=False))
+    op.create_index("ix_usersearchfilters_user_id_id", "usersearchfilters", ["user_id", "id"], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_usersearchfilters_user_id_id", table_name="usersearchfilters")
+    op.drop_column("usersearchfilters", "paused")
@@ -0,0 +1,34 @@
+"""Widen telegramuser.telegram_id to BIGINT
+
+Revision ID: f3b9a2d61c48
+Revises: d4f81c6a2e93
+Create Date: 2026-10-17 20:31:05.114870
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "f3b9a2d61c48"
+down_revision: Union[str, Sequence[str], None] = "d4f81c6a2e93"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Telegram ids no longer fit in 32 bits
+    op.alter_column(
+        "telegramuser", "telegram_id", existing_type=sa.Integer(), type_=sa.BigInteger(), existing_nullable=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.alter_column(
+        "telegramuser", "telegram_id", existing_type=sa.BigInteger(), type_=sa.Integer(), existing_nullable=False
+    )
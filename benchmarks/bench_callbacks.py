@@ -0,0 +1,117 @@
+"""
+Callback dispatch: chain of `F.data.startswith(...)` handlers versus the code table router.
+
+Both dispatchers get the same six wizard steps and no-op handlers, so the numbers only
+cover aiogram's filter resolution plus parsing the callback data.
+
+Usage: python -m benchmarks.bench_callbacks [--rounds 20000]
+"""
+
+import argparse
+import asyncio
+import time
+
+from aiogram import Bot, Dispatcher, F
+from aiogram.fsm.context import FSMContext
+from aiogram.types import CallbackQuery, Update
+
+from benchmarks.stubs import SRC_DIR  # noqa: F401 - puts src/ on sys.path
+from callbacks import (
+    CallbackPayload,
+    CallbackRouter,
+    CategoryDetail,
+    ChooseCity,
+    ChooseCurrency,
+    ChoosePriceFrom,
+    ChoosePriceTo,
+    RealEstateMenu,
+)
+
+LEGACY_DATA = [
+    "category_real_estate",
+    "category_detail:1758:Купити квартиру",
+    "choose_city:268:Київ:25",
+    "currency:USD",
+    "price_from:30000",
+    "price_to:100000",
+]
+COMPACT_DATA = [
+    RealEstateMenu(),
+    CategoryDetail(1758),
+    ChooseCity(268, 25),
+    ChooseCurrency(0),
+    ChoosePriceFrom(3),
+    ChoosePriceTo(5),
+]
+
+
+def make_update(update_id: int, data: str) -> Update:
+    user = {"id": 42, "is_bot": False, "first_name": "Bench"}
+    return Update.model_validate(
+        {
+            "update_id": update_id,
+            "callback_query": {"id": str(update_id), "from": user, "chat_instance": "1", "data": data},
+        }
+    )
+
+
+def legacy_dispatcher() -> Dispatcher:
+    dp = Dispatcher()
+
+    async def noop(callback: CallbackQuery, state: FSMContext) -> None:
+        parts = (callback.data or "").split(":")
+        assert parts
+
+    dp.callback_query.register(noop, F.data == "category_real_estate")
+    for prefix in ("category_detail:", "choose_city:", "currency:", "price_from:", "price_to:"):
+        dp.callback_query.register(noop, F.data.startswith(prefix))
+    return dp
+
+
+def table_dispatcher() -> Dispatcher:
+    dp = Dispatcher()
+    router = CallbackRouter()
+
+    async def noop(callback: CallbackQuery, state: FSMContext, payload: CallbackPayload) -> None:
+        assert payload is not None
+
+    for payload in COMPACT_DATA:
+        router.route(type(payload))(noop)
+
+    @dp.callback_query()
+    async def entry(callback: CallbackQuery, state: FSMContext) -> None:
+        assert await router.dispatch(callback, state)
+
+    return dp
+
+
+async def measure(dp: Dispatcher, bot: Bot, data: list[str], rounds: int) -> list[float]:
+    per_step = []
+    for step, value in enumerate(data):
+        updates = [make_update(i, value) for i in range(rounds)]
+        started = time.perf_counter()
+        for update in updates:
+            await dp.feed_update(bot, update)
+        per_step.append((time.perf_counter() - started) / rounds * 1e6)
+    return per_step
+
+
+async def main(rounds: int) -> None:
+    bot = Bot(token="1:bench")
+    compact = [payload.pack() for payload in COMPACT_DATA]
+    legacy = await measure(legacy_dispatcher(), bot, LEGACY_DATA, rounds)
+    table = await measure(table_dispatcher(), bot, compact, rounds)
+    await bot.session.close()
+
+    print(f"{'step':<24}{'legacy bytes':>14}{'compact bytes':>15}{'legacy us':>12}{'table us':>12}")
+    for old, new, old_us, new_us in zip(LEGACY_DATA, compact, legacy, table):
+        name = old.split(":", 1)[0]
+        print(f"{name:<24}{len(old.encode()):>14}{len(new.encode()):>15}{old_us:>12.1f}{new_us:>12.1f}")
+    print(f"{'mean':<24}{'':>29}{sum(legacy) / len(legacy):>12.1f}{sum(table) / len(table):>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(main(args.rounds))
@@ -0,0 +1,205 @@
+"""
+Outbound Telegram calls for one hot filter (every subscriber on the same city/category)
+with instant delivery versus hourly and daily digests.
+
+The real poller polls a scripted OLX feed for `--cycles` cycles with `--per-cycle` new offers
+each, instant subscribers get them through the notifier, digest subscribers through the
+`digestoffer` buffer (SQLite) and `DigestScheduler`, run as if its windows had closed.
+Telegram is a local stub server without flood limits.
+
+Usage: python -m benchmarks.bench_digest [--users 200] [--cycles 12] [--per-cycle 8]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any
+
+from benchmarks.stubs import FakeTelegram, make_bot, make_nbu_app, make_telegram_app, start_app
+
+KYIV, KYIV_REGION, APARTMENTS = 268, 25, 1758
+MODES = ("instant", "batched", "daily")
+
+
+class ScriptedFeed:
+    """
+    Stands in for `OlxClient.get_offers`: newest-first pages of a growing listing.
+    """
+
+    def __init__(self, first_id: int) -> None:
+        self.offers: list[Any] = []
+        self._next_id = first_id
+        self._last = datetime.now(timezone.utc)
+
+    def publish(self, count: int) -> None:
+        from offers import Offer
+
+        # Strictly newer than everything published before, like real listing updates
+        now = max(datetime.now(timezone.utc), self._last + timedelta(milliseconds=1))
+        for _ in range(count):
+            self._next_id += 1
+            offer = Offer(
+                id=self._next_id,
+                url=f"https://www.olx.ua/d/uk/obyavlenie/kvartira-{self._next_id}.html",
+                title=f"Продам квартиру #{self._next_id}",
+                refreshed_at=now,
+                price_value=60_000,
+                price_currency="USD",
+                price_label="60 000 $",
+            )
+            self.offers.insert(0, offer)
+            self._last = now
+            now += timedelta(milliseconds=1)
+
+    async def get_offers(self, params: dict[str, Any], offset: int = 0, limit: int = 40) -> list[Any]:
+        return self.offers[offset : offset + limit]
+
+    async def get_changed_offers(self, params: dict[str, Any], offset: int = 0, limit: int = 40) -> Any:
+        from olx_api import OffersPage
+
+        return OffersPage(f"{offset}", self.offers[offset : offset + limit])
+
+    async def save_pages(self, pages: list[Any]) -> None:
+        pass
+
+
+async def run_mode(mode: str, args: argparse.Namespace, tg_url: str, workdir: Path) -> dict[str, Any]:
+    import db
+    from constants import DELIVERY_OPTIONS
+    from digest import DigestScheduler
+    from models import DeliveryModeEnum
+    from notifier import Notifier
+    from poller import ListingPoller
+    from price_history import PriceHistory
+    from seen_store import SeenStore
+
+    _, _, interval = next(option for option in DELIVERY_OPTIONS if option[1] == mode)
+    for user in range(args.users):
+        await db.set_delivery_mode(30_000_000 + user, args.filter_id, DeliveryModeEnum(mode), interval)
+
+    fake = FakeTelegram(global_limit=10**9, chat_limit=10**9)
+    runner, base_url = await start_app(make_telegram_app(fake))
+    bot = make_bot(base_url)
+    notifier = Notifier(bot, global_rate=10**6, global_burst=10**6, chat_rate=10**6, chat_burst=10**6)
+    # Fresh ad ids per mode, digest buffers skip offers a subscription already had
+    feed = ScriptedFeed(first_id=10**9 * (MODES.index(mode) + 1))
+
+    async def deliver(chat_id: int, offers: list[Any]) -> None:
+        notifier.enqueue_offers(chat_id, offers)
+
+    async def save_watermarks(filter_ids: set[int], watermark: Any) -> None:
+        pass
+
+    poller = ListingPoller(
+        deliver=deliver,
+        client=feed,  # type: ignore[arg-type]
+        seen_store=SeenStore(path=None),
+        save_watermarks=save_watermarks,
+        history=PriceHistory(workdir / f"prices-{mode}"),
+    )
+    notifier.start()
+    feed.publish(40)
+    await poller.run_cycle()  # primes the seen set
+    started = time.perf_counter()
+    for _ in range(args.cycles):
+        feed.publish(args.per_cycle)
+        await poller.run_cycle()
+    while notifier.queue_depth():
+        await asyncio.sleep(0.01)
+
+    # A scheduler started after the poll cycles, e.g. after a restart, once every window is over
+    taken: list[Any] = []
+
+    async def take(now: datetime, limit: int) -> list[Any]:
+        due = await db.take_due_digests(now, limit)
+        taken.extend(due)
+        return due
+
+    scheduler = DigestScheduler(
+        send=lambda chat_id, text, markup: notifier.enqueue_text(chat_id, text, reply_markup=markup),
+        take=take,
+        clock=lambda: datetime.now(timezone.utc) + timedelta(days=2),
+    )
+    await scheduler.run_once()
+    while notifier.queue_depth():
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    await notifier.stop()
+    await bot.session.close()
+    await runner.cleanup()
+
+    pages_ok = True
+    if taken:
+        digest, offers = await db.get_digest_page(taken[0].digest_id, 1, scheduler.page_size)
+        expected = min(scheduler.page_size, max(0, taken[0].offer_count - scheduler.page_size))
+        pages_ok = digest is not None and len(offers) == expected
+    return {
+        "calls": fake.calls["sendMessage"] + fake.calls["sendMediaGroup"],
+        "digests": len(taken),
+        "offers_in_digests": sum(digest.offer_count for digest in taken),
+        "pages_ok": pages_ok,
+        "seconds": elapsed,
+    }
+
+
+async def main(args: argparse.Namespace) -> int:
+    nbu_runner, nbu_url = await start_app(make_nbu_app())
+    tg_runner, tg_url = await start_app(make_telegram_app(FakeTelegram()))
+    workdir = Path(tempfile.mkdtemp(prefix="olx-digest-"))
+    os.environ.update(
+        API_TOKEN="123456:BENCHMARK",
+        DATABASE_URL=f"sqlite+aiosqlite:///{workdir}/digest.sqlite3",
+        NBU_RATES_URL=f"{nbu_url}/rates",
+        SEEN_STORE_PATH=f"{workdir}/seen.bin",
+        PRICE_HISTORY_DIR=f"{workdir}/prices",
+    )
+    import db
+    from models import CurrencyEnum
+
+    logging.getLogger().setLevel(logging.WARNING)
+    await db.create_db_and_tables()
+    for user in range(args.users):
+        args.filter_id, _ = await db.add_user_search_filter(
+            telegram_id=30_000_000 + user,
+            filter_name="Купити квартиру / Київ",
+            category_id=APARTMENTS,
+            city_id=KYIV,
+            region_id=KYIV_REGION,
+            currency=CurrencyEnum.USD,
+            price_from=None,
+            price_to=None,
+        )
+
+    offers = args.cycles * args.per_cycle
+    print(f"{args.users} subscribers of one filter, {args.cycles} poll cycles x {args.per_cycle} new offers")
+    print(f"{'mode':<9}{'send calls':>11}{'per user':>10}{'digests':>9}{'offers':>9}{'seconds':>9}")
+    results = {}
+    for mode in MODES:
+        result = results[mode] = await run_mode(mode, args, tg_url, workdir)
+        print(
+            f"{mode:<9}{result['calls']:>11}{result['calls'] / args.users:>10.1f}{result['digests']:>9}"
+            f"{result['offers_in_digests']:>9}{result['seconds']:>9.2f}"
+        )
+    await db.close_db()
+    await tg_runner.cleanup()
+    await nbu_runner.cleanup()
+
+    ok = all(results[mode]["offers_in_digests"] == offers * args.users for mode in MODES[1:])
+    ok = ok and all(results[mode]["pages_ok"] and results[mode]["calls"] == args.users for mode in MODES[1:])
+    print(f"instant / digest send calls: {results['instant']['calls'] / max(1, results['batched']['calls']):.1f}x")
+    print("ok" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--cycles", type=int, default=12, help="poll cycles in one digest window")
+    parser.add_argument("--per-cycle", type=int, default=8)
+    sys.exit(asyncio.run(main(parser.parse_args())))
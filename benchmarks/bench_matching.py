@@ -0,0 +1,91 @@
+"""
+Offer-to-filter matching: naive offers x filters loop versus the interval sweep.
+
+Usage: python -m benchmarks.bench_matching [--filters 100000] [--offers 10000] [--buckets 20]
+"""
+
+import argparse
+import random
+import time
+
+from benchmarks.stubs import SRC_DIR  # noqa: F401 - puts src/ on sys.path
+from currency_rates import RateCache
+from matching import FilterMatcher, MatchFilter, offer_price_uah
+from offers import Offer
+
+CURRENCIES = ["USD", "UAH", "EUR"]
+
+
+def make_filter(filter_id: int) -> MatchFilter:
+    currency = random.choice(CURRENCIES)
+    scale = 40 if currency == "UAH" else 1
+    price_from = random.choice([None, 10_000, 20_000, 30_000, 50_000, 100_000])
+    price_to = random.choice([None, 30_000, 50_000, 60_000, 70_000, 100_000, 1_000_000])
+    return MatchFilter(
+        filter_id=filter_id,
+        currency=currency,
+        price_from=price_from * scale if price_from else None,
+        price_to=price_to * scale if price_to else None,
+    )
+
+
+def make_offer(ad_id: int) -> Offer:
+    currency = random.choice(CURRENCIES)
+    value = random.randint(5_000, 300_000) * (40 if currency == "UAH" else 1)
+    return Offer(id=ad_id, url="", title="", price_value=float(value), price_currency=currency)
+
+
+def naive(filters: list[MatchFilter], offers: list[Offer], rates: RateCache) -> int:
+    bounds = [
+        (
+            rates.to_uah(f.price_from, f.currency) if f.price_from is not None else None,
+            rates.to_uah(f.price_to, f.currency) if f.price_to is not None else None,
+            f.unbounded,
+        )
+        for f in filters
+    ]
+    matches = 0
+    for offer in offers:
+        price = offer_price_uah(offer, rates)
+        for low, high, unbounded in bounds:
+            if price is None:
+                matches += unbounded
+            elif (low is None or price >= low) and (high is None or price <= high):
+                matches += 1
+    return matches
+
+
+def main(filters: int, offers: int, buckets: int) -> None:
+    rates = RateCache()
+    by_bucket = {b: [make_filter(b * filters + i) for i in range(filters // buckets)] for b in range(buckets)}
+    offer_batches = {b: [make_offer(b * offers + i) for i in range(offers // buckets)] for b in range(buckets)}
+
+    matcher = FilterMatcher(rates)
+    started = time.perf_counter()
+    for b, bucket_filters in by_bucket.items():
+        matcher.index(b, bucket_filters)
+    index_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    results = {b: matcher.match(b, offer_batches[b]) for b in by_bucket}
+    sweep_seconds = time.perf_counter() - started
+    swept = sum(len(matched) for result in results.values() for matched in result.values())
+
+    started = time.perf_counter()
+    looped = sum(naive(by_bucket[b], offer_batches[b], rates) for b in by_bucket)
+    naive_seconds = time.perf_counter() - started
+
+    assert swept == looped, (swept, looped)
+    print(f"{filters:,} filters x {offers:,} offers in {buckets} city/category buckets, {swept:,} matches")
+    print(f"index build  {index_seconds * 1000:9.1f}ms")
+    print(f"sweep match  {sweep_seconds * 1000:9.1f}ms")
+    print(f"naive loop   {naive_seconds * 1000:9.1f}ms  ({naive_seconds / sweep_seconds:.0f}x slower)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filters", type=int, default=100_000)
+    parser.add_argument("--offers", type=int, default=10_000)
+    parser.add_argument("--buckets", type=int, default=20)
+    args = parser.parse_args()
+    main(args.filters, args.offers, args.buckets)
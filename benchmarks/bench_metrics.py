@@ -0,0 +1,47 @@
+"""
+Per-call cost of the metrics hooks, disabled (the default) and enabled.
+
+Usage: python -m benchmarks.bench_metrics [--calls 1000000]
+"""
+
+import argparse
+import importlib
+import time
+
+from benchmarks.stubs import SRC_DIR  # noqa: F401 - puts src/ on sys.path
+from metrics import Histogram, timed
+
+
+def per_call_ns(calls: int) -> float:
+    histogram = Histogram("bench_seconds", "Benchmark.", ("label",))
+    labels = ("value",)
+    started = time.perf_counter()
+    for _ in range(calls):
+        with timed(histogram, labels):
+            pass
+    return (time.perf_counter() - started) / calls * 1e9
+
+
+def empty_loop_ns(calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        pass
+    return (time.perf_counter() - started) / calls * 1e9
+
+
+def main(calls: int) -> None:
+    metrics = importlib.import_module("metrics")
+    baseline = empty_loop_ns(calls)
+    metrics.METRICS_ENABLED = False
+    disabled = per_call_ns(calls) - baseline
+    metrics.METRICS_ENABLED = True
+    enabled = per_call_ns(calls) - baseline
+    print(f"timed() disabled: {disabled:6.0f} ns/call")
+    print(f"timed() enabled:  {enabled:6.0f} ns/call")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=1_000_000)
+    args = parser.parse_args()
+    main(args.calls)
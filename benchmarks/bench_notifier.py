@@ -0,0 +1,59 @@
+"""
+Drive the notification queue against a fake Telegram server that enforces flood limits.
+
+Reports drain time, 429s, merged messages and enqueue-to-send latency.
+
+Usage: python -m benchmarks.bench_notifier [--chats 100] [--ads 10]
+"""
+
+import argparse
+import asyncio
+import time
+
+from benchmarks.stubs import FakeTelegram, make_bot, make_telegram_app, start_app
+from notifier import Notifier
+from offers import Offer
+
+
+def _offer(ad_id: int) -> Offer:
+    return Offer(
+        id=ad_id,
+        title=f"Квартира #{ad_id}",
+        url=f"https://www.olx.ua/d/uk/obyavlenie/{ad_id}.html",
+        price_label="50 000 $",
+    )
+
+
+async def main(chats: int, ads: int) -> None:
+    fake = FakeTelegram()
+    runner, base_url = await start_app(make_telegram_app(fake))
+    bot = make_bot(base_url)
+    notifier = Notifier(bot)
+    try:
+        notifier.start()
+        started = time.perf_counter()
+        for chat_id in range(1, chats + 1):
+            notifier.enqueue_offers(chat_id, [_offer(chat_id * 1000 + i) for i in range(ads)])
+        while notifier.queue_depth():
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - started
+        await notifier.stop()
+    finally:
+        await bot.session.close()
+        await runner.cleanup()
+
+    stats = notifier.stats()
+    print(f"{chats * ads} ads to {chats} chats drained in {elapsed:.2f}s")
+    print(f"telegram calls: {dict(fake.calls)}, 429s: {fake.throttled}")
+    print(
+        f"sent={stats['sent']} merged={stats['merged']} retries={stats['retries']} "
+        f"latency p50={stats['latency_p50']:.3f}s p99={stats['latency_p99']:.3f}s"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--ads", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.chats, args.ads))
@@ -0,0 +1,228 @@
+"""
+Peak RSS of reading OLX offer pages: whole-body `json.loads` keeping the raw offer dicts
+(as the poller did before) versus stream-parsing into `offers.Offer` records.
+
+Pages are synthetic but shaped like real search answers (params, photos, location, user,
+promotion, a page metadata blob). Each mode runs in a fresh process that reads the pages
+from a file chunk by chunk and keeps every offer, like a poll cycle does until fan-out.
+
+Usage: python -m benchmarks.bench_offer_memory [--offers 10000] [--chunk 65536]
+"""
+
+import argparse
+import json
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+from benchmarks.stubs import SRC_DIR  # noqa: F401 - puts src/ on sys.path
+from olx_api import OFFERS_PAGE_SIZE
+
+MODES = ("loads", "stream")
+
+
+def make_offer(ad_id: int, rng: random.Random) -> dict[str, Any]:
+    created = f"2025-10-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:15:00+03:00"
+    value = rng.randint(10_000, 300_000)
+    params = [
+        {
+            "key": "price",
+            "name": "Ціна",
+            "type": "price",
+            "value": {
+                "value": value,
+                "type": "arranged",
+                "arranged": False,
+                "budget": False,
+                "currency": "USD",
+                "negotiable": rng.random() < 0.5,
+                "converted_value": value * 41,
+                "previous_value": None,
+                "converted_previous_value": None,
+                "converted_currency": "UAH",
+                "label": f"{value:,} $",
+            },
+        },
+    ] + [
+        {
+            "key": f"param_{i}",
+            "name": f"Параметр {i}",
+            "type": "select",
+            "value": {"key": f"v{i}", "label": f"Значення {i}"},
+        }
+        for i in range(10)
+    ]
+    photos = [
+        {
+            "id": ad_id * 10 + i,
+            "filename": f"{ad_id}-{i}.jpg",
+            "rotation": 0,
+            "width": 1200,
+            "height": 900,
+            "link": f"https://ireland.apollo.olx.ua/v1/files/{ad_id}-{i}/image;s={{width}}x{{height}}",
+        }
+        for i in range(rng.randint(4, 12))
+    ]
+    return {
+        "id": ad_id,
+        "url": f"https://www.olx.ua/d/uk/obyavlenie/kvartira-{ad_id}.html",
+        "title": f"Продам 2-кімнатну квартиру, {rng.randint(40, 90)} м², ремонт",
+        "last_refresh_time": created,
+        "created_time": created,
+        "valid_to_time": "2025-12-01T00:00:00+02:00",
+        "pushup_time": None,
+        "description": "Опис оголошення. " * rng.randint(40, 120),
+        "promotion": {
+            "highlighted": False,
+            "urgent": False,
+            "top_ad": rng.random() < 0.05,
+            "options": [],
+            "b2c_ad_page": False,
+            "premium_ad_page": False,
+        },
+        "params": params,
+        "key_params": [],
+        "business": rng.random() < 0.3,
+        "user": {
+            "id": rng.randint(1, 10**6),
+            "created": "2019-01-01T00:00:00+02:00",
+            "other_ads_enabled": True,
+            "name": "Продавець",
+            "logo": None,
+            "logo_ad_page": None,
+            "social_network_account_type": None,
+            "photo": None,
+            "banner_mobile": "",
+            "banner_desktop": "",
+            "company_name": "",
+            "about": "",
+            "b2c_business_page": False,
+            "is_online": False,
+            "last_seen": created,
+            "seller_type": None,
+            "uuid": f"{ad_id:032x}",
+        },
+        "status": "active",
+        "contact": {"name": "Продавець", "phone": True, "chat": True, "negotiation": True, "courier": False},
+        "map": {
+            "zoom": 13,
+            "lat": 50.45 + rng.random() / 10,
+            "lon": 30.52 + rng.random() / 10,
+            "radius": 2,
+            "show_detailed": False,
+        },
+        "location": {
+            "city": {"id": 268, "name": "Київ", "normalized_name": "kiev"},
+            "district": {"id": 9, "name": "Печерський"},
+            "region": {"id": 25, "name": "Київська область", "normalized_name": "ko"},
+        },
+        "photos": photos,
+        "partner": None,
+        "category": {"id": 1147, "type": "real_estate"},
+        "delivery": {"rock": {"offer_id": None, "active": False, "mode": "NotEligible"}},
+        "safedeal": {
+            "weight": 0,
+            "weight_grams": 0,
+            "status": "unactive",
+            "safedeal_blocked": False,
+            "allowed_quantity": [],
+        },
+        "shop": {"subdomain": None},
+        "offer_type": "offer",
+    }
+
+
+def make_page(offers: list[dict[str, Any]], rng: random.Random) -> bytes:
+    metadata = {
+        "total_elements": 1000,
+        "visible_total_count": 1000,
+        "promoted": [rng.randint(0, 39) for _ in range(5)],
+        "search_id": f"{rng.getrandbits(128):032x}",
+        "adverts": {
+            "places": [],
+            "config": {"targeting": {f"key_{i}": [f"value_{j}" for j in range(20)] for i in range(40)}},
+        },
+        "source": {"promoted": list(range(5)), "organic": list(range(40))},
+    }
+    links = {
+        "self": {"href": "https://www.olx.ua/api/v1/offers/?offset=0&limit=40"},
+        "next": {"href": "https://www.olx.ua/api/v1/offers/?offset=40&limit=40"},
+    }
+    return json.dumps({"data": offers, "metadata": metadata, "links": links}, ensure_ascii=False).encode()
+
+
+def rss_kb() -> tuple[int, int]:
+    """
+    (current, peak) resident set size in KiB.
+    """
+    current = int(Path("/proc/self/statm").read_text().split()[1]) * resource.getpagesize() // 1024
+    return current, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_mode(mode: str, path: Path, chunk: int) -> dict[str, float]:
+    from offers import Offer, OfferStreamParser
+
+    before, _ = rss_kb()
+    kept: list[Any] = []
+    started = time.perf_counter()
+    with path.open("rb") as pages:
+        for line in pages:
+            body = memoryview(line.rstrip(b"\n"))
+            if mode == "loads":
+                kept.extend(json.loads(bytes(body))["data"])
+                continue
+            parser = OfferStreamParser()
+            for start in range(0, len(body), chunk):
+                kept.extend(parser.feed(bytes(body[start : start + chunk])))
+            parser.close()
+    elapsed = time.perf_counter() - started
+    current, peak = rss_kb()
+    assert mode == "loads" or all(isinstance(offer, Offer) for offer in kept)
+    return {
+        "offers": len(kept),
+        "peak_kb": peak - before,
+        "retained_kb": current - before,
+        "seconds": elapsed,
+    }
+
+
+def main(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    path = Path(tempfile.mkdtemp(prefix="olx-offers-")) / "pages.jsonl"
+    with path.open("wb") as pages:
+        for first in range(0, args.offers, OFFERS_PAGE_SIZE):
+            offers = [make_offer(ad_id, rng) for ad_id in range(first, min(first + OFFERS_PAGE_SIZE, args.offers))]
+            pages.write(make_page(offers, rng) + b"\n")
+    page_kb = path.stat().st_size / 1024 / -(-args.offers // OFFERS_PAGE_SIZE)
+    print(f"{args.offers:,} offers in pages of {OFFERS_PAGE_SIZE} ({page_kb:.0f} KiB per page), chunk {args.chunk} B")
+    print(f"{'mode':<8}{'peak RSS/1k offers':>20}{'retained/1k offers':>20}{'offers/s':>12}")
+    for mode in MODES:
+        command = [sys.executable, "-m", "benchmarks.bench_offer_memory", "--run", mode, "--pages", str(path)]
+        output = subprocess.run(command + ["--chunk", str(args.chunk)], check=True, capture_output=True, text=True)
+        result = json.loads(output.stdout)
+        per_k = 1000 / result["offers"]
+        print(
+            f"{mode:<8}{result['peak_kb'] * per_k / 1024:>17.2f} MiB{result['retained_kb'] * per_k / 1024:>16.2f} MiB"
+            f"{result['offers'] / result['seconds']:>12,.0f}"
+        )
+    path.unlink()
+    path.parent.rmdir()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--offers", type=int, default=10_000)
+    parser.add_argument("--chunk", type=int, default=65536, help="bytes per body chunk fed to the stream parser")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--run", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--pages", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        print(json.dumps(run_mode(args.run, args.pages, args.chunk)))
+    else:
+        main(args)
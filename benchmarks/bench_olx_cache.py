@@ -0,0 +1,149 @@
+"""
+OLX traffic and parsing of unchanged offer pages, without the response cache, with body hashing
+only (OLX sends no validators) and with ETag conditional requests.
+
+The real `ListingPoller` and `OlxClient` poll `--queries` searches on the stub OLX server for
+`--cycles` cycles; between cycles only `--changing` of them get new ads. A last cycle with no new
+ads runs after a restart, i.e. with a fresh client reading the cache back from disk.
+Every mode has to find exactly the published ads.
+
+Usage: python -m benchmarks.bench_olx_cache [--queries 200] [--cycles 10] [--changing 0.1]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+from benchmarks.stubs import OfferFeed, make_nbu_app, make_olx_app, start_app
+
+MODES = ("off", "hash", "etag")
+
+
+async def run_mode(mode: str, args: argparse.Namespace, workdir: Path) -> dict[str, Any]:
+    from olx_api import OlxClient
+    from poller import ListingPoller, QueryGroup, SearchQuery
+    from price_history import PriceHistory
+    from response_cache import ResponseCache
+    from seen_store import SeenStore
+
+    feed = OfferFeed(etag=mode == "etag")
+    runner, base_url = await start_app(make_olx_app(feed))
+    cache_dir = workdir / f"cache-{mode}"
+
+    def make_client() -> OlxClient:
+        cache = None
+        if mode != "off":
+            cache = ResponseCache(cache_dir, memory_bytes=args.memory_bytes, disk_bytes=args.disk_bytes)
+        return OlxClient(base_url, cache=cache)
+
+    async def deliver(chat_id: int, offers: list[Any]) -> None:
+        pass
+
+    async def save_watermarks(filter_ids: set[int], watermark: Any) -> None:
+        pass
+
+    client = make_client()
+    poller = ListingPoller(
+        deliver=deliver,
+        client=client,
+        seen_store=SeenStore(path=None),
+        save_watermarks=save_watermarks,
+        history=PriceHistory(workdir / f"prices-{mode}"),
+    )
+    queries = [SearchQuery(category_id=1758, city_id=1000 + n, region_id=25) for n in range(args.queries)]
+    rng = random.Random(args.seed)
+    found: list[int] = []
+
+    async def cycle() -> float:
+        started = time.perf_counter()
+        for query in queries:
+            offers = await poller.poll_query(query, QueryGroup())
+            found.extend(offer.id for offer in offers)
+        return time.perf_counter() - started
+
+    await cycle()  # primes the seen sets and watermarks
+    primed_bytes = feed.bytes_sent
+    published, seconds = 0, 0.0
+    for _ in range(args.cycles):
+        changing = rng.sample(queries, max(1, int(len(queries) * args.changing)))
+        published += feed.publish(args.per_cycle, [(str(q.category_id), str(q.city_id)) for q in changing])
+        seconds += await cycle()
+    stats = client.stats()
+    await client.close()
+
+    # Restart: a new client (and cache index) on the same directory, nothing new upstream
+    poller._client = client = make_client()
+    await client.start()
+    restart_seconds = await cycle()
+    restart = client.stats()
+    await client.close()
+    await runner.cleanup()
+    return {
+        "published": published,
+        "found": sorted(found),
+        "kib": (feed.bytes_sent - primed_bytes) / 1024,
+        "requests": stats["requests"] + restart["requests"],
+        "not_modified": feed.not_modified,
+        "parses_skipped": stats["parses_skipped"],
+        "restart_skipped": restart["parses_skipped"],
+        "seconds": seconds,
+        "restart_seconds": restart_seconds,
+        "cache_disk_kib": restart.get("cache_disk_bytes", 0) / 1024,
+    }
+
+
+async def main(args: argparse.Namespace) -> int:
+    nbu_runner, nbu_url = await start_app(make_nbu_app())
+    workdir = Path(tempfile.mkdtemp(prefix="olx-cache-"))
+    os.environ.update(NBU_RATES_URL=f"{nbu_url}/rates", PRICE_HISTORY_DIR=f"{workdir}/prices")
+    logging.getLogger().setLevel(logging.WARNING)
+
+    print(
+        f"{args.queries} queries, {args.cycles} cycles with {args.changing:.0%} of them getting {args.per_cycle} "
+        f"new ads, then a restart; memory tier {args.memory_bytes >> 10} KiB"
+    )
+    print(
+        f"{'mode':<6}{'KiB in':>9}{'requests':>10}{'304s':>7}{'parses skipped':>16}{'cycle ms':>10}"
+        f"{'after restart':>15}{'disk KiB':>10}"
+    )
+    results = {}
+    for mode in MODES:
+        result = results[mode] = await run_mode(mode, args, workdir)
+        print(
+            f"{mode:<6}{result['kib']:>9.0f}{result['requests']:>10}{result['not_modified']:>7}"
+            f"{result['parses_skipped']:>16}{result['seconds'] / args.cycles * 1000:>10.1f}"
+            f"{result['restart_skipped']:>9} skip{result['cache_disk_kib']:>10.0f}"
+        )
+    await nbu_runner.cleanup()
+
+    expected = results["off"]["published"]
+    ok = all(len(results[mode]["found"]) == expected for mode in MODES)
+    ok = ok and all(results[mode]["found"] == results["off"]["found"] for mode in MODES)
+    ok = ok and all(results[mode]["restart_skipped"] == args.queries for mode in MODES[1:])
+    ok = ok and results["etag"]["kib"] < results["off"]["kib"]
+    print(f"all modes found the {expected} published ads: {ok}")
+    print(
+        f"etag: {results['off']['kib'] / max(1.0, results['etag']['kib']):.1f}x fewer bytes, "
+        f"cycle {results['off']['seconds'] / results['etag']['seconds']:.1f}x faster than no cache"
+    )
+    print("ok" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--cycles", type=int, default=10)
+    parser.add_argument("--changing", type=float, default=0.1, help="share of queries with new ads per cycle")
+    parser.add_argument("--per-cycle", type=int, default=3, help="new ads per changing query")
+    parser.add_argument("--memory-bytes", type=int, default=1 << 20, help="small, so the disk tier is used")
+    parser.add_argument("--disk-bytes", type=int, default=64 << 20)
+    parser.add_argument("--seed", type=int, default=1)
+    sys.exit(asyncio.run(main(parser.parse_args())))
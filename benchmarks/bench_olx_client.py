@@ -0,0 +1,67 @@
+"""
+Per-request latency of OLX city lookups: a fresh httpx client per call (old behaviour)
+versus the shared, pooled `OlxClient`.
+
+Usage: python -m benchmarks.bench_olx_client [--requests 500]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from benchmarks.stubs import make_olx_app, start_app
+from olx_api import DEFAULT_HEADERS, LOCATION_AUTOCOMPLETE_PATH, OlxClient
+
+
+def _report(name: str, samples: list[float]) -> None:
+    samples = sorted(samples)
+    p50 = samples[len(samples) // 2] * 1000
+    p99 = samples[int(len(samples) * 0.99) - 1] * 1000
+    print(f"{name:<22} mean={statistics.mean(samples) * 1000:7.3f}ms p50={p50:7.3f}ms p99={p99:7.3f}ms")
+
+
+async def _client_per_call(base_url: str, requests: int) -> list[float]:
+    samples = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        async with httpx.AsyncClient() as client:
+            response = await client.get(
+                f"{base_url}{LOCATION_AUTOCOMPLETE_PATH}", params={"query": "Київ"}, headers=DEFAULT_HEADERS
+            )
+            response.raise_for_status()
+        response.json()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def _shared_client(base_url: str, requests: int) -> list[float]:
+    client = OlxClient(base_url=base_url)
+    await client.start()
+    samples = []
+    try:
+        for _ in range(requests):
+            started = time.perf_counter()
+            await client.get_city_info("Київ")
+            samples.append(time.perf_counter() - started)
+    finally:
+        await client.close()
+    return samples
+
+
+async def main(requests: int) -> None:
+    runner, base_url = await start_app(make_olx_app())
+    try:
+        _report("client per call", await _client_per_call(base_url, requests))
+        _report("shared OlxClient", await _shared_client(base_url, requests))
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests))
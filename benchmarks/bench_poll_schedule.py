@@ -0,0 +1,130 @@
+"""
+Notification delay of fixed versus adaptive poll scheduling at the same request budget.
+
+Simulated time, no network: `--queries` distinct city/category queries with Poisson ad arrivals
+whose rates follow a heavy-tailed (Pareto) distribution, i.e. a few hot big-city queries and a long
+tail of quiet ones. Every poll picks up the ads that appeared since the previous one; the delay of
+an ad is the time from its arrival to that poll. Fixed scheduling polls each query every
+`--interval` seconds (`PollScheduler` with min = max interval), adaptive scheduling lets
+`PollScheduler` pick each query's interval within `--min-interval`..`--max-interval`.
+
+Usage: python -m benchmarks.bench_poll_schedule [--queries 2000] [--hours 48] [--interval 300]
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+
+from benchmarks.report import percentile
+from benchmarks.stubs import SRC_DIR  # noqa: F401 - puts src/ on sys.path
+from poll_schedule import PollScheduler
+
+
+def arrivals(rng: random.Random, rates: list[float], seconds: float) -> list[list[float]]:
+    """
+    Ad arrival times per query, each list ascending.
+    """
+    result = []
+    for rate in rates:
+        times, now = [], rng.expovariate(rate)
+        while now < seconds:
+            times.append(now)
+            now += rng.expovariate(rate)
+        result.append(times)
+    return result
+
+
+def simulate(
+    ads: list[list[float]], seconds: float, warmup: float, scheduler: PollScheduler, clock: list[float]
+) -> tuple[int, list[float], float]:
+    """
+    Poll whatever `scheduler` says is due until `seconds`. Returns the polls made and the delay of
+    each ad after `warmup`, plus the time spent in the scheduler.
+    """
+    polls = 0
+    delays: list[float] = []
+    cursor = [0] * len(ads)
+    scheduling = 0.0
+    scheduler.sync(str(query) for query in range(len(ads)))
+    while True:
+        now = scheduler.next_due()
+        if now is None or now > seconds:
+            break
+        clock[0] = now
+        started = time.perf_counter()
+        due = scheduler.pop_due()
+        scheduling += time.perf_counter() - started
+        for key in due:
+            query = int(key)
+            times, start = ads[query], cursor[query]
+            end = start
+            while end < len(times) and times[end] <= now:
+                end += 1
+            cursor[query] = end
+            if now >= warmup:
+                polls += 1
+                delays.extend(now - arrived for arrived in times[start:end] if arrived >= warmup)
+            started = time.perf_counter()
+            scheduler.observe(key, end - start)
+            scheduling += time.perf_counter() - started
+    return polls, delays, scheduling
+
+
+def main(args: argparse.Namespace) -> int:
+    rng = random.Random(args.seed)
+    seconds, warmup = args.hours * 3600.0, args.warmup * 3600.0
+    # Mean ads per hour per query ~ Pareto: most queries see a few ads a day, some dozens an hour
+    rates = [min(args.max_rate, args.min_rate * rng.paretovariate(args.pareto)) / 3600 for _ in range(args.queries)]
+    ads = arrivals(rng, rates, seconds)
+    total_ads = sum(len(times) for times in ads)
+    print(
+        f"{args.queries} queries, {total_ads:,} ads over {args.hours}h "
+        f"(median {statistics.median(rates) * 3600:.2f}/h, max {max(rates) * 3600:.1f}/h per query)"
+    )
+
+    results = {}
+    for name, min_interval, max_interval in (
+        ("fixed", args.interval, args.interval),
+        ("adaptive", args.min_interval, args.max_interval),
+    ):
+        clock = [0.0]
+        scheduler = PollScheduler(
+            args.interval, min_interval=min_interval, max_interval=max_interval, clock=lambda: clock[0]
+        )
+        polls, delays, scheduling = simulate(ads, seconds, warmup, scheduler, clock)
+        per_second = polls / (seconds - warmup)
+        results[name] = (per_second, statistics.fmean(delays))
+        print(
+            f"{name:<9} {per_second:.2f} polls/s  ad delay mean {statistics.fmean(delays):6.1f}s  "
+            f"p50 {percentile(delays, 0.5):6.1f}s  p95 {percentile(delays, 0.95):6.1f}s  "
+            f"max {max(delays):6.1f}s  ({scheduling / max(1, polls) * 1e6:.1f}us scheduling per poll)"
+        )
+    stats = scheduler.stats()
+    print(
+        f"adaptive intervals: expected delay {stats['expected_delay_avg']:.1f}s per ad, "
+        f"worst query {stats['expected_delay_max']:.0f}s"
+    )
+
+    fixed_rate, fixed_mean = results["fixed"]
+    adaptive_rate, adaptive_mean = results["adaptive"]
+    print(f"mean ad delay {fixed_mean / adaptive_mean:.2f}x lower at {adaptive_rate / fixed_rate:.2f}x the requests")
+    ok = adaptive_rate <= fixed_rate * 1.05 and adaptive_mean < fixed_mean
+    print("ok" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--hours", type=float, default=48)
+    parser.add_argument("--warmup", type=float, default=6, help="hours before delays are counted")
+    parser.add_argument("--interval", type=float, default=300)
+    parser.add_argument("--min-interval", type=float, default=60)
+    parser.add_argument("--max-interval", type=float, default=3600)
+    parser.add_argument("--min-rate", type=float, default=0.1, help="ads per hour of the quietest queries")
+    parser.add_argument("--max-rate", type=float, default=120, help="ads per hour cap for the hottest queries")
+    parser.add_argument("--pareto", type=float, default=1.1, help="shape of the per-query rate distribution")
+    parser.add_argument("--seed", type=int, default=1)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,131 @@
+"""
+Price history: recording throughput, archive size per row and /stats query latency from the
+histogram index, against computing the same quantiles by scanning the raw archive.
+
+Offers are synthetic: log-normal prices per city and category, arriving over `--days` days in
+poll-cycle sized batches (each one newer than the last), each batch followed by a flush.
+
+Usage: python -m benchmarks.bench_price_stats [--offers 1000000] [--cities 200] [--days 365]
+"""
+
+import argparse
+import math
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from benchmarks.report import percentile
+from benchmarks.stubs import SRC_DIR  # noqa: F401 - puts src/ on sys.path
+from constants import CATEGORY_NAMES
+from offers import Offer
+from price_history import DAY, PRICE_HISTORY_ACCURACY, PriceHistory, read_archive
+
+
+def main(args: argparse.Namespace) -> int:
+    rng = random.Random(args.seed)
+    directory = Path(tempfile.mkdtemp(prefix="olx-prices-"))
+    end = time.time()
+    clock = [end - args.days * DAY]
+    history = PriceHistory(directory, "bench", clock=lambda: clock[0])
+    history.open()
+    categories = list(CATEGORY_NAMES)
+    keys = [(city_id, category_id) for city_id in range(1, args.cities + 1) for category_id in categories]
+    medians = {key: rng.uniform(math.log(500_000), math.log(5_000_000)) for key in keys}
+
+    record_seconds = flush_seconds = 0.0
+    batches = -(-args.offers // args.batch)
+    span = args.days * DAY / batches
+    for batch in range(batches):
+        clock[0] += span
+        by_key: dict[tuple[int, int], list[Offer]] = {}
+        for ad_id in range(batch * args.batch, min((batch + 1) * args.batch, args.offers)):
+            key = rng.choice(keys)
+            currency = "USD" if rng.random() < 0.7 else "UAH"
+            price = math.exp(rng.gauss(medians[key], 0.5)) / (41.5 if currency == "USD" else 1)
+            refreshed_at = datetime.fromtimestamp(clock[0] - rng.uniform(0, span), timezone.utc)
+            offer = Offer(
+                id=10**9 + ad_id,
+                url="",
+                title="",
+                refreshed_at=refreshed_at,
+                price_value=round(price),
+                price_currency=currency,
+            )
+            by_key.setdefault(key, []).append(offer)
+        started = time.perf_counter()
+        for (city_id, category_id), offers in by_key.items():
+            history.record(city_id, 25, category_id, offers)
+        record_seconds += time.perf_counter() - started
+        started = time.perf_counter()
+        history.flush()
+        flush_seconds += time.perf_counter() - started
+
+    archive_bytes = history.archive_path.stat().st_size
+    index_bytes = (directory / "bench.idx").stat().st_size
+    print(
+        f"recorded {args.offers:,} offers in {batches} flushes: {args.offers / record_seconds:,.0f} offers/s, "
+        f"flush {flush_seconds / batches * 1000:.1f}ms avg"
+    )
+    print(
+        f"archive {archive_bytes / args.offers:.1f} B/offer ({archive_bytes / 1024 / 1024:.1f} MiB), "
+        f"index {index_bytes / 1024 / 1024:.1f} MiB for {len(keys)} city/category keys"
+    )
+
+    # Reopen so queries read the index through mmap only
+    history.close()
+    history = PriceHistory(directory, "bench", clock=lambda: end)
+    history.open()
+    for window in (7, 30, args.days):
+        latency = []
+        for _ in range(args.queries):
+            city_id, category_id = rng.choice(keys)
+            started = time.perf_counter()
+            history.quantiles(city_id, category_id, window)
+            latency.append(time.perf_counter() - started)
+        print(
+            f"/stats over {window:>3} days: p50={percentile(latency, 0.5) * 1000:.2f}ms "
+            f"p99={percentile(latency, 0.99) * 1000:.2f}ms"
+        )
+
+    # The same answer by scanning the raw archive, and how far the histogram quantiles are from it
+    key = keys[0]
+    cutoff = (int(end // DAY) - 30 + 1) * DAY
+    started = time.perf_counter()
+    prices = [
+        price
+        for frame in read_archive(history.archive_path)
+        for city_id, category_id, observed_at, price in zip(
+            frame["city_id"], frame["category_id"], frame["observed_at"], frame["price_uah"]
+        )
+        if (city_id, category_id) == key and observed_at >= cutoff
+    ]
+    exact = statistics.quantiles(prices, n=4, method="inclusive")
+    scan_ms = (time.perf_counter() - started) * 1000
+    stats = history.quantiles(*key, days=30)
+    assert stats is not None
+    errors = [abs(estimate - value) / value for estimate, value in zip(stats.quantiles, exact)]
+    print(
+        f"archive scan for one 30-day answer: {scan_ms:.0f}ms; {stats.count} offers (scan {len(prices)}), "
+        f"max quantile error {max(errors) * 100:.2f}% (bound {PRICE_HISTORY_ACCURACY * 100:.0f}%)"
+    )
+    ok = stats.count == len(prices) and max(errors) <= PRICE_HISTORY_ACCURACY * 1.5
+    history.close()
+    shutil.rmtree(directory)
+    print("ok" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--offers", type=int, default=1_000_000)
+    parser.add_argument("--cities", type=int, default=200)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--batch", type=int, default=20_000, help="offers per poll cycle (one flush each)")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,105 @@
+"""
+Memory and throughput of the seen-ads store versus naive per-query Python sets, and how long
+daily eviction holds the event loop while the Bloom filter is rebuilt in a thread.
+
+Usage: python -m benchmarks.bench_seen_store [--ids 10000000] [--keys 10000] [--evict-ids 2000000]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+import tracemalloc
+
+from benchmarks.stubs import SRC_DIR  # noqa: F401 - puts src/ on sys.path
+from seen_store import SeenStore
+
+BATCH = 40  # one OLX offers page
+
+
+def _naive_bytes(ids: int, keys: int) -> int:
+    tracemalloc.start()
+    sets: dict[str, set[int]] = {f"q{k}": set() for k in range(keys)}
+    per_key = ids // keys
+    for k in range(keys):
+        sets[f"q{k}"].update(random.randrange(10**8, 10**9) for _ in range(per_key))
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size
+
+
+def main(ids: int, keys: int, naive_sample: int) -> None:
+    per_key = ids // keys
+    store = SeenStore(path=None)
+    batches = [[random.randrange(10**8, 10**9) for _ in range(BATCH)] for _ in range(256)]
+
+    started = time.perf_counter()
+    for k in range(keys):
+        key = f"q{k}"
+        for i in range(0, per_key, BATCH):
+            store.filter_new(key, [ad_id + i for ad_id in batches[(k + i) % len(batches)]])
+    insert_seconds = time.perf_counter() - started
+    print(f"filter_new  {ids / insert_seconds:12,.0f} ids/s  ({len(store):,} stored in {keys:,} keys)")
+
+    probes = [random.randrange(10**8, 10**9) for _ in range(200_000)]
+    started = time.perf_counter()
+    for i, ad_id in enumerate(probes):
+        store.contains(f"q{i % keys}", ad_id)
+    lookup_seconds = time.perf_counter() - started
+    print(f"contains    {len(probes) / lookup_seconds:12,.0f} ids/s  (bloom negatives: {store.bloom_negatives:,})")
+
+    print(f"store       {store.nbytes() / 2**20:10.1f} MiB  ({store.nbytes() / max(len(store), 1):.1f} B/id)")
+    naive = _naive_bytes(naive_sample, max(1, keys * naive_sample // ids))
+    print(f"naive sets  {naive * ids / naive_sample / 2**20:10.1f} MiB  (extrapolated from {naive_sample:,} ids)")
+
+
+async def _eviction(ids: int, keys: int, days: int = 60) -> None:
+    now = 0.0
+    store = SeenStore(path=None, max_age=30 * 86400, segment_span=86400, clock=lambda: now)
+    per_day = ids // 30 // keys
+    for day in range(30):
+        now = day * 86400.0
+        for k in range(keys):
+            store.add(f"q{k}", (random.randrange(10**8, 10**9) for _ in range(per_day)))
+
+    stalls: list[float] = []
+
+    async def ticker() -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            stalls.append(time.perf_counter() - started - 0.001)
+
+    task = asyncio.create_task(ticker())
+    evict_seconds: list[float] = []
+    rebuild_stalls: list[float] = [0.0]
+    for day in range(30, days):
+        now = day * 86400.0
+        for k in range(keys):
+            store.add(f"q{k}", (random.randrange(10**8, 10**9) for _ in range(per_day)))
+        started = time.perf_counter()
+        store.evict()
+        evict_seconds.append(time.perf_counter() - started)
+        # Only count stalls while a rebuild runs, not the adds above
+        await asyncio.sleep(0.005)
+        stalls.clear()
+        while store._rebuild_task is not None:
+            await asyncio.sleep(0.01)
+        rebuild_stalls.extend(stalls)
+    task.cancel()
+    print(
+        f"evict       {max(evict_seconds) * 1000:10.1f} ms max on the loop over {days - 30} days of "
+        f"{len(store):,} ids, {store.bloom_rebuilds} Bloom rebuilds in a thread, "
+        f"loop stall max {max(rebuild_stalls) * 1000:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ids", type=int, default=10_000_000)
+    parser.add_argument("--keys", type=int, default=10_000)
+    parser.add_argument("--naive-sample", type=int, default=1_000_000)
+    parser.add_argument("--evict-ids", type=int, default=2_000_000)
+    args = parser.parse_args()
+    main(args.ids, args.keys, args.naive_sample)
+    asyncio.run(_eviction(args.evict_ids, min(args.keys, 1000)))
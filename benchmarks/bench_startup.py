@@ -0,0 +1,189 @@
+"""
+Cold start: import time of the entry modules (`python -X importtime`, each in a fresh interpreter)
+and the application factory, warm-up, first update and shutdown of one bot process.
+
+Also checks that importing has no side effects: `db` does not pull in aiogram, and importing the
+bot creates no files and no database connections until `BotApp.startup()`.
+
+Results go to `--output` (JSON, see benchmarks/report.py); `--baseline` compares with an older run.
+
+Usage: python -m benchmarks.bench_startup [--repeat 5] [--baseline benchmarks/results/startup.json]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+from benchmarks.report import compare, save_results
+from benchmarks.stubs import SRC_DIR, FakeTelegram, make_nbu_app, make_telegram_app, start_app
+
+MODULES = ("models", "db", "poller", "poller_worker", "webhook", "telegram_bot")
+
+
+def import_time(module: str, env: dict[str, str]) -> tuple[float, list[tuple[float, str]]]:
+    """
+    Cumulative import time of `module` in seconds, and the slowest top-level imports under it.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SRC_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total, top = 0.0, []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        seconds = int(cumulative) / 1e6
+        # Two spaces of indent mark a direct import of the module itself
+        if name.startswith("   ") and not name.startswith("    "):
+            top.append((seconds, name.strip()))
+        if name.strip() == module:
+            total = seconds
+    return total, sorted(top, reverse=True)[:5]
+
+
+def modules_loaded(code: str, env: dict[str, str]) -> dict[str, Any]:
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=SRC_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    return dict(json.loads(result.stdout.strip().splitlines()[-1]))
+
+
+async def startup() -> dict[str, float]:
+    """
+    Factory, warm-up, the first /start and shutdown of a bot against local stubs and SQLite.
+    """
+    nbu_runner, nbu_url = await start_app(make_nbu_app())
+    # No flood limits: /start answers with two messages in a row
+    tg_runner, tg_url = await start_app(make_telegram_app(FakeTelegram(global_limit=10**9, chat_limit=10**9)))
+    os.environ["NBU_RATES_URL"] = f"{nbu_url}/rates"
+
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.types import Update
+
+    import db
+    import telegram_bot
+
+    logging.getLogger().setLevel(logging.WARNING)
+    await db.create_db_and_tables()
+    await db.close_db()
+
+    started = time.perf_counter()
+    app = telegram_bot.create_bot_app()
+    factory = time.perf_counter() - started
+    app.bot.session.api = TelegramAPIServer.from_base(tg_url)
+
+    started = time.perf_counter()
+    await app.startup(run_background_jobs=False)
+    warm_up = time.perf_counter() - started
+
+    update = {
+        "update_id": 1,
+        "message": {
+            "message_id": 1,
+            "date": int(time.time()),
+            "chat": {"id": 42, "type": "private"},
+            "from": {"id": 42, "is_bot": False, "first_name": "Bench", "username": "bench"},
+            "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        },
+    }
+    started = time.perf_counter()
+    await app.dp.feed_update(app.bot, Update.model_validate(update))
+    first_update = time.perf_counter() - started
+
+    started = time.perf_counter()
+    await app.shutdown()
+    shutdown = time.perf_counter() - started
+    await app.bot.session.close()
+    for runner in (tg_runner, nbu_runner):
+        await runner.cleanup()
+    return {
+        "factory_ms": factory * 1000,
+        "warm_up_ms": warm_up * 1000,
+        "first_update_ms": first_update * 1000,
+        "shutdown_ms": shutdown * 1000,
+    }
+
+
+def main(args: argparse.Namespace) -> int:
+    workdir = Path(tempfile.mkdtemp(prefix="olx-startup-"))
+    data_dir = workdir / "data"
+    env = {
+        **os.environ,
+        "API_TOKEN": "123456:BENCHMARK",
+        "DATABASE_URL": f"sqlite+aiosqlite:///{data_dir}/bot.sqlite3",
+        "FSM_SQLITE_PATH": f"{data_dir}/fsm.sqlite3",
+        "GAZETTEER_PATH": f"{data_dir}/gazetteer.bin",
+        "SEEN_STORE_PATH": f"{data_dir}/seen.bin",
+        "PRICE_HISTORY_DIR": f"{data_dir}/prices",
+        "UPDATE_DEDUP_PATH": f"{data_dir}/updates.sqlite3",
+        "PYTHONDONTWRITEBYTECODE": "1",
+    }
+    # Warm the OS file cache and bytecode so every measured run is comparable
+    import_time("telegram_bot", {**env, "PYTHONDONTWRITEBYTECODE": ""})
+
+    metrics: dict[str, float] = {}
+    print(f"{'module':<15}{'import ms':>10}   slowest direct imports")
+    for module in MODULES:
+        runs = [import_time(module, env) for _ in range(args.repeat)]
+        seconds = statistics.median(total for total, _ in runs)
+        metrics[f"import_{module}_ms"] = seconds * 1000
+        slowest = ", ".join(f"{name} {cumulative * 1000:.0f}" for cumulative, name in runs[-1][1][:3])
+        print(f"{module:<15}{seconds * 1000:>10.0f}   {slowest}")
+
+    loaded = modules_loaded(
+        "import json, sys, db; print(json.dumps({'aiogram': 'aiogram' in sys.modules}))",
+        env,
+    )
+    side_effects = modules_loaded(
+        "import json, os, telegram_bot, db; "
+        f"print(json.dumps({{'files': os.path.exists({str(data_dir)!r}), 'engine': db._engine is not None}}))",
+        env,
+    )
+    print(
+        f"import db loads aiogram: {loaded['aiogram']}; importing telegram_bot creates files: "
+        f"{side_effects['files']}, engine: {side_effects['engine']}"
+    )
+
+    os.environ.update(env)
+    data_dir.mkdir()
+    metrics.update(asyncio.run(startup()))
+    print(
+        f"create_bot_app {metrics['factory_ms']:.1f}ms, startup warm-up {metrics['warm_up_ms']:.1f}ms, "
+        f"first /start {metrics['first_update_ms']:.1f}ms, shutdown {metrics['shutdown_ms']:.1f}ms"
+    )
+
+    params = {"repeat": args.repeat, "python": sys.version.split()[0]}
+    results = save_results(args.output, "startup", params, metrics)
+    regressions: list[str] = []
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        regressions = compare(baseline, results, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} metrics regressed by more than {args.tolerance:.0%}")
+    ok = not loaded["aiogram"] and not side_effects["files"] and not side_effects["engine"] and not regressions
+    print("ok" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per module")
+    parser.add_argument("--output", type=Path, default=Path("benchmarks/results/startup.json"))
+    parser.add_argument("--baseline", type=Path, help="earlier results file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown per metric")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,132 @@
+"""
+Webhook load test: replay recorded updates for many simulated users against a local
+webhook server (fake OLX and fake Telegram behind it) and report ack and handler latency.
+
+Usage: python -m benchmarks.bench_webhook [--users 200] [--duplicates 0.1]
+"""
+
+import argparse
+import asyncio
+import copy
+import json
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+import aiohttp
+
+from benchmarks.report import percentile
+from benchmarks.stubs import FakeTelegram, make_olx_app, make_telegram_app, start_app
+
+UPDATES_PATH = Path(__file__).parent / "data" / "updates.jsonl"
+SECRET = "bench-secret"
+
+
+def user_updates(template: list[dict[str, Any]], user_index: int) -> list[dict[str, Any]]:
+    """
+    The recorded wizard flow re-addressed to a simulated user.
+    """
+    user_id = 10_000_000 + user_index
+    updates = []
+    for i, recorded in enumerate(template):
+        update = copy.deepcopy(recorded)
+        update["update_id"] = user_index * 100 + i
+        event = update.get("message") or update["callback_query"]
+        event["from"]["id"] = user_id
+        chat = (event.get("message") or event)["chat"]
+        chat["id"] = user_id
+        updates.append(update)
+    return updates
+
+
+async def main(users: int, duplicates: float) -> None:
+    olx_runner, olx_url = await start_app(make_olx_app())
+    fake = FakeTelegram(global_limit=10**9, chat_limit=10**9)
+    tg_runner, tg_url = await start_app(make_telegram_app(fake))
+
+    workdir = tempfile.mkdtemp(prefix="olx-bench-")
+    os.environ.update(
+        API_TOKEN="123456:BENCHMARK",
+        WEBHOOK_SECRET=SECRET,
+        OLX_BASE_URL=olx_url,
+        FSM_STORAGE="memory",
+        GAZETTEER_PATH=f"{workdir}/gazetteer.bin",
+        SEEN_STORE_PATH=f"{workdir}/seen.bin",
+        UPDATE_DEDUP_PATH=f"{workdir}/updates.sqlite3",
+    )
+    os.environ.setdefault("DB_USER", "bench")
+    os.environ.setdefault("DB_USER_PASSWORD", "bench")
+    os.environ.setdefault("DB_NAME", "bench")
+
+    import logging
+
+    from aiogram.client.telegram import TelegramAPIServer
+
+    import telegram_bot
+    from webhook import create_app
+
+    logging.getLogger().setLevel(logging.WARNING)
+    app = telegram_bot.create_bot_app()
+    app.bot.session.api = TelegramAPIServer.from_base(tg_url)
+    handler_latency: list[float] = []
+    handled = asyncio.Event()
+    expected = 0
+
+    async def timer(handler: Any, event: Any, data: dict[str, Any]) -> Any:
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            handler_latency.append(time.perf_counter() - started)
+            if len(handler_latency) >= expected:
+                handled.set()
+
+    web_app = create_app(app.dp, app.bot, primary=False)
+    app.dp.update.outer_middleware(timer)
+    bot_runner, bot_url = await start_app(web_app)
+
+    template = [json.loads(line) for line in UPDATES_PATH.read_text(encoding="utf-8").splitlines() if line]
+    flows = [user_updates(template, i) for i in range(users)]
+    expected = users * len(template)
+    ack_latency: list[float] = []
+    headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+
+    async def replay(client: aiohttp.ClientSession, flow: list[dict[str, Any]]) -> None:
+        for update in flow:
+            for _ in range(2 if random.random() < duplicates else 1):  # simulated Telegram retry
+                started = time.perf_counter()
+                async with client.post(f"{bot_url}/webhook", json=update, headers=headers) as response:
+                    response.raise_for_status()
+                ack_latency.append(time.perf_counter() - started)
+            await asyncio.sleep(0.01)
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as client:
+        await asyncio.gather(*(replay(client, flow) for flow in flows))
+    await asyncio.wait_for(handled.wait(), timeout=60)
+    elapsed = time.perf_counter() - started
+
+    for runner in (bot_runner, tg_runner, olx_runner):
+        await runner.cleanup()
+    await app.bot.session.close()
+
+    print(f"{expected} updates from {users} users in {elapsed:.2f}s ({expected / elapsed:.0f} updates/s)")
+    print(
+        f"ack      p50={percentile(ack_latency, 0.5) * 1000:7.2f}ms p99={percentile(ack_latency, 0.99) * 1000:7.2f}ms"
+    )
+    print(
+        f"handler  p50={percentile(handler_latency, 0.5) * 1000:7.2f}ms "
+        f"p99={percentile(handler_latency, 0.99) * 1000:7.2f}ms  (handled {len(handler_latency)}, "
+        f"duplicates posted {len(ack_latency) - expected})"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--duplicates", type=float, default=0.1, help="share of updates posted twice")
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.duplicates))
@@ -0,0 +1,224 @@
+"""
+End-to-end benchmark: simulated users walk the whole search wizard through the real
+`telegram_bot` handlers (FSM storage, city lookup via `olx_api`, filters saved via `db`),
+then the poller picks up fresh ads for their filters and the notifier delivers them.
+
+OLX, the NBU rates API and the Telegram Bot API are local stub servers; the database is a
+throwaway SQLite file unless `--database-url` points elsewhere. Results are written as JSON
+(`--output`) and can be checked against an earlier run (`--baseline`).
+
+Usage: python -m benchmarks.bench_wizard [--users 200] [--concurrency 50] [--new-ads 5]
+           [--output benchmarks/results/latest.json] [--baseline old.json] [--tolerance 0.2]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any
+
+from benchmarks.report import compare, save_results, summarize
+from benchmarks.stubs import (
+    STUB_CITIES,
+    FakeTelegram,
+    OfferFeed,
+    make_nbu_app,
+    make_olx_app,
+    make_telegram_app,
+    start_app,
+)
+
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "OLX bot", "username": "olx_bot"}
+
+
+def user_flow(user_index: int, rng: random.Random) -> list[tuple[str, dict[str, Any]]]:
+    """
+    (step name, update) for one user going from /start to a saved filter.
+    """
+    from callbacks import CategoryDetail, ChooseCity, ChooseCurrency, ChoosePriceFrom, ChoosePriceTo, RealEstateMenu
+    from constants import CATEGORY_OPTIONS, CURRENCY_OPTIONS, PRICE_FROM_OPTIONS, PRICE_TO_OPTIONS
+
+    user = {"id": 10_000_000 + user_index, "is_bot": False, "first_name": f"User {user_index}"}
+    chat = {"id": user["id"], "type": "private"}
+    city = rng.choice(STUB_CITIES)
+    update_ids = iter(range(user_index * 100, user_index * 100 + 100))
+
+    def message(text: str) -> dict[str, Any]:
+        return {"message_id": 1, "from": user, "chat": chat, "date": int(time.time()), "text": text}
+
+    def callback(payload: Any) -> dict[str, Any]:
+        bot_message = {**message(""), "from": BOT_USER}
+        return {"id": str(next(update_ids)), "from": user, "message": bot_message, "chat_instance": "1"} | {
+            "data": payload.pack()
+        }
+
+    steps = [
+        ("start", {"message": message("/start")}),
+        ("category", {"callback_query": callback(RealEstateMenu())}),
+        ("category_detail", {"callback_query": callback(CategoryDetail(rng.choice(CATEGORY_OPTIONS)[1]))}),
+        ("city_search", {"message": message(city["city"]["name"])}),
+        ("choose_city", {"callback_query": callback(ChooseCity(city["city"]["id"], city["region"]["id"]))}),
+        ("currency", {"callback_query": callback(ChooseCurrency(rng.randrange(len(CURRENCY_OPTIONS))))}),
+        ("price_from", {"callback_query": callback(ChoosePriceFrom(rng.randrange(len(PRICE_FROM_OPTIONS))))}),
+        ("price_to", {"callback_query": callback(ChoosePriceTo(rng.randrange(len(PRICE_TO_OPTIONS))))}),
+    ]
+    return [(name, {"update_id": next(update_ids), **update}) for name, update in steps]
+
+
+async def wait_drained(notifier: Any, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while notifier.queue_depth() and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+
+
+async def main(args: argparse.Namespace) -> int:
+    feed = OfferFeed()
+    olx_runner, olx_url = await start_app(make_olx_app(feed))
+    nbu_runner, nbu_url = await start_app(make_nbu_app())
+    fake = FakeTelegram(global_limit=10**9, chat_limit=10**9)
+    tg_runner, tg_url = await start_app(make_telegram_app(fake))
+
+    workdir = tempfile.mkdtemp(prefix="olx-bench-")
+    os.environ.update(
+        API_TOKEN="123456:BENCHMARK",
+        DATABASE_URL=args.database_url or f"sqlite+aiosqlite:///{workdir}/bench.sqlite3",
+        OLX_BASE_URL=olx_url,
+        NBU_RATES_URL=f"{nbu_url}/rates",
+        FSM_STORAGE="sqlite",
+        FSM_SQLITE_PATH=f"{workdir}/fsm.sqlite3",
+        GAZETTEER_PATH=f"{workdir}/gazetteer.bin",
+        SEEN_STORE_PATH=f"{workdir}/seen.bin",
+        PRICE_HISTORY_DIR=f"{workdir}/prices",
+        # Measure our pipeline, not Telegram's flood limits (bench_notifier covers those)
+        NOTIFY_GLOBAL_RATE="100000",
+        NOTIFY_GLOBAL_BURST="1000",
+        NOTIFY_CHAT_RATE="1000",
+        NOTIFY_CHAT_BURST="100",
+    )
+
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.types import Update
+
+    import db
+    import telegram_bot
+
+    logging.getLogger().setLevel(logging.WARNING)
+    app = telegram_bot.create_bot_app()
+    app.bot.session.api = TelegramAPIServer.from_base(tg_url)
+    await db.create_db_and_tables()
+    await app.startup(run_background_jobs=False)
+
+    rng = random.Random(args.seed)
+    flows = [user_flow(i, rng) for i in range(args.users)]
+    step_latency: dict[str, list[float]] = defaultdict(list)
+    wizard_latency: list[float] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def walk(flow: list[tuple[str, dict[str, Any]]]) -> None:
+        nonlocal errors
+        async with semaphore:
+            wizard_started = time.perf_counter()
+            for name, raw in flow:
+                started = time.perf_counter()
+                try:
+                    await app.dp.feed_update(app.bot, Update.model_validate(raw))
+                except Exception:
+                    logging.exception(f"Wizard step {name} failed.")
+                    errors += 1
+                    return
+                step_latency[name].append(time.perf_counter() - started)
+            wizard_latency.append(time.perf_counter() - wizard_started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(walk(flow) for flow in flows))
+    wizard_elapsed = time.perf_counter() - started
+    updates = sum(len(samples) for samples in step_latency.values())
+    subscriptions = len(await db.get_active_subscriptions())
+
+    # First cycle primes the seen store, the second one finds the freshly published ads
+    poller, notifier = app.poller, app.notifier
+    await poller.run_cycle()
+    published = feed.publish(args.new_ads)
+    notifier.start()
+    sent_before = len(fake.messages)
+    started = time.perf_counter()
+    await poller.run_cycle()
+    poll_elapsed = time.perf_counter() - started
+    await wait_drained(notifier, timeout=60)
+    delivery_elapsed = time.perf_counter() - started
+    notifier_stats = notifier.stats()
+
+    await app.shutdown()
+    await app.bot.session.close()
+    for runner in (tg_runner, nbu_runner, olx_runner):
+        await runner.cleanup()
+
+    metrics: dict[str, float] = {
+        "wizard_updates_per_s": updates / wizard_elapsed,
+        "wizard_errors": float(errors),
+        **summarize("wizard_update", [sample for samples in step_latency.values() for sample in samples]),
+        **summarize("wizard_complete", wizard_latency),
+    }
+    for name, samples in step_latency.items():
+        metrics.update(summarize(f"step_{name}", samples))
+    metrics.update(
+        {
+            "poll_cycle_s": poll_elapsed,
+            "delivery_s": delivery_elapsed,
+            "notifications_per_s": (len(fake.messages) - sent_before) / delivery_elapsed,
+            "notifications_failed": float(notifier_stats["failed"]),
+            "notify_latency_p50_ms": notifier_stats["latency_p50"] * 1000,
+            "notify_latency_p99_ms": notifier_stats["latency_p99"] * 1000,
+        }
+    )
+    params = {
+        "users": args.users,
+        "concurrency": args.concurrency,
+        "new_ads": args.new_ads,
+        "seed": args.seed,
+        "database": "sqlite" if not args.database_url else args.database_url.split(":", 1)[0],
+    }
+    results = save_results(args.output, "wizard", params, metrics)
+
+    print(
+        f"{updates} wizard updates from {args.users} users in {wizard_elapsed:.2f}s "
+        f"({metrics['wizard_updates_per_s']:.0f} updates/s, {errors} errors, {subscriptions} subscriptions saved)"
+    )
+    print(f"{'step':<18}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for name in step_latency:
+        row = [metrics[f"step_{name}_{q}_ms"] for q in ("p50", "p95", "p99", "max")]
+        print(f"{name:<18}" + "".join(f"{value:>9.2f}" for value in row))
+    print(
+        f"poll cycle {poll_elapsed:.2f}s ({poller.requests_made} OLX requests), {published} new ads, "
+        f"{len(fake.messages) - sent_before} messages delivered in {delivery_elapsed:.2f}s"
+    )
+    print(f"results written to {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        regressions = compare(baseline, results, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} metrics regressed by more than {args.tolerance:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50, help="users in the wizard at the same time")
+    parser.add_argument("--new-ads", type=int, default=5, help="ads published per search before the second poll")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--database-url", help="SQLAlchemy async URL, default a temporary SQLite file")
+    parser.add_argument("--output", type=Path, default=Path("benchmarks/results/latest.json"))
+    parser.add_argument("--baseline", type=Path, help="earlier results file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown per metric")
+    sys.exit(asyncio.run(main(parser.parse_args())))
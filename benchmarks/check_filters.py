@@ -0,0 +1,191 @@
+"""
+/filters pages and pause/delete against SQLite, through the real `db`, `FilterPages` and
+`ListingPoller` code.
+
+Seeds `--users` users with one subscription each and one heavy user with `--filters`, their ids
+interleaved. Checks that paging forward and back visits every subscription of the heavy user
+once and in order, and times the last page with keyset pagination against OFFSET and from
+the page cache. Then pauses, resumes and deletes subscriptions the way the bot handlers do and
+checks every few steps that the poller's in-memory groups and schedule match a full reload.
+
+Usage: python -m benchmarks.check_filters [--users 5000] [--filters 500]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+from benchmarks.stubs import SRC_DIR  # noqa: F401
+
+HEAVY_USER = 20_000_000
+
+
+def snapshot(groups: dict[Any, Any]) -> dict[str, Any]:
+    return {
+        query.key: (
+            {filter_id: sorted(chat_ids) for filter_id, chat_ids in group.subscribers.items()},
+            {filter_id: sorted(sub.id for sub in subs) for filter_id, subs in group.digests.items()},
+            sorted(group.filters),
+        )
+        for query, group in groups.items()
+    }
+
+
+def page_filter_ids(markup: Any) -> list[int]:
+    from callbacks import ToggleFilter
+
+    return [
+        ToggleFilter.unpack(button.callback_data).filter_id
+        for row in markup.inline_keyboard
+        for button in row
+        if button.callback_data and button.callback_data[0] == ToggleFilter.code
+    ]
+
+
+def nav(markup: Any, text: str) -> Any:
+    from callbacks import FiltersPage
+
+    buttons = [button for row in markup.inline_keyboard for button in row if button.text == text]
+    return FiltersPage.unpack(buttons[0].callback_data) if buttons else None
+
+
+async def timed_ms(coro_factory: Any, repeat: int) -> float:
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await coro_factory()
+        runs.append((time.perf_counter() - started) * 1000)
+    return statistics.median(runs)
+
+
+async def main(args: argparse.Namespace) -> int:
+    workdir = Path(tempfile.mkdtemp(prefix="olx-filters-"))
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{workdir}/filters.sqlite3"
+
+    import db
+    from filter_pages import FilterPages
+    from models import CurrencyEnum, DeliveryModeEnum
+    from poller import ListingPoller, group_subscriptions
+    from price_history import PriceHistory
+    from seen_store import SeenStore
+
+    await db.create_db_and_tables()
+    rng = random.Random(args.seed)
+    await db.upsert_telegram_users([(HEAVY_USER, "heavy")] + [(10_000_000 + i, f"user{i}") for i in range(args.users)])
+    specs = {
+        db.FilterSpec(1758, 1000 + i % 50, 25, rng.choice(list(CurrencyEnum)), None, 1000 * (i + 1)): f"filter {i}"
+        for i in range(max(args.filters, 100))
+    }
+    filter_ids = list((await db.upsert_search_filters(specs)).values())
+    heavy = rng.sample(filter_ids, args.filters)
+    light = [(10_000_000 + i, rng.choice(filter_ids)) for i in range(args.users)]
+    # Interleave: every few light subscriptions one of the heavy user's
+    step = max(1, len(light) // args.filters)
+    for n, filter_id in enumerate(heavy):
+        await db.subscribe_users(light[n * step : (n + 1) * step] + [(HEAVY_USER, filter_id)])
+    await db.subscribe_users(light[len(heavy) * step :])
+    for telegram_id, filter_id in rng.sample(light, len(light) // 5):
+        await db.set_delivery_mode(telegram_id, filter_id, DeliveryModeEnum.BATCHED, 60)
+
+    pages = FilterPages(page_size=args.page_size, ttl=3600)
+    _, markup = await pages.get(HEAVY_USER)
+    forward, forward_pages, last_anchor = page_filter_ids(markup), 1, 0
+    while (button := nav(markup, "▶️")) is not None:
+        _, markup = await pages.get(HEAVY_USER, button.anchor, button.backward)
+        forward += page_filter_ids(markup)
+        forward_pages += 1
+        last_anchor = button.anchor
+    # Back from the last page to the first, pages end wherever the way forward started them
+    backward = page_filter_ids(markup)
+    while (button := nav(markup, "◀️")) is not None:
+        _, markup = await pages.get(HEAVY_USER, button.anchor, button.backward)
+        backward = page_filter_ids(markup) + backward
+    paging_ok = forward == heavy and backward == heavy
+    print(f"heavy user: {len(heavy)} filters in {forward_pages} pages of {args.page_size}, order ok: {paging_ok}")
+
+    # The deepest page: keyset vs OFFSET, both returning the same rows
+    subscription_ids = sorted(row[0].id for row in await db.get_user_filters_page(HEAVY_USER, 0, False, len(heavy) + 1))
+    anchor = subscription_ids[-args.page_size - 1]
+    keyset = db.user_filters_page_query(HEAVY_USER, anchor, limit=args.page_size + 1)
+    offset = db.user_filters_page_query(HEAVY_USER, limit=args.page_size + 1).offset(len(heavy) - args.page_size)
+
+    async def run(statement: Any) -> list[Any]:
+        async with db.async_session() as session:
+            return list((await session.exec(statement)).all())
+
+    assert [row[0].id for row in await run(keyset)] == [row[0].id for row in await run(offset)]
+    keyset_ms = await timed_ms(lambda: run(keyset), 50)
+    offset_ms = await timed_ms(lambda: run(offset), 50)
+    cache = FilterPages(page_size=args.page_size)
+
+    async def uncached_page() -> None:
+        cache.invalidate(HEAVY_USER)
+        await cache.get(HEAVY_USER, anchor)
+
+    uncached_ms = await timed_ms(uncached_page, 50)
+    cached_ms = await timed_ms(lambda: cache.get(HEAVY_USER, anchor), 50)
+    print(
+        f"last page: keyset query {keyset_ms:.2f}ms, OFFSET query {offset_ms:.2f}ms; "
+        f"/filters page uncached {uncached_ms:.2f}ms, cached {cached_ms:.3f}ms"
+    )
+
+    # Pause, resume and delete as the handlers do, the poller must match a full reload every time
+    async def deliver(chat_id: int, offers: list[Any]) -> None:
+        pass
+
+    poller = ListingPoller(deliver=deliver, seen_store=SeenStore(path=None), history=PriceHistory(workdir / "prices"))
+    await poller._load_groups()
+    pages.listeners.append(poller.update_subscription)
+    steps_ok = True
+    actions = [("toggle", telegram_id, filter_id) for telegram_id, filter_id in rng.sample(light, 100)]
+    actions += [("toggle", telegram_id, filter_id) for _, telegram_id, filter_id in actions[:50]]
+    actions += [("delete", telegram_id, filter_id) for telegram_id, filter_id in rng.sample(light, 100)]
+    actions += [("delete", HEAVY_USER, filter_id) for filter_id in heavy[: args.filters // 2]]
+    rng.shuffle(actions)
+    applied = 0
+    for action, telegram_id, filter_id in actions:
+        if action == "toggle":
+            row = await db.toggle_subscription_paused(telegram_id, filter_id)
+        else:
+            row = await db.delete_user_subscription(telegram_id, filter_id)
+        if row is None:
+            continue
+        subscription, search_filter = row
+        pages.changed(telegram_id, search_filter, subscription, action == "toggle" and not subscription.paused)
+        applied += 1
+        if applied % 10 == 0 or applied == len(actions):
+            reloaded = group_subscriptions(await db.get_active_subscriptions())
+            scheduled = set(poller.schedule.expected_delays())
+            steps_ok = steps_ok and snapshot(poller._groups) == snapshot(reloaded)
+            steps_ok = steps_ok and scheduled == {query.key for query in reloaded}
+    reloaded = group_subscriptions(await db.get_active_subscriptions())
+    steps_ok = steps_ok and snapshot(poller._groups) == snapshot(reloaded)
+    # The cached last page must not show deleted filters
+    _, markup = await pages.get(HEAVY_USER, last_anchor)
+    stale_ok = markup is not None and set(page_filter_ids(markup)) <= set(heavy[args.filters // 2 :])
+    print(
+        f"{applied} pauses/resumes/deletions applied in place, poller groups and schedule match a reload: "
+        f"{steps_ok}; pages after deletions show only remaining filters: {stale_ok}"
+    )
+    print(f"page cache: {pages.stats()}")
+    await db.close_db()
+
+    ok = paging_ok and steps_ok and stale_ok
+    print("ok" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--filters", type=int, default=500, help="subscriptions of the heavy user")
+    parser.add_argument("--page-size", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,149 @@
+"""
+Seeds users, shared filters and subscriptions through the bulk `db` APIs, then runs EXPLAIN
+on the hot lookups and fails unless every one of them is served by an index, without sorting
+(the keyset-paginated /filters pages have to come out of the index in order).
+
+Runs against a throwaway SQLite file unless `--database-url` points to Postgres; there
+sequential scans are disabled for the session so small tables still show whether an index
+*can* be used.
+
+Usage: python -m benchmarks.check_indexes [--users 2000] [--filters 500] [--database-url URL]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Any
+
+from benchmarks.stubs import SRC_DIR  # noqa: F401
+
+INDEX_MARKERS = {
+    "sqlite": ("USING INDEX", "USING COVERING INDEX", "USING INTEGER PRIMARY KEY"),
+    "postgresql": ("Index Scan", "Index Only Scan", "Bitmap Index Scan"),
+}
+
+
+def full_scans(dialect: str, plan: str) -> list[str]:
+    lines = [line.strip() for line in plan.splitlines()]
+    if dialect == "sqlite":
+        return [line for line in lines if line.startswith("SCAN ") and " USING " not in line]
+    return [line for line in lines if "Seq Scan" in line]
+
+
+def sorts(dialect: str, plan: str) -> list[str]:
+    lines = [line.strip() for line in plan.splitlines()]
+    if dialect == "sqlite":
+        return [line for line in lines if "USE TEMP B-TREE" in line]
+    return [line for line in lines if "Sort  (" in line]
+
+
+def hot_queries() -> dict[str, Any]:
+    from sqlalchemy import exists, select
+
+    from db import FilterSpec, user_filters_page_query
+    from models import FILTER_IDENTITY, CurrencyEnum, SearchFilter, TelegramUser, UserSearchFilters
+
+    spec = FilterSpec(1, 2, 3, CurrencyEnum.UAH, None, 10000)
+    identity = (*spec[:4], -1 if spec.price_from is None else spec.price_from, spec.price_to)
+    return {
+        "user by telegram_id": select(TelegramUser.id).where(TelegramUser.telegram_id == 10_000_001),
+        "filters of a user": select(SearchFilter)
+        .join(UserSearchFilters, UserSearchFilters.search_filter_id == SearchFilter.id)
+        .where(UserSearchFilters.user_id == 42),
+        "subscribers of a filter": select(TelegramUser.telegram_id)
+        .join(UserSearchFilters, UserSearchFilters.user_id == TelegramUser.id)
+        .where(UserSearchFilters.search_filter_id == 42),
+        "filter by identity": select(SearchFilter.id).where(
+            *(column == value for column, value in zip(FILTER_IDENTITY, identity))
+        ),
+        "orphaned filter check": select(SearchFilter.id).where(
+            SearchFilter.id == 42, ~exists().where(UserSearchFilters.search_filter_id == SearchFilter.id)
+        ),
+        "filters page of a user": user_filters_page_query(10_000_001, anchor=42, limit=6),
+        "previous filters page": user_filters_page_query(10_000_001, anchor=42, backward=True, limit=6),
+    }
+
+
+async def explain(connection: Any, dialect: str, statement: Any) -> str:
+    from sqlalchemy import text
+
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True}))
+    if dialect == "sqlite":
+        rows = await connection.execute(text(f"EXPLAIN QUERY PLAN {sql}"))
+        return "\n".join(row[-1] for row in rows)
+    rows = await connection.execute(text(f"EXPLAIN {sql}"))
+    return "\n".join(row[0] for row in rows)
+
+
+async def main(args: argparse.Namespace) -> int:
+    workdir = tempfile.mkdtemp(prefix="olx-indexes-")
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite+aiosqlite:///{workdir}/indexes.sqlite3"
+
+    from sqlalchemy import text
+
+    import db
+    from models import CurrencyEnum
+
+    await db.create_db_and_tables()
+    rng = random.Random(args.seed)
+
+    started = time.perf_counter()
+    user_ids = await db.upsert_telegram_users((10_000_000 + i, f"user{i}") for i in range(args.users))
+    specs = {
+        db.FilterSpec(
+            rng.choice((1147, 1149, 1151)),
+            rng.randrange(1, 400),
+            rng.randrange(1, 25),
+            rng.choice(list(CurrencyEnum)),
+            rng.choice((None, 100, 200, 500)),
+            rng.choice((None, 1000, 2000, 5000)),
+        ): f"filter {i}"
+        for i in range(args.filters)
+    }
+    filter_ids = await db.upsert_search_filters(specs)
+    # Upserting the same specs again must hand back the same rows instead of duplicating them
+    assert await db.upsert_search_filters(specs) == filter_ids
+    subscriptions = [(telegram_id, rng.choice(list(filter_ids.values()))) for telegram_id in user_ids]
+    subscriptions += rng.sample(subscriptions, len(subscriptions) // 10)
+    subscribed = await db.subscribe_users(subscriptions)
+    unsubscribed = await db.unsubscribe_users(rng.sample(subscriptions, len(subscriptions) // 20))
+    seed_elapsed = time.perf_counter() - started
+    print(
+        f"seeded {len(user_ids)} users, {len(filter_ids)} filters, {subscribed} subscriptions "
+        f"(-{unsubscribed}) in {seed_elapsed:.2f}s"
+    )
+
+    dialect = db.get_engine().dialect.name
+    markers = INDEX_MARKERS.get(dialect)
+    if markers is None:
+        print(f"EXPLAIN check is not implemented for {dialect}")
+        return 1
+    failures = 0
+    async with db.get_engine().connect() as connection:
+        if dialect == "sqlite":
+            await connection.execute(text("ANALYZE"))
+        else:
+            await connection.execute(text("SET enable_seqscan = off"))
+        for name, statement in hot_queries().items():
+            plan = await explain(connection, dialect, statement)
+            ok = any(marker in plan for marker in markers) and not full_scans(dialect, plan)
+            ok = ok and not sorts(dialect, plan)
+            failures += not ok
+            print(f"{'ok' if ok else 'FAIL':<5}{name}")
+            for line in plan.splitlines():
+                print(f"       {line}")
+    await db.close_db()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--filters", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--database-url", help="SQLAlchemy async URL, defaults to a temporary SQLite file")
+    sys.exit(asyncio.run(main(parser.parse_args())))
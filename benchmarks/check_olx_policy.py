@@ -0,0 +1,134 @@
+"""
+OLX client policy under a throttling and then failing upstream.
+
+A stub OLX answers 429 above `--capacity` requests/s and 503 during an outage. Background
+pollers hammer the offers endpoint while a user looks cities up; the run shows the AIMD rate
+settling under the capacity, interactive lookups overtaking polling, the circuit opening
+during the outage (with city answers served from stale cache) and closing after it.
+
+Usage: python -m benchmarks.check_olx_policy [--capacity 8] [--pollers 20] [--seconds 6]
+"""
+
+import argparse
+import asyncio
+import time
+from collections import deque
+from typing import Any
+
+from aiohttp import web
+
+from benchmarks.report import percentile
+from benchmarks.stubs import STUB_CITIES, start_app
+from city_cache import CityCache
+from olx_api import LOCATION_AUTOCOMPLETE_PATH, OFFERS_PATH, OlxClient
+from olx_policy import CircuitBreaker, OlxUnavailableError
+from rate_limit import AdaptiveRateLimiter
+
+
+class FlakyOlx:
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.down = False
+        self._served: deque[float] = deque()
+        self.answers: dict[int, int] = {}
+
+    def _answer(self, status: int, body: Any, headers: dict[str, str] | None = None) -> web.Response:
+        self.answers[status] = self.answers.get(status, 0) + 1
+        return web.json_response(body, status=status, headers=headers)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.down:
+            return self._answer(503, {"error": "unavailable"})
+        now = time.monotonic()
+        while self._served and now - self._served[0] >= 1.0:
+            self._served.popleft()
+        if len(self._served) >= self.capacity:
+            return self._answer(429, {"error": "too many requests"}, {"Retry-After": "1"})
+        self._served.append(now)
+        if request.path == LOCATION_AUTOCOMPLETE_PATH:
+            query = request.query.get("query", "").lower()
+            return self._answer(200, {"data": [c for c in STUB_CITIES if c["city"]["name"].lower().startswith(query)]})
+        return self._answer(200, {"data": []})
+
+
+async def main(capacity: int, pollers: int, seconds: float) -> None:
+    upstream = FlakyOlx(capacity)
+    app = web.Application()
+    app.router.add_get(LOCATION_AUTOCOMPLETE_PATH, upstream.handle)
+    app.router.add_get(OFFERS_PATH, upstream.handle)
+    runner, base_url = await start_app(app)
+
+    limiter = AdaptiveRateLimiter(rate=capacity * 3, burst=capacity, min_rate=0.5, max_rate=capacity * 4)
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=1.0)
+    client = OlxClient(base_url, limiter=limiter, breaker=breaker, retries=2, backoff_base=0.05, backoff_cap=1.0)
+    cache = CityCache(client.get_city_info, ttl=0.0)
+    interactive: list[float] = []
+    background: list[float] = []
+    rates: list[float] = []
+    stop = asyncio.Event()
+
+    async def poller(index: int) -> None:
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                await client.get_offers({"category_id": index})
+                background.append(time.perf_counter() - started)
+            except OlxUnavailableError:
+                await asyncio.sleep(0.1)
+
+    async def user() -> None:
+        names = [city["city"]["name"] for city in STUB_CITIES]
+        for i in range(int(seconds * 5)):
+            started = time.perf_counter()
+            await cache.lookup(names[i % len(names)])
+            interactive.append(time.perf_counter() - started)
+            rates.append(limiter.rate)
+            await asyncio.sleep(0.2)
+
+    # Throttling phase
+    tasks = [asyncio.create_task(poller(i)) for i in range(pollers)]
+    await user()
+    print(f"throttling: upstream answers {dict(sorted(upstream.answers.items()))}, AIMD rate {rates[0]:.1f} -> "
+          f"{rates[-1]:.1f} req/s (capacity {capacity}), min {min(rates):.1f}")
+    print(f"  interactive lookups p50={percentile(interactive, 0.5) * 1000:.0f}ms "
+          f"p99={percentile(interactive, 0.99) * 1000:.0f}ms, background p50="
+          f"{percentile(background, 0.5) * 1000:.0f}ms p99={percentile(background, 0.99) * 1000:.0f}ms")
+
+    # Outage phase
+    upstream.down = True
+    stale_before = cache.stale_hits
+    outage_started = time.monotonic()
+    while breaker.state.value == "closed" and time.monotonic() - outage_started < 10:
+        await asyncio.sleep(0.05)
+    opened_after = time.monotonic() - outage_started
+    started = time.perf_counter()
+    cities = await cache.lookup("Київ")
+    stale_ms = (time.perf_counter() - started) * 1000
+    sent_while_open = sum(upstream.answers.values())
+    await asyncio.sleep(0.5)
+    sent_while_open = sum(upstream.answers.values()) - sent_while_open
+    print(f"outage: circuit {breaker.state.value} after {opened_after:.2f}s, {breaker.rejected} calls rejected, "
+          f"{sent_while_open} requests reached OLX in 0.5s while open")
+    print(f"  city lookup served from stale cache in {stale_ms:.1f}ms ({len(cities)} cities, "
+          f"stale hits {cache.stale_hits - stale_before})")
+
+    # Recovery
+    upstream.down = False
+    recovered_started = time.monotonic()
+    while breaker.state.value != "closed" and time.monotonic() - recovered_started < 10:
+        await asyncio.sleep(0.05)
+    print(f"recovery: circuit {breaker.state.value} {time.monotonic() - recovered_started:.2f}s after OLX came back")
+
+    stop.set()
+    await asyncio.gather(*tasks)
+    await client.close()
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--capacity", type=int, default=8, help="requests/s the stub OLX serves before 429")
+    parser.add_argument("--pollers", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=6.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.capacity, args.pollers, args.seconds))
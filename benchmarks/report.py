@@ -0,0 +1,76 @@
+"""
+Latency summaries and machine-readable benchmark results.
+
+Results are flat `{"metric": number}` maps saved as JSON next to the run parameters, so two
+runs can be diffed with `compare`. Metric names tell the direction: `*_per_s` is better when
+higher, everything else (latencies in `*_ms`, durations in `*_s`, error counts) when lower.
+"""
+
+import json
+import platform
+import subprocess
+import time
+from pathlib import Path
+from typing import Any
+
+
+def percentile(samples: list[float], q: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))] if samples else 0.0
+
+
+def summarize(prefix: str, samples: list[float]) -> dict[str, float]:
+    """
+    p50/p95/p99/max latency in milliseconds of `samples` given in seconds.
+    """
+    quantiles = (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))
+    metrics = {f"{prefix}_{name}_ms": percentile(samples, q) * 1000 for name, q in quantiles}
+    metrics[f"{prefix}_max_ms"] = max(samples, default=0.0) * 1000
+    return metrics
+
+
+def git_revision() -> str:
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return result.stdout.strip()
+
+
+def save_results(path: Path, benchmark: str, params: dict[str, Any], metrics: dict[str, float]) -> dict[str, Any]:
+    results = {
+        "benchmark": benchmark,
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "params": params,
+        "metrics": {name: round(value, 3) for name, value in metrics.items()},
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(results, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+    return results
+
+
+def higher_is_better(metric: str) -> bool:
+    return metric.endswith("_per_s")
+
+
+def compare(baseline: dict[str, Any], current: dict[str, Any], tolerance: float) -> list[str]:
+    """
+    Print current vs baseline metrics, return the names that got worse by more than `tolerance`.
+    """
+    regressions = []
+    if baseline.get("params") != current.get("params"):
+        print(f"warning: parameters differ, baseline {baseline.get('params')} vs current {current.get('params')}")
+    print(f"{'metric':<36}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, value in current["metrics"].items():
+        old = baseline["metrics"].get(name)
+        if old is None:
+            continue
+        change = (value - old) / old if old else 0.0
+        worse = -change if higher_is_better(name) else change
+        flag = "  <- regression" if worse > tolerance else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:<36}{old:>12.2f}{value:>12.2f}{change:>+10.1%}{flag}")
+    return regressions
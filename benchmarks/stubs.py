@@ -0,0 +1,244 @@
+"""
+Local stand-ins for upstream services used by the benchmarks.
+"""
+
+import hashlib
+import itertools
+import json
+import socket
+import sys
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Iterable
+
+from aiohttp import web
+
+# Benchmarks run from the repo root, the bot modules live in src/ and use flat imports.
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return int(sock.getsockname()[1])
+
+
+def make_city(city_id: int, name: str, region_id: int, region_name: str) -> dict[str, Any]:
+    return {
+        "city": {"id": city_id, "name": name},
+        "region": {"id": region_id, "name": region_name},
+    }
+
+
+STUB_CITIES = [
+    make_city(268, "Київ", 25, "Київська область"),
+    make_city(201, "Львів", 5, "Львівська область"),
+    make_city(121, "Одеса", 19, "Одеська область"),
+    make_city(171, "Харків", 22, "Харківська область"),
+    make_city(149, "Дніпро", 4, "Дніпропетровська область"),
+]
+
+
+async def _location_autocomplete(request: web.Request) -> web.Response:
+    query = request.query.get("query", "").lower()
+    data = [item for item in STUB_CITIES if item["city"]["name"].lower().startswith(query)]
+    return web.json_response({"data": data})
+
+
+class OfferFeed:
+    """
+    Offers listing for every (category, city) search, newest first like `sort_by=created_at:desc`.
+
+    Each search starts with `initial` ads; `publish` adds fresh ones so pollers have something new.
+    With `etag` pages carry an ETag and conditional requests for an unchanged page get a 304.
+    """
+
+    def __init__(self, initial: int = 40, etag: bool = False) -> None:
+        self.initial = initial
+        self.etag = etag
+        self._ids = itertools.count(1)
+        self._offers: dict[tuple[str, str], list[dict[str, Any]]] = {}
+        self._started = int(time.time()) - 86400
+        self.requests = 0
+        self.not_modified = 0
+        self.bytes_sent = 0
+
+    def _offer(self, category_id: str, city_id: str) -> dict[str, Any]:
+        ad_id = next(self._ids)
+        created = datetime.fromtimestamp(self._started + ad_id, timezone.utc).isoformat()
+        value = 10_000 + (ad_id * 7919) % 290_000
+        return {
+            "id": ad_id,
+            "url": f"https://www.olx.ua/d/uk/obyavlenie/{ad_id}.html",
+            "title": f"Оголошення {ad_id} ({category_id}/{city_id})",
+            "created_time": created,
+            "last_refresh_time": created,
+            "params": [
+                {"key": "price", "value": {"value": value, "currency": "USD", "label": f"{value} $"}},
+            ],
+            "photos": [{"link": f"https://ireland.apollo.olx.ua/v1/files/{ad_id}/image;s={{width}}x{{height}}"}],
+        }
+
+    def _listing(self, category_id: str, city_id: str) -> list[dict[str, Any]]:
+        key = (category_id, city_id)
+        if key not in self._offers:
+            self._offers[key] = [self._offer(category_id, city_id) for _ in range(self.initial)][::-1]
+        return self._offers[key]
+
+    def searches(self) -> list[tuple[str, str]]:
+        return list(self._offers)
+
+    def publish(self, per_search: int, searches: Iterable[tuple[str, str]] | None = None) -> int:
+        """
+        Add `per_search` new ads to `searches` (default: every search requested so far).
+        """
+        searches = list(self._offers if searches is None else searches)
+        for category_id, city_id in searches:
+            listing = self._listing(category_id, city_id)
+            listing[:0] = [self._offer(category_id, city_id) for _ in range(per_search)][::-1]
+        return per_search * len(searches)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        listing = self._listing(request.query.get("category_id", ""), request.query.get("city_id", ""))
+        offset = int(request.query.get("offset", "0"))
+        limit = int(request.query.get("limit", "40"))
+        body = json.dumps({"data": listing[offset : offset + limit]}).encode()
+        headers = {}
+        if self.etag:
+            headers["ETag"] = f'"{hashlib.md5(body).hexdigest()}"'
+            if request.headers.get("If-None-Match") == headers["ETag"]:
+                self.not_modified += 1
+                return web.Response(status=304, headers=headers)
+        self.bytes_sent += len(body)
+        return web.Response(body=body, content_type="application/json", headers=headers)
+
+    async def handle_details(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        ad_id = int(request.match_info["offer_id"])
+        return web.json_response(
+            {"data": {"id": ad_id, "user": {"id": ad_id % 997, "name": f"Продавець {ad_id % 997}"}}}
+        )
+
+
+def make_olx_app(feed: OfferFeed | None = None) -> web.Application:
+    feed = feed or OfferFeed()
+    app = web.Application()
+    app.router.add_get("/api/v1/geo-encoder/location-autocomplete/", _location_autocomplete)
+    app.router.add_get("/api/v1/offers/", feed.handle)
+    app.router.add_get("/api/v1/offers/{offer_id}/", feed.handle_details)
+    return app
+
+
+async def _nbu_rates(request: web.Request) -> web.Response:
+    return web.json_response([{"cc": "USD", "rate": 41.5}, {"cc": "EUR", "rate": 48.5}])
+
+
+def make_nbu_app() -> web.Application:
+    """
+    NBU exchange rates endpoint, point `NBU_RATES_URL` at `<base>/rates`.
+    """
+    app = web.Application()
+    app.router.add_get("/rates", _nbu_rates)
+    return app
+
+
+class FakeTelegram:
+    """
+    Minimal Telegram Bot API: answers sendMessage/sendMediaGroup/editMessageText/answerCallbackQuery
+    and enforces flood limits with 429 + retry_after like the real one.
+    """
+
+    def __init__(self, global_limit: int = 30, chat_limit: int = 1, retry_after: int = 1) -> None:
+        self.global_limit = global_limit
+        self.chat_limit = chat_limit
+        self.retry_after = retry_after
+        self._message_ids = itertools.count(1)
+        self._global_sent: deque[float] = deque()
+        self._chat_sent: dict[str, deque[float]] = defaultdict(deque)
+        self.calls: dict[str, int] = defaultdict(int)
+        self.throttled = 0
+        self.messages: list[dict[str, Any]] = []
+
+    @staticmethod
+    def _window(sent: deque[float], now: float) -> deque[float]:
+        while sent and now - sent[0] >= 1.0:
+            sent.popleft()
+        return sent
+
+    def _message(self, chat_id: str, text: str | None) -> dict[str, Any]:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            "text": text or "",
+        }
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        data = dict(await request.post())
+        if not data and request.can_read_body:
+            data = await request.json()
+        self.calls[method] += 1
+        chat_id = str(data.get("chat_id", "0"))
+
+        if method in ("sendMessage", "sendMediaGroup", "sendPhoto"):
+            now = time.monotonic()
+            global_sent = self._window(self._global_sent, now)
+            chat_sent = self._window(self._chat_sent[chat_id], now)
+            if len(global_sent) >= self.global_limit or len(chat_sent) >= self.chat_limit:
+                self.throttled += 1
+                return web.json_response(
+                    {
+                        "ok": False,
+                        "error_code": 429,
+                        "description": f"Too Many Requests: retry after {self.retry_after}",
+                        "parameters": {"retry_after": self.retry_after},
+                    },
+                    status=429,
+                )
+            global_sent.append(now)
+            chat_sent.append(now)
+            self.messages.append({"method": method, "chat_id": chat_id, "at": now})
+
+        if method == "sendMediaGroup":
+            return web.json_response({"ok": True, "result": [self._message(chat_id, None)]})
+        if method in ("sendMessage", "editMessageText", "sendPhoto"):
+            return web.json_response({"ok": True, "result": self._message(chat_id, str(data.get("text", "")))})
+        return web.json_response({"ok": True, "result": True})
+
+
+def make_telegram_app(fake: FakeTelegram) -> web.Application:
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", fake.handle)
+    return app
+
+
+def make_bot(base_url: str) -> Any:
+    """
+    aiogram Bot talking to a local fake Telegram server.
+    """
+    from aiogram import Bot
+    from aiogram.client.default import DefaultBotProperties
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.enums import ParseMode
+
+    session = AiohttpSession(api=TelegramAPIServer.from_base(base_url))
+    return Bot(token="123456:BENCHMARK", session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+
+
+async def start_app(app: web.Application, port: int | None = None) -> tuple[web.AppRunner, str]:
+    """
+    Start an aiohttp application on localhost, return the runner and its base url.
+    """
+    port = port or free_port()
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", port)
+    await site.start()
+    return runner, f"http://127.0.0.1:{port}"
@@ -0,0 +1,167 @@
+"""
+Compact callback data and O(1) callback dispatch.
+
+Every payload is one code character followed by its fields packed with `struct` and
+base64url encoded, e.g. `ChooseCity(268, 25)` -> "CDAEAABkAAAA" instead of
+"choose_city:268:Київ:25". Free text (city and category names) never goes into the
+payload, so it always fits Telegram's 64 byte limit. `CallbackRouter` picks the
+handler by the code character with a dict lookup instead of trying a chain of
+`F.data.startswith(...)` filters, and hands it the decoded payload.
+"""
+
+import base64
+import binascii
+import struct
+from dataclasses import astuple, dataclass
+from typing import Any, Awaitable, Callable, ClassVar, TypeVar
+
+from aiogram.fsm.context import FSMContext
+from aiogram.types import CallbackQuery
+
+from metrics import callback_latency, timed
+
+MAX_CALLBACK_DATA = 64
+
+
+class CallbackPayload:
+    code: ClassVar[str]
+    layout: ClassVar[struct.Struct] = struct.Struct("")
+
+    def pack(self) -> str:
+        raw = self.layout.pack(*astuple(self))  # type: ignore[call-overload]
+        data = self.code + base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+        if len(data.encode()) > MAX_CALLBACK_DATA:
+            raise ValueError(f"Callback data too long: {data!r}")
+        return data
+
+    @classmethod
+    def unpack(cls, data: str) -> "CallbackPayload":
+        body = data[1:]
+        raw = base64.urlsafe_b64decode(body + "=" * (-len(body) % 4))
+        return cls(*cls.layout.unpack(raw))
+
+
+# Codes are upper case so they never collide with the old "category_detail:..." style data
+@dataclass(frozen=True, slots=True)
+class RealEstateMenu(CallbackPayload):
+    code: ClassVar[str] = "A"
+
+
+@dataclass(frozen=True, slots=True)
+class CategoryDetail(CallbackPayload):
+    code: ClassVar[str] = "B"
+    layout: ClassVar[struct.Struct] = struct.Struct("<I")
+    category_id: int
+
+
+@dataclass(frozen=True, slots=True)
+class ChooseCity(CallbackPayload):
+    code: ClassVar[str] = "C"
+    layout: ClassVar[struct.Struct] = struct.Struct("<II")
+    city_id: int
+    region_id: int
+
+
+@dataclass(frozen=True, slots=True)
+class ChooseCurrency(CallbackPayload):
+    code: ClassVar[str] = "D"
+    layout: ClassVar[struct.Struct] = struct.Struct("<B")
+    currency_index: int
+
+
+@dataclass(frozen=True, slots=True)
+class ChoosePriceFrom(CallbackPayload):
+    code: ClassVar[str] = "E"
+    layout: ClassVar[struct.Struct] = struct.Struct("<B")
+    option_index: int
+
+
+@dataclass(frozen=True, slots=True)
+class ChoosePriceTo(CallbackPayload):
+    code: ClassVar[str] = "F"
+    layout: ClassVar[struct.Struct] = struct.Struct("<B")
+    option_index: int
+
+
+@dataclass(frozen=True, slots=True)
+class SetDelivery(CallbackPayload):
+    code: ClassVar[str] = "G"
+    layout: ClassVar[struct.Struct] = struct.Struct("<IB")
+    filter_id: int
+    option_index: int
+
+
+@dataclass(frozen=True, slots=True)
+class DigestPage(CallbackPayload):
+    code: ClassVar[str] = "H"
+    layout: ClassVar[struct.Struct] = struct.Struct("<IH")
+    digest_id: int
+    page: int
+
+
+# /filters pages are keyset-paginated: a page is "after subscription id `anchor`", or before it
+# when `backward`, so the payload does not go stale when subscriptions are added or removed
+@dataclass(frozen=True, slots=True)
+class FiltersPage(CallbackPayload):
+    code: ClassVar[str] = "I"
+    layout: ClassVar[struct.Struct] = struct.Struct("<I?")
+    anchor: int
+    backward: bool
+
+
+@dataclass(frozen=True, slots=True)
+class ToggleFilter(CallbackPayload):
+    code: ClassVar[str] = "J"
+    layout: ClassVar[struct.Struct] = struct.Struct("<II")
+    filter_id: int
+    anchor: int
+
+
+@dataclass(frozen=True, slots=True)
+class DeleteFilter(CallbackPayload):
+    code: ClassVar[str] = "K"
+    layout: ClassVar[struct.Struct] = struct.Struct("<II")
+    filter_id: int
+    anchor: int
+
+
+P = TypeVar("P", bound=CallbackPayload)
+Handler = Callable[[CallbackQuery, FSMContext, Any], Awaitable[None]]
+
+
+class CallbackRouter:
+    def __init__(self) -> None:
+        self._table: dict[str, tuple[type[CallbackPayload], Handler]] = {}
+
+    def route(self, payload_type: type[P]) -> Callable[[Handler], Handler]:
+        def register(handler: Handler) -> Handler:
+            if payload_type.code in self._table:
+                raise ValueError(f"Callback code {payload_type.code!r} is already routed.")
+            self._table[payload_type.code] = (payload_type, handler)
+            return handler
+
+        return register
+
+    def decode(self, data: str | None) -> tuple[CallbackPayload, Handler] | None:
+        if not data:
+            return None
+        entry = self._table.get(data[0])
+        if entry is None:
+            return None
+        payload_type, handler = entry
+        try:
+            return payload_type.unpack(data), handler
+        except (binascii.Error, struct.error, ValueError, TypeError):
+            return None
+
+    async def dispatch(self, callback: CallbackQuery, state: FSMContext) -> bool:
+        """
+        Run the handler for the callback's payload, False if the data is unknown or malformed.
+        """
+        decoded = self.decode(callback.data)
+        if decoded is None:
+            return False
+        payload, handler = decoded
+        with timed(callback_latency, (handler.__name__,)):
+            await handler(callback, state, payload)
+        return True
@@ -0,0 +1,184 @@
+import asyncio
+import os
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+from olx_api import get_city_info
+from olx_policy import OlxUnavailableError
+from utils import remove_duplicate_cities
+
+CITY_CACHE_MAXSIZE = int(os.getenv("CITY_CACHE_MAXSIZE", "10000"))
+CITY_CACHE_TTL = float(os.getenv("CITY_CACHE_TTL", str(24 * 3600)))
+# The geo-encoder returns at most this many rows, a shorter answer is the complete match set.
+CITY_AUTOCOMPLETE_PAGE_SIZE = int(os.getenv("CITY_AUTOCOMPLETE_PAGE_SIZE", "10"))
+MIN_QUERY_LENGTH = 3
+
+_APOSTROPHES = re.compile(r"[’ʼ‘`´ʹ′]")
+_SPACES = re.compile(r"\s+")
+_WORD_SEPARATORS = re.compile(r"[\s\-]+")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Canonical cache key: lower case, single spaces, one apostrophe variant.
+    """
+    query = _APOSTROPHES.sub("'", query.strip().lower())
+    return _SPACES.sub(" ", query)
+
+
+def city_matches(item: dict[str, Any], key: str) -> bool:
+    """
+    True if the city name (or one of its words) starts with the normalised query.
+    """
+    name = normalize_query(item["city"]["name"])
+    return name.startswith(key) or any(word.startswith(key) for word in _WORD_SEPARATORS.split(name))
+
+
+@dataclass(slots=True)
+class _Entry:
+    cities: list[dict[str, Any]]
+    complete: bool
+    expires_at: float
+
+
+class CityCache:
+    """
+    Bounded TTL/LRU cache in front of the OLX geo-encoder.
+
+    Entries hold the already de-duplicated city list, so `remove_duplicate_cities` runs
+    once per upstream response. Concurrent lookups of the same query share one request,
+    and a longer query is answered from a cached complete shorter prefix when possible.
+    Expired entries stay until LRU eviction so they can still be served while OLX is down.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Awaitable[dict[Any, Any]]] = get_city_info,
+        *,
+        maxsize: int = CITY_CACHE_MAXSIZE,
+        ttl: float = CITY_CACHE_TTL,
+        page_size: int = CITY_AUTOCOMPLETE_PAGE_SIZE,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._fetch = fetch
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.page_size = page_size
+        self._clock = clock
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._inflight: dict[str, asyncio.Task[list[dict[str, Any]]]] = {}
+        self.hits = 0
+        self.prefix_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stale_hits = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "prefix_hits": self.prefix_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "stale_hits": self.stale_hits,
+        }
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def _get(self, key: str) -> _Entry | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= self._clock():
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _put(self, key: str, cities: list[dict[str, Any]], complete: bool, expires_at: float | None = None) -> None:
+        if expires_at is None:
+            expires_at = self._clock() + self.ttl
+        self._entries[key] = _Entry(cities=cities, complete=complete, expires_at=expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _from_prefix(self, key: str) -> list[dict[str, Any]] | None:
+        for length in range(len(key) - 1, MIN_QUERY_LENGTH - 1, -1):
+            entry = self._get(key[:length])
+            if entry is not None and entry.complete:
+                cities = [item for item in entry.cities if city_matches(item, key)]
+                # A subset of a complete answer is complete too, and cannot outlive its source.
+                self._put(key, cities, complete=True, expires_at=entry.expires_at)
+                return cities
+        return None
+
+    def _stale(self, key: str) -> list[dict[str, Any]] | None:
+        """
+        Expired answer for `key` or for a complete shorter prefix, the best there is during an outage.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            return entry.cities
+        for length in range(len(key) - 1, MIN_QUERY_LENGTH - 1, -1):
+            entry = self._entries.get(key[:length])
+            if entry is not None and entry.complete:
+                return [item for item in entry.cities if city_matches(item, key)]
+        return None
+
+    async def _load(self, key: str) -> list[dict[str, Any]]:
+        try:
+            data = await self._fetch(key)
+            raw = data.get("data") or []
+            cities = remove_duplicate_cities(raw)
+            self._put(key, cities, complete=len(raw) < self.page_size)
+            return cities
+        finally:
+            self._inflight.pop(key, None)
+
+    async def lookup(self, query: str) -> list[dict[str, Any]]:
+        """
+        Unique cities matching `query`, served from cache when possible.
+        """
+        key = normalize_query(query)
+        if len(key) < MIN_QUERY_LENGTH:
+            raise ValueError("Query must be at least 3 characters long.")
+
+        entry = self._get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry.cities
+
+        cities = self._from_prefix(key)
+        if cities is not None:
+            self.prefix_hits += 1
+            return cities
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(self._load(key))
+            # Keep the exception "retrieved" even if every waiter was cancelled.
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._inflight[key] = task
+        # shield: one cancelled waiter must not cancel the shared upstream request
+        try:
+            return await asyncio.shield(task)
+        except OlxUnavailableError:
+            cities = self._stale(key)
+            if cities is None:
+                raise
+            self.stale_hits += 1
+            return cities
+
+
+# Shared cache for the whole process
+city_cache = CityCache()
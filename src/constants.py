@@ -10,11 +10,23 @@ API_TOKEN = os.getenv("API_TOKEN")
 REAL_ESTATE_BUY_HOUSE = 1602
 REAL_ESTATE_BUY_APPARTMENT = 1758
 
+CATEGORY_OPTIONS = [
+    ("Купити будинок", REAL_ESTATE_BUY_HOUSE),
+    ("Купити квартиру", REAL_ESTATE_BUY_APPARTMENT),
+]
+CATEGORY_NAMES = {category_id: name for name, category_id in CATEGORY_OPTIONS}
+
 # --- Currency options ---
 CURRENCY_UAH = "UAH"
 CURRENCY_USD = "USD"
 CURRENCY_EUR = "EUR"
 
+CURRENCY_OPTIONS = [
+    ("USD - Долар США", CURRENCY_USD),
+    ("UAH - Гривня", CURRENCY_UAH),
+    ("EUR - Євро", CURRENCY_EUR),
+]
+
 # --- Price options ---
 PRICE_FROM_OPTIONS = [
     ("немає", ""),
@@ -34,3 +46,11 @@ PRICE_TO_OPTIONS = [
     ("100 000", "100000"),
     ("1 000 000", "1000000"),
 ]
+
+# --- Delivery options ---
+# (label, delivery mode, digest interval in minutes)
+DELIVERY_OPTIONS = [
+    ("🔔 Одразу", "instant", None),
+    ("🕐 Раз на годину", "batched", 60),
+    ("📰 Раз на день", "daily", None),
+]
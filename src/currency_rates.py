@@ -0,0 +1,70 @@
+import logging
+import os
+import time
+from typing import Callable
+
+import httpx
+
+from models import CurrencyEnum
+
+# National Bank of Ukraine official rates, UAH per unit of currency
+NBU_RATES_URL = os.getenv("NBU_RATES_URL", "https://bank.gov.ua/NBUStatService/v1/statdirectory/exchange?json")
+RATES_REFRESH_PERIOD = float(os.getenv("RATES_REFRESH_PERIOD", str(6 * 3600)))
+# Used until the first successful refresh (or when the NBU API is down)
+FALLBACK_RATES = {
+    CurrencyEnum.UAH: 1.0,
+    CurrencyEnum.USD: float(os.getenv("FALLBACK_RATE_USD", "41.5")),
+    CurrencyEnum.EUR: float(os.getenv("FALLBACK_RATE_EUR", "48.5")),
+}
+
+
+class RateCache:
+    """
+    Conversion rates to UAH for `CurrencyEnum`, refreshed at most once per period.
+
+    `version` changes whenever the rates do, so indexes built on converted prices
+    know when to rebuild.
+    """
+
+    def __init__(
+        self,
+        refresh_period: float = RATES_REFRESH_PERIOD,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.refresh_period = refresh_period
+        self._clock = clock
+        self.rates: dict[str, float] = {currency.value: rate for currency, rate in FALLBACK_RATES.items()}
+        self.version = 0
+        self._refreshed_at: float | None = None
+
+    @property
+    def stale(self) -> bool:
+        return self._refreshed_at is None or self._clock() - self._refreshed_at >= self.refresh_period
+
+    async def refresh(self, force: bool = False) -> None:
+        if not force and not self.stale:
+            return
+        self._refreshed_at = self._clock()
+        try:
+            async with httpx.AsyncClient(timeout=10) as client:
+                response = await client.get(NBU_RATES_URL)
+                response.raise_for_status()
+            by_code = {row["cc"]: float(row["rate"]) for row in response.json()}
+        except Exception as e:
+            logging.warning(f"Currency rates refresh failed, keeping previous rates: {e}")
+            return
+        rates = {currency.value: by_code.get(currency.value, self.rates[currency.value]) for currency in CurrencyEnum}
+        rates[CurrencyEnum.UAH.value] = 1.0
+        if rates != self.rates:
+            self.rates = rates
+            self.version += 1
+
+    def to_uah(self, amount: float, currency: str | None) -> float:
+        """
+        Convert `amount` to UAH; unknown currencies are treated as UAH.
+        """
+        return amount * self.rates.get(currency or CurrencyEnum.UAH.value, 1.0)
+
+
+# Shared rates for the whole process
+rate_cache = RateCache()
@@ -0,0 +1,157 @@
+import asyncio
+import html
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable
+from zoneinfo import ZoneInfo
+
+from aiogram.types import InlineKeyboardMarkup
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from callbacks import DigestPage
+from db import DueDigest, delete_old_digests, get_digest_page, take_due_digests
+from models import DeliveryModeEnum, Digest, DigestOffer
+
+# Default window of batched subscriptions, in minutes
+DIGEST_INTERVAL = int(os.getenv("DIGEST_INTERVAL", "60"))
+DIGEST_DAILY_HOUR = int(os.getenv("DIGEST_DAILY_HOUR", "9"))
+DIGEST_TIMEZONE = ZoneInfo(os.getenv("DIGEST_TIMEZONE", "Europe/Kyiv"))
+DIGEST_PAGE_SIZE = int(os.getenv("DIGEST_PAGE_SIZE", "10"))
+DIGEST_CHECK_INTERVAL = float(os.getenv("DIGEST_CHECK_INTERVAL", "30"))
+# Digests closed per check, the rest wait for the next one
+DIGEST_BATCH = int(os.getenv("DIGEST_BATCH", "500"))
+# Pages of older digests can no longer be turned
+DIGEST_RETENTION = float(os.getenv("DIGEST_RETENTION", str(7 * 24 * 3600)))
+
+SendDigest = Callable[[int, str, InlineKeyboardMarkup | None], None]
+TakeDigests = Callable[[datetime, int], Awaitable[list[DueDigest]]]
+LoadPage = Callable[[int, int, int], Awaitable[tuple[Digest | None, list[DigestOffer]]]]
+
+
+def window_end(mode: DeliveryModeEnum, interval: int | None, now: datetime) -> datetime:
+    """
+    When a digest window opened at `now` closes: `interval` minutes later for batched
+    subscriptions, at the next DIGEST_DAILY_HOUR (local time) for daily ones.
+    """
+    if mode == DeliveryModeEnum.DAILY:
+        local = now.astimezone(DIGEST_TIMEZONE)
+        due = local.replace(hour=DIGEST_DAILY_HOUR, minute=0, second=0, microsecond=0)
+        if due <= local:
+            due += timedelta(days=1)
+        return due.astimezone(timezone.utc)
+    return now + timedelta(minutes=interval or DIGEST_INTERVAL)
+
+
+def render_digest_page(
+    digest_id: int,
+    title: str,
+    offer_count: int,
+    offers: list[DigestOffer],
+    page: int,
+    page_size: int = DIGEST_PAGE_SIZE,
+) -> tuple[str, InlineKeyboardMarkup | None]:
+    """
+    Text and page buttons of one digest page.
+    """
+    pages = max(1, -(-offer_count // page_size))
+    lines = [f"📰 <b>{html.escape(title)}</b>: нових оголошень {offer_count}"]
+    if pages > 1:
+        lines[0] += f" (сторінка {page + 1}/{pages})"
+    for number, offer in enumerate(offers, start=page * page_size + 1):
+        line = f'{number}. <a href="{html.escape(offer.url)}">{html.escape(offer.title)}</a>'
+        if offer.price_label:
+            line += f" — {html.escape(offer.price_label)}"
+        lines.append(line)
+    if pages == 1:
+        return "\n".join(lines), None
+    builder = InlineKeyboardBuilder()
+    if page > 0:
+        builder.button(text="◀️", callback_data=DigestPage(digest_id, page - 1).pack())
+    if page + 1 < pages:
+        builder.button(text="▶️", callback_data=DigestPage(digest_id, page + 1).pack())
+    return "\n".join(lines), builder.as_markup()
+
+
+class DigestScheduler:
+    """
+    Closes due digest windows and sends each as one paginated message.
+
+    Offers for batched and daily subscriptions are buffered in `digestoffer` by the poller
+    (see `ListingPoller`), so windows survive restarts and any bot process can send them.
+    Run it in one process only, next to the notifier.
+    """
+
+    def __init__(
+        self,
+        send: SendDigest,
+        take: TakeDigests = take_due_digests,
+        load_page: LoadPage = get_digest_page,
+        *,
+        check_interval: float = DIGEST_CHECK_INTERVAL,
+        batch: int = DIGEST_BATCH,
+        page_size: int = DIGEST_PAGE_SIZE,
+        retention: float = DIGEST_RETENTION,
+        clock: Callable[[], datetime] = lambda: datetime.now(timezone.utc),
+    ) -> None:
+        self._send = send
+        self._take = take
+        self._load_page = load_page
+        self.check_interval = check_interval
+        self.batch = batch
+        self.page_size = page_size
+        self.retention = retention
+        self._clock = clock
+        self._task: asyncio.Task[None] | None = None
+        self._cleaned_at: datetime | None = None
+        self.digests_sent = 0
+        self.offers_sent = 0
+
+    def stats(self) -> dict[str, float]:
+        return {"digests_sent": self.digests_sent, "offers_sent": self.offers_sent}
+
+    async def run_once(self) -> int:
+        """
+        Send every digest due now, returns how many were sent.
+        """
+        now = self._clock()
+        sent = 0
+        while True:
+            due = await self._take(now, self.batch)
+            for digest in due:
+                _, offers = await self._load_page(digest.digest_id, 0, self.page_size)
+                text, markup = render_digest_page(
+                    digest.digest_id, digest.title, digest.offer_count, offers, 0, self.page_size
+                )
+                self._send(digest.chat_id, text, markup)
+                self.offers_sent += digest.offer_count
+            sent += len(due)
+            if len(due) < self.batch:
+                break
+        self.digests_sent += sent
+        if self._cleaned_at is None or now - self._cleaned_at >= timedelta(hours=1):
+            self._cleaned_at = now
+            await delete_old_digests(now - timedelta(seconds=self.retention))
+        return sent
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logging.exception("Sending digests failed.")
+            await asyncio.sleep(self.check_interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run(), name="digest-scheduler")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
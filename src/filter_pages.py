@@ -0,0 +1,207 @@
+"""
+/filters: the user's subscriptions, a few per message, with pause/resume and delete buttons.
+
+Pages are keyset-paginated by subscription id ("after id N" / "before id N", see
+`db.user_filters_page_query`), so paging stays one index range scan however many filters a
+user has, and a page button stays valid when subscriptions before it are added or removed.
+Rendered pages are cached per user until that user's subscriptions change.
+"""
+
+import html
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from aiogram.types import InlineKeyboardMarkup
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from callbacks import DeleteFilter, FiltersPage, ToggleFilter
+from constants import DELIVERY_OPTIONS
+from db import get_user_filters_page
+from models import SearchFilter, UserSearchFilters
+
+FILTERS_PAGE_SIZE = int(os.getenv("FILTERS_PAGE_SIZE", "5"))
+# Users whose rendered pages are kept
+FILTERS_CACHE_SIZE = int(os.getenv("FILTERS_CACHE_SIZE", "10000"))
+# Each webhook worker caches its own pages; changes made through another one arrive through
+# webhook.SubscriptionFeed, this is the bound if that is not running
+FILTERS_CACHE_TTL = float(os.getenv("FILTERS_CACHE_TTL", "60"))
+
+NO_FILTERS = "У вас ще немає фільтрів. Налаштуйте пошук через /start."
+
+Row = tuple[UserSearchFilters, SearchFilter]
+LoadFiltersPage = Callable[[int, int, bool, int], Awaitable[list[Row]]]
+# (telegram_id, filter, subscription, active): a subscription was resumed, paused or deleted
+SubscriptionListener = Callable[[int, SearchFilter, UserSearchFilters, bool], None]
+
+
+def describe_prices(search_filter: SearchFilter) -> str:
+    currency = search_filter.currency.value
+    low, high = search_filter.price_from, search_filter.price_to
+    if low and high:
+        return f"{low}–{high} {currency}"
+    if low:
+        return f"від {low} {currency}"
+    if high:
+        return f"до {high} {currency}"
+    return f"будь-яка ціна, {currency}"
+
+
+def describe_delivery(subscription: UserSearchFilters) -> str:
+    mode = subscription.delivery_mode.value
+    return next((label for label, option, _ in DELIVERY_OPTIONS if option == mode), mode)
+
+
+def render_filters_page(rows: list[Row], has_prev: bool, has_next: bool) -> tuple[str, InlineKeyboardMarkup | None]:
+    """
+    Text and buttons of one /filters page; `rows` in subscription id order.
+    """
+    if not rows:
+        return NO_FILTERS, None
+    # Actions re-render the page they were pressed on: the one right after its first id
+    anchor = (rows[0][0].id or 1) - 1
+    lines = ["📋 <b>Ваші фільтри</b>"]
+    builder = InlineKeyboardBuilder()
+    for number, (subscription, search_filter) in enumerate(rows, start=1):
+        filter_id = subscription.search_filter_id
+        status = "⏸ на паузі" if subscription.paused else describe_delivery(subscription)
+        lines.append(
+            f"\n{number}. <b>{html.escape(search_filter.filter_name)}</b>\n"
+            f"    {describe_prices(search_filter)} · {status}"
+        )
+        toggle = f"▶️ {number}" if subscription.paused else f"⏸ {number}"
+        builder.button(text=toggle, callback_data=ToggleFilter(filter_id, anchor).pack())
+        builder.button(text=f"🗑 {number}", callback_data=DeleteFilter(filter_id, anchor).pack())
+    if has_prev:
+        builder.button(text="◀️", callback_data=FiltersPage(rows[0][0].id or 0, True).pack())
+    if has_next:
+        builder.button(text="▶️", callback_data=FiltersPage(rows[-1][0].id or 0, False).pack())
+    builder.adjust(*([2] * len(rows)), 2)
+    return "\n".join(lines), builder.as_markup()
+
+
+@dataclass(slots=True)
+class _Page:
+    text: str
+    markup: InlineKeyboardMarkup | None
+    expires_at: float
+
+
+class FilterPages:
+    """
+    Rendered /filters pages per user (bounded LRU of users) and the hook for subscription changes.
+
+    `changed()` drops the user's pages and tells `listeners`, e.g. the embedded poller, so a
+    pause or delete takes effect without reloading every subscription.
+    """
+
+    def __init__(
+        self,
+        load: LoadFiltersPage = get_user_filters_page,
+        *,
+        page_size: int = FILTERS_PAGE_SIZE,
+        maxsize: int = FILTERS_CACHE_SIZE,
+        ttl: float = FILTERS_CACHE_TTL,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._load = load
+        self.page_size = page_size
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        # telegram_id -> (anchor, backward) -> page, least recently used user first
+        self._users: OrderedDict[int, dict[tuple[int, bool], _Page]] = OrderedDict()
+        # Bumped by every invalidation, so a page loaded meanwhile is not cached
+        self._changes = 0
+        self.listeners: list[SubscriptionListener] = []
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "users": len(self._users),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+    async def _fetch(self, telegram_id: int, anchor: int, backward: bool) -> tuple[list[Row], bool, bool]:
+        """
+        One page in id order, and whether there are subscriptions before and after it.
+        """
+        rows = await self._load(telegram_id, anchor, backward, self.page_size + 1)
+        more = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        if backward:
+            rows.reverse()
+        if not rows:
+            return rows, False, False
+        if backward:
+            return rows, more, await self._exists(telegram_id, rows[-1][0].id or 0, False)
+        # Other users' subscriptions interleave with the ids, so a non-zero anchor proves nothing
+        return rows, anchor > 0 and await self._exists(telegram_id, rows[0][0].id or 0, True), more
+
+    async def _exists(self, telegram_id: int, anchor: int, backward: bool) -> bool:
+        return bool(await self._load(telegram_id, anchor, backward, 1))
+
+    async def _build(self, telegram_id: int, anchor: int, backward: bool) -> tuple[str, InlineKeyboardMarkup | None]:
+        rows, has_prev, has_next = await self._fetch(telegram_id, anchor, backward)
+        if not rows and not backward and anchor:
+            # Everything from the anchor on is gone, show the last page instead
+            rows, has_prev, has_next = await self._fetch(telegram_id, anchor + 1, True)
+        if not rows and anchor:
+            rows, has_prev, has_next = await self._fetch(telegram_id, 0, False)
+        return render_filters_page(rows, has_prev, has_next)
+
+    async def get(
+        self, telegram_id: int, anchor: int = 0, backward: bool = False
+    ) -> tuple[str, InlineKeyboardMarkup | None]:
+        """
+        Text and buttons of the page after subscription id `anchor` (before it if `backward`).
+        """
+        now = self._clock()
+        pages = self._users.get(telegram_id)
+        page = pages.get((anchor, backward)) if pages is not None else None
+        if pages is not None and page is not None and page.expires_at > now:
+            self.hits += 1
+            self._users.move_to_end(telegram_id)
+            return page.text, page.markup
+        self.misses += 1
+        changes = self._changes
+        text, markup = await self._build(telegram_id, anchor, backward)
+        if changes == self._changes:
+            pages = self._users.setdefault(telegram_id, {})
+            pages[(anchor, backward)] = _Page(text, markup, now + self.ttl)
+            self._users.move_to_end(telegram_id)
+            while len(self._users) > self.maxsize:
+                self._users.popitem(last=False)
+        return text, markup
+
+    def invalidate(self, telegram_id: int) -> None:
+        self._changes += 1
+        if self._users.pop(telegram_id, None) is not None:
+            self.invalidations += 1
+
+    def changed(
+        self, telegram_id: int, search_filter: SearchFilter, subscription: UserSearchFilters, active: bool
+    ) -> None:
+        """
+        A subscription of `telegram_id` was resumed (`active`), paused or deleted.
+        """
+        self.invalidate(telegram_id)
+        for listener in self.listeners:
+            try:
+                listener(telegram_id, search_filter, subscription, active)
+            except Exception:
+                logging.exception(f"Subscription listener failed for filter {search_filter.id}.")
+
+
+# Shared for the whole process
+filter_pages = FilterPages()
@@ -0,0 +1,231 @@
+"""
+Persistent FSM storage for the search wizard.
+
+`BufferedStorage` keeps every read and write made while one update is handled in a
+per-update buffer and writes the final state/data once, when `FSMBatchMiddleware` sees
+the handler finish. Backends only need `read`/`write`/`close`; state is stored as compact
+JSON with an expiry so abandoned wizards disappear on their own.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Mapping, Protocol
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import TelegramObject
+
+from db import delete_expired_fsm_states, get_fsm_state, set_fsm_state
+
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite")  # memory | sqlite | postgres
+FSM_SQLITE_PATH = Path(os.getenv("FSM_SQLITE_PATH", "data/fsm.sqlite3"))
+FSM_STATE_TTL = float(os.getenv("FSM_STATE_TTL", str(24 * 3600)))
+# Expired rows are purged every this many writes
+FSM_PURGE_EVERY = 1000
+
+Record = tuple[str | None, dict[str, Any]]
+
+
+def storage_key_str(key: StorageKey) -> str:
+    return ":".join(
+        str(part or "")
+        for part in (key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny)
+    )
+
+
+def dump_data(data: Mapping[str, Any]) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+class FSMBackend(Protocol):
+    async def read(self, key: str) -> Record | None: ...
+
+    async def write(self, key: str, state: str | None, data: Mapping[str, Any]) -> None: ...
+
+    async def close(self) -> None: ...
+
+
+class SQLiteFSMBackend:
+    def __init__(self, path: Path = FSM_SQLITE_PATH, ttl: float = FSM_STATE_TTL) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fsm_state "
+            "(key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._purge()
+
+    def _purge(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM fsm_state WHERE expires_at <= ?", (time.time(),))
+
+    def _read(self, key: str) -> Record | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state, data FROM fsm_state WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def _write(self, key: str, state: str | None, data: Mapping[str, Any]) -> None:
+        with self._lock:
+            if state is None and not data:
+                self._conn.execute("DELETE FROM fsm_state WHERE key = ?", (key,))
+            else:
+                self._conn.execute(
+                    "INSERT INTO fsm_state (key, state, data, expires_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data, "
+                    "expires_at = excluded.expires_at",
+                    (key, state, dump_data(data), time.time() + self.ttl),
+                )
+            self._writes += 1
+        if self._writes % FSM_PURGE_EVERY == 0:
+            self._purge()
+
+    async def read(self, key: str) -> Record | None:
+        return await asyncio.to_thread(self._read, key)
+
+    async def write(self, key: str, state: str | None, data: Mapping[str, Any]) -> None:
+        await asyncio.to_thread(self._write, key, state, data)
+
+    async def close(self) -> None:
+        self._conn.close()
+
+
+class PostgresFSMBackend:
+    """
+    Shared between bot instances, lives in the `fsmstate` table.
+    """
+
+    def __init__(self, ttl: float = FSM_STATE_TTL) -> None:
+        self.ttl = ttl
+        self._writes = 0
+
+    async def read(self, key: str) -> Record | None:
+        return await get_fsm_state(key)
+
+    async def write(self, key: str, state: str | None, data: Mapping[str, Any]) -> None:
+        await set_fsm_state(key, state, dump_data(data), self.ttl)
+        self._writes += 1
+        if self._writes % FSM_PURGE_EVERY == 0:
+            await delete_expired_fsm_states()
+
+    async def close(self) -> None:
+        pass
+
+
+@dataclass(slots=True)
+class _Pending:
+    state: str | None
+    data: dict[str, Any]
+    dirty: bool = False
+
+
+# Buffer of the update being handled, set by FSMBatchMiddleware
+_batch: ContextVar[dict[str, _Pending] | None] = ContextVar("fsm_batch", default=None)
+
+
+class BufferedStorage(BaseStorage):
+    def __init__(self, backend: FSMBackend) -> None:
+        self.backend = backend
+        self.reads = 0
+        self.writes = 0
+
+    async def _load(self, key: StorageKey) -> _Pending:
+        skey = storage_key_str(key)
+        batch = _batch.get()
+        if batch is not None and skey in batch:
+            return batch[skey]
+        self.reads += 1
+        record = await self.backend.read(skey)
+        pending = _Pending(state=record[0], data=record[1]) if record else _Pending(state=None, data={})
+        if batch is not None:
+            batch[skey] = pending
+        return pending
+
+    async def _store(self, key: StorageKey, pending: _Pending) -> None:
+        batch = _batch.get()
+        if batch is not None:
+            pending.dirty = True
+            batch[storage_key_str(key)] = pending
+            return
+        self.writes += 1
+        await self.backend.write(storage_key_str(key), pending.state, pending.data)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        pending = await self._load(key)
+        pending.state = state.state if isinstance(state, State) else state
+        await self._store(key, pending)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return (await self._load(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        pending = await self._load(key)
+        pending.data = dict(data)
+        await self._store(key, pending)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return dict((await self._load(key)).data)
+
+    async def flush(self, batch: dict[str, _Pending]) -> None:
+        for skey, pending in batch.items():
+            if pending.dirty:
+                self.writes += 1
+                await self.backend.write(skey, pending.state, pending.data)
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+
+class FSMBatchMiddleware(BaseMiddleware):
+    """
+    Outer update middleware: one storage read and write per touched key per update.
+
+    Register it ahead of aiogram's FSMContextMiddleware (see `create_bot_app`), which reads
+    the state of every update before any handler runs.
+    """
+
+    def __init__(self, storage: BufferedStorage) -> None:
+        self.storage = storage
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        batch: dict[str, _Pending] = {}
+        token = _batch.set(batch)
+        try:
+            return await handler(event, data)
+        finally:
+            _batch.reset(token)
+            try:
+                await self.storage.flush(batch)
+            except Exception:
+                logging.exception("Failed to flush FSM state.")
+
+
+def create_fsm_storage(kind: str = FSM_STORAGE) -> BaseStorage:
+    if kind == "memory":
+        return MemoryStorage()
+    if kind == "sqlite":
+        return BufferedStorage(SQLiteFSMBackend())
+    if kind == "postgres":
+        return BufferedStorage(PostgresFSMBackend())
+    raise ValueError(f"Unknown FSM_STORAGE '{kind}', expected memory, sqlite or postgres.")
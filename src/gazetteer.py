@@ -0,0 +1,331 @@
+"""
+Offline gazetteer of OLX cities for instant autocomplete.
+
+On-disk format (little endian), read through mmap without loading it into memory:
+
+    header   magic(8s) record_count(u32) blob_size(u32)
+    records  record_count x RECORD, sorted by search key
+    blob     utf-8 strings referenced by (offset, length) from the records
+
+Search keys are transliterated to latin and folded (`и/і/ї/й/y -> i`, `г/ґ/g -> h`, ...)
+so "Київ", "kyiv" and "Kiiv" land on the same prefix range.
+"""
+
+import argparse
+import asyncio
+import bisect
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Sequence
+
+GAZETTEER_PATH = Path(os.getenv("GAZETTEER_PATH", "data/gazetteer.bin"))
+# Flush learned cities to disk (in a worker thread) once this many are pending.
+GAZETTEER_FLUSH_THRESHOLD = int(os.getenv("GAZETTEER_FLUSH_THRESHOLD", "500"))
+
+MAGIC = b"OLXGAZ01"
+HEADER = struct.Struct("<8sII")
+# key_off, key_len, city_id, region_id, name_off, name_len, region_off, region_len
+RECORD = struct.Struct("<IHIIIHIH")
+
+_TRANSLIT = str.maketrans(
+    {
+        "а": "a", "б": "b", "в": "v", "г": "h", "ґ": "h", "д": "d", "е": "e", "є": "e", "ё": "e",
+        "ж": "zh", "з": "z", "и": "i", "і": "i", "ї": "i", "й": "i", "к": "k", "л": "l", "м": "m",
+        "н": "n", "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "kh",
+        "ц": "ts", "ч": "ch", "ш": "sh", "щ": "shch", "ь": "", "ъ": "", "ы": "i", "э": "e",
+        "ю": "iu", "я": "ia", "y": "i", "g": "h", "'": "", "’": "", "ʼ": "", "`": "",
+    }
+)  # fmt: skip
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def search_key(text: str) -> str:
+    """
+    Transliterated, folded key used both for indexing and for queries.
+    """
+    return _NON_WORD.sub(" ", text.lower().translate(_TRANSLIT)).strip()
+
+
+def _index_keys(name: str) -> list[str]:
+    """
+    Full name plus every later word, so "Біла Церква" is found by "церк" as well.
+    """
+    key = search_key(name)
+    words = key.split(" ")
+    return [key] + [" ".join(words[i:]) for i in range(1, len(words))]
+
+
+def _as_item(city_id: int, name: str, region_id: int, region_name: str) -> dict[str, Any]:
+    # Same shape as a geo-encoder "data" row, so handlers do not care where it came from.
+    return {"city": {"id": city_id, "name": name}, "region": {"id": region_id, "name": region_name}}
+
+
+class _KeyView(Sequence[bytes]):
+    """
+    Sorted record keys straight from the mmap, good enough for `bisect`.
+    """
+
+    def __init__(self, buf: mmap.mmap, count: int, blob_start: int) -> None:
+        self._buf = buf
+        self._count = count
+        self._blob_start = blob_start
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: int) -> bytes:  # type: ignore[override]
+        key_off, key_len = struct.unpack_from("<IH", self._buf, HEADER.size + index * RECORD.size)
+        start = self._blob_start + key_off
+        return self._buf[start : start + key_len]
+
+
+class Gazetteer:
+    def __init__(self, path: Path = GAZETTEER_PATH) -> None:
+        self.path = path
+        self._file: Any = None
+        self._buf: mmap.mmap | None = None
+        self._keys: _KeyView | None = None
+        self._blob_start = 0
+        # Cities learned from live results since the last flush: sorted (key, item) pairs.
+        self._pending: list[tuple[str, int, dict[str, Any]]] = []
+        self._known_ids: set[int] = set()
+        self._flush_task: asyncio.Task[None] | None = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return (len(self._keys) if self._keys is not None else 0) + len(self._pending)
+
+    # --- Loading ---
+    def open(self) -> None:
+        if not self._map():
+            logging.info(f"Gazetteer {self.path} not found, starting empty.")
+            return
+        self._known_ids = {record[2] for record in self._iter_raw()}
+        logging.info(f"Gazetteer loaded: {len(self._keys or ())} keys from {self.path}.")
+
+    def _map(self) -> bool:
+        self.close()
+        if not self.path.exists() or self.path.stat().st_size < HEADER.size:
+            return False
+        self._file = open(self.path, "rb")
+        self._buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, _ = HEADER.unpack_from(self._buf, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{self.path} is not a gazetteer file.")
+        self._blob_start = HEADER.size + count * RECORD.size
+        self._keys = _KeyView(self._buf, count, self._blob_start)
+        return True
+
+    def close(self) -> None:
+        if self._buf is not None:
+            self._buf.close()
+        if self._file is not None:
+            self._file.close()
+        self._buf = self._file = self._keys = None
+
+    def _iter_raw(self) -> Iterator[tuple[int, ...]]:
+        assert self._buf is not None and self._keys is not None
+        for i in range(len(self._keys)):
+            yield RECORD.unpack_from(self._buf, HEADER.size + i * RECORD.size)
+
+    def _string(self, offset: int, length: int) -> str:
+        assert self._buf is not None
+        start = self._blob_start + offset
+        return self._buf[start : start + length].decode()
+
+    def _record(self, index: int) -> tuple[str, dict[str, Any]]:
+        assert self._buf is not None
+        key_off, key_len, city_id, region_id, name_off, name_len, region_off, region_len = RECORD.unpack_from(
+            self._buf, HEADER.size + index * RECORD.size
+        )
+        item = _as_item(city_id, self._string(name_off, name_len), region_id, self._string(region_off, region_len))
+        return self._string(key_off, key_len), item
+
+    def items(self) -> Iterator[dict[str, Any]]:
+        """
+        Every distinct city known to the index (file and pending).
+        """
+        return self._items(self._pending)
+
+    def _items(self, pending: list[tuple[str, int, dict[str, Any]]]) -> Iterator[dict[str, Any]]:
+        seen: set[int] = set()
+        if self._keys is not None:
+            for i in range(len(self._keys)):
+                _, item = self._record(i)
+                if item["city"]["id"] not in seen:
+                    seen.add(item["city"]["id"])
+                    yield item
+        for _, city_id, item in pending:
+            if city_id not in seen:
+                seen.add(city_id)
+                yield item
+
+    # --- Lookups ---
+    def search(self, query: str, limit: int = 5) -> list[dict[str, Any]]:
+        """
+        Cities whose name (or a word of it) starts with `query`, exact matches first.
+        """
+        key = search_key(query)
+        if not key:
+            return []
+        found: dict[int, tuple[bool, int, dict[str, Any]]] = {}
+
+        def collect(record_key: str, item: dict[str, Any]) -> None:
+            city_id = item["city"]["id"]
+            rank = (record_key != key, len(item["city"]["name"]), item)
+            if city_id not in found or rank[:2] < found[city_id][:2]:
+                found[city_id] = rank
+
+        if self._keys is not None:
+            encoded = key.encode()
+            index = bisect.bisect_left(self._keys, encoded)
+            while index < len(self._keys) and self._keys[index].startswith(encoded):
+                collect(*self._record(index))
+                index += 1
+        index = bisect.bisect_left(self._pending, (key,))
+        while index < len(self._pending) and self._pending[index][0].startswith(key):
+            collect(self._pending[index][0], self._pending[index][2])
+            index += 1
+
+        if not found:
+            self.misses += 1
+            return []
+        self.hits += 1
+        ranked = sorted(found.values(), key=lambda rank: rank[:2])
+        return [item for _, _, item in ranked[:limit]]
+
+    def complete(self, query: str, results: list[dict[str, Any]], limit: int = 5) -> bool:
+        """
+        Whether `search` results can stand in for a live lookup: a full page, or a city named
+        exactly `query`. Fewer prefix matches may just be the ones the index has learned so far.
+        """
+        key = search_key(query)
+        return len(results) >= limit or any(search_key(item["city"]["name"]) == key for item in results)
+
+    # --- Incremental refresh ---
+    def add(self, items: Iterable[dict[str, Any]]) -> int:
+        """
+        Learn cities from live geo-encoder rows, returns how many were new.
+        """
+        added = 0
+        for item in items:
+            city_id = int(item["city"]["id"])
+            if city_id in self._known_ids:
+                continue
+            self._known_ids.add(city_id)
+            for key in _index_keys(item["city"]["name"]):
+                bisect.insort(self._pending, (key, city_id, item))
+            added += 1
+        if len(self._pending) >= GAZETTEER_FLUSH_THRESHOLD and self._flush_task is None:
+            try:
+                self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+            except RuntimeError:
+                # No running event loop, nothing to block
+                self._write(list(self._pending))
+        return added
+
+    async def flush(self) -> None:
+        """
+        Merge learned cities into the on-disk file; the rewrite runs in a worker thread.
+        """
+        if self._flush_task is not None and self._flush_task is not asyncio.current_task():
+            await self._flush_task
+        try:
+            if self._pending:
+                # Cities learned meanwhile stay pending for the next flush
+                pending = list(self._pending)
+                await asyncio.to_thread(write_gazetteer, self.path, list(self._items(pending)))
+                self._reopen({city_id for _, city_id, _ in pending})
+        finally:
+            if self._flush_task is asyncio.current_task():
+                self._flush_task = None
+
+    def _write(self, pending: list[tuple[str, int, dict[str, Any]]]) -> None:
+        write_gazetteer(self.path, list(self._items(pending)))
+        self._reopen({city_id for _, city_id, _ in pending})
+
+    def _reopen(self, written: set[int]) -> None:
+        # Known ids already cover the new file, no need to scan it again
+        self._pending = [entry for entry in self._pending if entry[1] not in written]
+        self._map()
+
+
+def write_gazetteer(path: Path, items: Iterable[dict[str, Any]]) -> int:
+    """
+    Write geo-encoder rows as a gazetteer file (atomically), returns the key count.
+    """
+    blob = bytearray()
+    offsets: dict[str, tuple[int, int]] = {}
+
+    def intern(text: str) -> tuple[int, int]:
+        if text not in offsets:
+            encoded = text.encode()
+            offsets[text] = (len(blob), len(encoded))
+            blob.extend(encoded)
+        return offsets[text]
+
+    rows = []
+    seen: set[int] = set()
+    for item in items:
+        city_id = int(item["city"]["id"])
+        if city_id in seen:
+            continue
+        seen.add(city_id)
+        name, region = item["city"]["name"], item["region"]
+        for key in _index_keys(name):
+            rows.append((key.encode(), key, city_id, int(region["id"]), name, region["name"]))
+    rows.sort(key=lambda row: row[0])
+
+    records = bytearray()
+    for _, key, city_id, region_id, name, region_name in rows:
+        key_off, key_len = intern(key)
+        name_off, name_len = intern(name)
+        region_off, region_len = intern(region_name)
+        records += RECORD.pack(key_off, key_len, city_id, region_id, name_off, name_len, region_off, region_len)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(rows), len(blob)))
+        f.write(records)
+        f.write(blob)
+    os.replace(tmp_path, path)
+    return len(rows)
+
+
+def _harvested_items(paths: Iterable[Path]) -> Iterator[dict[str, Any]]:
+    """
+    Rows from saved `location-autocomplete` responses (.json, or .jsonl with one per line).
+    """
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            documents = [json.loads(line) for line in f if line.strip()] if path.suffix == ".jsonl" else [json.load(f)]
+        for document in documents:
+            for item in document.get("data") or []:
+                if item.get("city") and item.get("region"):
+                    yield item
+
+
+# Shared index for the whole process
+gazetteer = Gazetteer()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Build the offline OLX city gazetteer.")
+    parser.add_argument("responses", nargs="+", type=Path, help="harvested location-autocomplete responses")
+    parser.add_argument("-o", "--output", type=Path, default=GAZETTEER_PATH)
+    args = parser.parse_args(argv)
+    count = write_gazetteer(args.output, _harvested_items(args.responses))
+    print(f"Wrote {count} keys to {args.output}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,158 @@
+"""
+Offer-to-filter matching for one fetched batch.
+
+Filters are indexed per upstream query (city/region/category) as price intervals
+normalised to UAH; filters with the same interval share one entry (the wizard only
+offers a handful of price options). A batch of offers is matched in a single sweep:
+offers sorted by price, intervals entering by lower bound and leaving (via a heap) by
+upper bound, so the cost depends on distinct intervals rather than offers x filters.
+"""
+
+import heapq
+import math
+from dataclasses import dataclass
+from typing import Hashable, Iterable
+
+from currency_rates import RateCache, rate_cache
+from models import SearchFilter
+from offers import Offer
+
+
+@dataclass(frozen=True, slots=True)
+class MatchFilter:
+    filter_id: int
+    currency: str
+    price_from: int | None = None
+    price_to: int | None = None
+
+    @classmethod
+    def from_filter(cls, search_filter: SearchFilter) -> "MatchFilter":
+        assert search_filter.id is not None
+        return cls(
+            filter_id=search_filter.id,
+            currency=str(search_filter.currency.value if search_filter.currency else "UAH"),
+            price_from=search_filter.price_from,
+            price_to=search_filter.price_to,
+        )
+
+    @property
+    def unbounded(self) -> bool:
+        return self.price_from is None and self.price_to is None
+
+
+@dataclass(slots=True)
+class _Bucket:
+    signature: int
+    rates_version: int
+    # Parallel lists of distinct intervals (UAH) sorted by lower bound
+    lows: list[float]
+    highs: list[float]
+    # Interval index -> filter ids with exactly that interval
+    groups: list[list[int]]
+    # Filters without any bound also take offers with no price
+    unbounded: list[int]
+
+
+def offer_price_uah(offer: Offer, rates: RateCache) -> float | None:
+    if offer.price_value is None:
+        return None
+    if offer.price_uah is not None:
+        return offer.price_uah
+    return rates.to_uah(offer.price_value, offer.price_currency)
+
+
+def build_bucket(filters: list[MatchFilter], rates: RateCache, signature: int) -> _Bucket:
+    intervals: dict[tuple[float, float], list[int]] = {}
+    for f in filters:
+        low = rates.to_uah(f.price_from, f.currency) if f.price_from is not None else -math.inf
+        high = rates.to_uah(f.price_to, f.currency) if f.price_to is not None else math.inf
+        intervals.setdefault((low, high), []).append(f.filter_id)
+    ordered = sorted(intervals)
+    return _Bucket(
+        signature=signature,
+        rates_version=rates.version,
+        lows=[low for low, _ in ordered],
+        highs=[high for _, high in ordered],
+        groups=[intervals[interval] for interval in ordered],
+        unbounded=[f.filter_id for f in filters if f.unbounded],
+    )
+
+
+def sweep(bucket: _Bucket, prices: list[float | None]) -> dict[int, list[int]]:
+    """
+    Interval index -> indexes of `prices` inside that [low, high] range.
+
+    Consecutive offers between two interval end points share the same active filters,
+    so they are handed out as one run instead of offer by offer.
+    """
+    matches: dict[int, list[int]] = {}
+    priced = sorted((price, index) for index, price in enumerate(prices) if price is not None)
+    active: list[tuple[float, int]] = []
+    lows, highs = bucket.lows, bucket.highs
+    next_filter, total = 0, len(lows)
+    run: list[int] = []
+
+    def flush() -> None:
+        if run:
+            for _, interval in active:
+                matches.setdefault(interval, []).extend(run)
+
+    for price, index in priced:
+        if (next_filter < total and lows[next_filter] <= price) or (active and active[0][0] < price):
+            flush()
+            run = []
+            while next_filter < total and lows[next_filter] <= price:
+                heapq.heappush(active, (highs[next_filter], next_filter))
+                next_filter += 1
+            while active and active[0][0] < price:
+                heapq.heappop(active)
+        run.append(index)
+    flush()
+
+    return matches
+
+
+class FilterMatcher:
+    def __init__(self, rates: RateCache = rate_cache) -> None:
+        self.rates = rates
+        self._buckets: dict[Hashable, _Bucket] = {}
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def index(self, key: Hashable, filters: Iterable[MatchFilter]) -> None:
+        """
+        (Re)build the interval index of `key` if its filters or the rates changed.
+        """
+        filters = list(filters)
+        signature = hash(frozenset(filters))
+        bucket = self._buckets.get(key)
+        if bucket is None or bucket.signature != signature or bucket.rates_version != self.rates.version:
+            self._buckets[key] = build_bucket(filters, self.rates, signature)
+
+    def drop(self, key: Hashable) -> None:
+        self._buckets.pop(key, None)
+
+    def keys(self) -> list[Hashable]:
+        return list(self._buckets)
+
+    def match(self, key: Hashable, offers: list[Offer]) -> dict[int, list[Offer]]:
+        """
+        Filter id -> offers of the batch within the filter's price range.
+
+        Filters with the same interval get the same list object; callers must not mutate it.
+        """
+        bucket = self._buckets.get(key)
+        if bucket is None or not offers:
+            return {}
+        prices = [offer_price_uah(offer, self.rates) for offer in offers]
+        result: dict[int, list[Offer]] = {}
+        for interval, indexes in sweep(bucket, prices).items():
+            matched = [offers[index] for index in indexes]
+            for filter_id in bucket.groups[interval]:
+                result[filter_id] = matched
+        unpriced = [offer for offer, price in zip(offers, prices) if price is None]
+        if unpriced:
+            for filter_id in bucket.unbounded:
+                result[filter_id] = result.get(filter_id, []) + unpriced
+        return result
@@ -0,0 +1,330 @@
+"""
+Prometheus text-format metrics without extra dependencies.
+
+Everything is off unless `METRICS_ENABLED` is set: no middleware is registered, the DB engine
+is not instrumented and `timed()` hands out a shared no-op context manager, so the hot paths
+only pay for one attribute check. Exposed on `/metrics` by `start_server()` (polling mode and
+poller workers) or by the webhook application itself.
+
+`db`, `olx_api` and the poller import this module, so aiogram and aiohttp are only imported
+where they are used: tools and workers that never build a bot do not pay for them.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from bisect import bisect_left
+from contextlib import AbstractContextManager, nullcontext
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Iterable,
+    Iterator,
+    Mapping,
+    TypeVar,
+)
+
+from sqlalchemy import event
+from sqlalchemy.engine import ExceptionContext
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+if TYPE_CHECKING:
+    from aiogram import Dispatcher
+    from aiogram.types import TelegramObject
+    from aiohttp import web
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() in ("1", "true", "yes")
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+LOOP_LAG_INTERVAL = float(os.getenv("METRICS_LOOP_LAG_INTERVAL", "0.5"))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Labels = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Labels = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """
+    Counter or gauge: `inc()` from the hot path, `set()` from scrape-time collectors.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Labels = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.values: dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, labels: Labels = ()) -> None:
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def set(self, value: float, labels: Labels = ()) -> None:
+        self.values[labels] = value
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in self.values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Labels = (), buckets: tuple[float, ...] = LATENCY_BUCKETS
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._series: dict[Labels, list[float]] = {}
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def time(self, labels: Labels = ()) -> "Timer":
+        return Timer(self, labels)
+
+    def samples(self) -> Iterator[str]:
+        for labels, series in self._series.items():
+            cumulative = 0.0
+            for bound, count in zip((*self.buckets, float("inf")), series):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {series[-1]}"
+
+
+class Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels: Labels) -> None:
+        self.histogram = histogram
+        self.labels = labels
+        self.started = 0.0
+
+    def __enter__(self) -> "Timer":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.histogram.observe(time.perf_counter() - self.started, self.labels)
+
+
+M = TypeVar("M", bound=Metric)
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, Metric] = {}
+        self._collectors: list[Callable[[], None]] = []
+
+    def register(self, metric: M) -> M:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered.")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collect: Callable[[], None]) -> None:
+        """
+        `collect` runs before every scrape, for values that are cheaper to read than to track.
+        """
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        for collect in self._collectors:
+            try:
+                collect()
+            except Exception:
+                logging.exception("Metrics collector failed.")
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+# Shared registry and the metrics every process reports
+registry = Registry()
+handler_latency = registry.register(
+    Histogram("bot_handler_seconds", "Time spent in aiogram handlers.", ("event", "handler"))
+)
+handler_errors = registry.register(
+    Counter("bot_handler_errors_total", "Aiogram handlers that raised.", ("event", "handler"))
+)
+olx_latency = registry.register(Histogram("olx_request_seconds", "OLX API request latency.", ("path", "status")))
+db_latency = registry.register(Histogram("db_query_seconds", "Database statement time.", ("statement",)))
+callback_latency = registry.register(
+    Histogram("bot_callback_route_seconds", "Time spent in routed callback handlers.", ("route",))
+)
+loop_lag = registry.register(Gauge("event_loop_lag_seconds", "Last measured event loop scheduling delay."))
+loop_lag_histogram = registry.register(Histogram("event_loop_lag_distribution_seconds", "Event loop scheduling delay."))
+component_stats = registry.register(
+    Gauge("bot_component_stat", "Counters and sizes reported by caches and queues.", ("component", "stat"))
+)
+
+
+_NOOP = nullcontext()
+
+
+def timed(histogram: Histogram, labels: Labels = ()) -> AbstractContextManager[Any]:
+    """
+    Time a block into `histogram`, a shared no-op when metrics are disabled.
+    """
+    if not METRICS_ENABLED:
+        return _NOOP
+    return Timer(histogram, labels)
+
+
+def track_stats(component: str, stats: Callable[[], Mapping[str, float]]) -> None:
+    """
+    Export every value of `stats()` (e.g. `CityCache.stats`) as `bot_component_stat` on scrape.
+    """
+
+    def collect() -> None:
+        for stat, value in stats().items():
+            component_stats.set(float(value), (component, stat))
+
+    registry.add_collector(collect)
+
+
+# --- aiogram ---
+class HandlerMetricsMiddleware:
+    """
+    Inner middleware timing every handler by name; registered once per event type. aiogram takes
+    any such callable, so it does not subclass `BaseMiddleware` (see the module docstring).
+    """
+
+    def __init__(self, event_type: str) -> None:
+        self.event_type = event_type
+
+    async def __call__(
+        self,
+        handler: Callable[["TelegramObject", dict[str, Any]], Awaitable[Any]],
+        event: "TelegramObject",
+        data: dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        labels = (self.event_type, name)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(labels=labels)
+            raise
+        finally:
+            handler_latency.observe(time.perf_counter() - started, labels)
+
+
+def instrument_dispatcher(dp: "Dispatcher") -> None:
+    for event_type, observer in dp.observers.items():
+        if event_type not in ("update", "error"):
+            observer.middleware(HandlerMetricsMiddleware(event_type))
+
+
+# --- SQLAlchemy ---
+def instrument_engine(engine: AsyncEngine) -> None:
+    """
+    Time every statement via cursor execute events, labelled by its verb (SELECT, INSERT, ...).
+    """
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+        started = conn.info["metrics_started"].pop()
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+        db_latency.observe(time.perf_counter() - started, (verb,))
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def failed(context: ExceptionContext) -> None:
+        # A failed statement gets no after_cursor_execute, its start time would pile up on the connection
+        connection = context.connection
+        if connection is not None and context.execution_context is not None and connection.info.get("metrics_started"):
+            connection.info["metrics_started"].pop()
+
+
+# --- Event loop lag ---
+async def _watch_loop_lag(interval: float) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - started - interval)
+        loop_lag.set(lag)
+        loop_lag_histogram.observe(lag)
+
+
+_lag_task: asyncio.Task[None] | None = None
+
+
+def start_loop_monitor(interval: float = LOOP_LAG_INTERVAL) -> None:
+    global _lag_task
+    if METRICS_ENABLED and _lag_task is None:
+        _lag_task = asyncio.create_task(_watch_loop_lag(interval), name="loop-lag-monitor")
+
+
+async def stop_loop_monitor() -> None:
+    global _lag_task
+    if _lag_task is not None:
+        _lag_task.cancel()
+        try:
+            await _lag_task
+        except asyncio.CancelledError:
+            pass
+        _lag_task = None
+
+
+# --- HTTP exposition ---
+async def handle_metrics(request: "web.Request") -> "web.Response":
+    from aiohttp import web
+
+    return web.Response(body=registry.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+
+async def start_server(host: str = METRICS_HOST, port: int = METRICS_PORT) -> "web.AppRunner":
+    from aiohttp import web
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Metrics available on http://{host}:{port}/metrics")
+    return runner
@@ -1,11 +1,13 @@
 import enum
+from datetime import datetime
 
-from sqlmodel import Column, Enum, Field, SQLModel
+from sqlalchemy import Index, UniqueConstraint, false, func, literal_column
+from sqlmodel import BigInteger, Boolean, Column, DateTime, Enum, Field, SQLModel, col
 
 
 class TelegramUser(SQLModel, table=True):
     id: int | None = Field(default=None, primary_key=True)
-    telegram_id: int
+    telegram_id: int = Field(sa_column=Column(BigInteger, index=True, unique=True, nullable=False))
     telegram_username: str
 
 
@@ -16,6 +18,11 @@ class CurrencyEnum(str, enum.Enum):
 
 
 class SearchFilter(SQLModel, table=True):
+    """
+    One distinct search; identical filters of different users are stored once and shared
+    (unique `ux_searchfilter_identity`, see `FILTER_IDENTITY`).
+    """
+
     id: int | None = Field(default=None, primary_key=True)
     filter_name: str
     category_id: int
@@ -24,9 +31,107 @@ class SearchFilter(SQLModel, table=True):
     currency: CurrencyEnum = Field(sa_column=Column(Enum(CurrencyEnum)), default=CurrencyEnum.USD)
     price_from: int | None = Field(default=None)
     price_to: int | None = Field(default=None)
+    # Newest (created/refreshed time, ad id) already polled, see poller.Watermark
+    watermark_at: datetime | None = Field(default=None, sa_column=Column(DateTime(timezone=True)))
+    watermark_id: int | None = Field(default=None, sa_column=Column(BigInteger))
+
+
+# Columns identifying a distinct filter. Prices may be NULL ("no limit"), which a plain unique
+# index treats as distinct values, so they are compared through coalesce(price, -1).
+FILTER_IDENTITY = (
+    col(SearchFilter.category_id),
+    col(SearchFilter.city_id),
+    col(SearchFilter.region_id),
+    col(SearchFilter.currency),
+    func.coalesce(col(SearchFilter.price_from), literal_column("-1")),
+    func.coalesce(col(SearchFilter.price_to), literal_column("-1")),
+)
+Index("ux_searchfilter_identity", *FILTER_IDENTITY, unique=True)
+
+
+class DeliveryModeEnum(str, enum.Enum):
+    INSTANT = "instant"
+    # One digest every `digest_interval` minutes
+    BATCHED = "batched"
+    # One digest a day, see digest.DIGEST_DAILY_HOUR
+    DAILY = "daily"
 
 
 class UserSearchFilters(SQLModel, table=True):
+    # The unique (user_id, search_filter_id) index also serves lookups by user, (user_id, id) the
+    # keyset-paginated /filters list
+    __table_args__ = (
+        UniqueConstraint("user_id", "search_filter_id", name="uq_usersearchfilters_user_filter"),
+        Index("ix_usersearchfilters_user_id_id", "user_id", "id"),
+    )
+
+    id: int | None = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="telegramuser.id", ondelete="CASCADE")
+    search_filter_id: int = Field(foreign_key="searchfilter.id", ondelete="CASCADE", index=True)
+    delivery_mode: DeliveryModeEnum = Field(
+        sa_column=Column(Enum(DeliveryModeEnum), nullable=False, server_default=DeliveryModeEnum.INSTANT.name),
+        default=DeliveryModeEnum.INSTANT,
+    )
+    digest_interval: int | None = Field(default=None)
+    # End of the open digest window, set when its first offer is buffered
+    digest_due_at: datetime | None = Field(default=None, sa_column=Column(DateTime(timezone=True), index=True))
+    # Paused subscriptions stay in /filters but are not polled
+    paused: bool = Field(default=False, sa_column=Column(Boolean, nullable=False, server_default=false()))
+
+
+class Digest(SQLModel, table=True):
+    """
+    One sent digest message; its offers stay in `digestoffer` for paging until it expires.
+    """
+
+    id: int | None = Field(default=None, primary_key=True)
+    chat_id: int = Field(sa_column=Column(BigInteger, nullable=False))
+    title: str
+    offer_count: int
+    created_at: datetime = Field(sa_column=Column(DateTime(timezone=True), nullable=False, index=True))
+
+
+class DigestOffer(SQLModel, table=True):
+    """
+    An offer buffered for a digest subscription (`digest_id` NULL) or part of a sent digest.
+    """
+
+    __table_args__ = (UniqueConstraint("subscription_id", "offer_id", name="uq_digestoffer_subscription_offer"),)
+
     id: int | None = Field(default=None, primary_key=True)
-    user_id: int
-    search_filter_id: int
+    subscription_id: int = Field(foreign_key="usersearchfilters.id", ondelete="CASCADE")
+    digest_id: int | None = Field(default=None, foreign_key="digest.id", ondelete="CASCADE", index=True)
+    offer_id: int = Field(sa_column=Column(BigInteger, nullable=False))
+    title: str
+    url: str
+    price_label: str = ""
+
+
+class FSMState(SQLModel, table=True):
+    """
+    Search wizard progress shared between bot instances, see fsm_storage.PostgresFSMBackend.
+    """
+
+    key: str = Field(primary_key=True)
+    state: str | None = Field(default=None)
+    data: str = Field(default="{}")
+    expires_at: datetime = Field(sa_column=Column(DateTime(timezone=True), nullable=False, index=True))
+
+
+class PollerWorker(SQLModel, table=True):
+    """
+    Live poller worker processes, see sharding.ShardCoordinator.
+    """
+
+    worker_id: str = Field(primary_key=True)
+    heartbeat_at: datetime = Field(sa_column=Column(DateTime(timezone=True), nullable=False))
+
+
+class PollerLease(SQLModel, table=True):
+    """
+    Last time a distinct search query was claimed for polling, and by whom.
+    """
+
+    query_key: str = Field(primary_key=True)
+    worker_id: str
+    polled_at: datetime = Field(sa_column=Column(DateTime(timezone=True), nullable=False))
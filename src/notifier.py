@@ -0,0 +1,344 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramAPIError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+from aiogram.types import InlineKeyboardMarkup, InputMediaPhoto
+
+from offers import Offer
+from rate_limit import Priority, TokenBucket
+from utils import format_offer, get_offer_photo
+
+# Telegram flood limits: ~30 msg/s overall, ~1 msg/s to one chat
+NOTIFY_GLOBAL_RATE = float(os.getenv("NOTIFY_GLOBAL_RATE", "25"))
+NOTIFY_GLOBAL_BURST = float(os.getenv("NOTIFY_GLOBAL_BURST", "5"))
+NOTIFY_CHAT_RATE = float(os.getenv("NOTIFY_CHAT_RATE", "1"))
+NOTIFY_CHAT_BURST = float(os.getenv("NOTIFY_CHAT_BURST", "1"))
+# With sharded poller workers all sending through the same bot, the bot keeps this share of the
+# global rate and the live workers split the rest
+NOTIFY_BOT_SHARE = float(os.getenv("NOTIFY_BOT_SHARE", "0.2"))
+# A chat with at least this many queued ads gets them merged into one message / media group
+NOTIFY_MERGE_BACKLOG = int(os.getenv("NOTIFY_MERGE_BACKLOG", "3"))
+NOTIFY_MERGE_MAX = 10
+# Network errors and 5xx answers: the chat is retried after 1, 2, 4, ... seconds, dropped after this many
+NOTIFY_RETRY_BACKOFF = float(os.getenv("NOTIFY_RETRY_BACKOFF", "1"))
+NOTIFY_RETRY_MAX_BACKOFF = float(os.getenv("NOTIFY_RETRY_MAX_BACKOFF", "60"))
+NOTIFY_RETRY_ATTEMPTS = int(os.getenv("NOTIFY_RETRY_ATTEMPTS", "5"))
+# Sends in flight at once (to different chats), so round trips do not cap the rate below the buckets
+NOTIFY_CONCURRENCY = int(os.getenv("NOTIFY_CONCURRENCY", "10"))
+LATENCY_SAMPLES = 1000
+
+
+@dataclass(slots=True)
+class Notification:
+    chat_id: int
+    text: str | None = None
+    offer: Offer | None = None
+    reply_markup: InlineKeyboardMarkup | None = None
+    priority: Priority = Priority.NORMAL
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class Notifier:
+    """
+    Outbound Telegram delivery queue.
+
+    One sender task drains per-chat queues in priority order, gated by a global and a
+    per-chat token bucket, with up to `concurrency` sends to different chats in flight.
+    429 answers block the chat (and the global bucket) for `retry_after`, network errors and
+    5xx answers are retried with backoff, other 4xx answers and unexpected errors drop the
+    batch. Ads piling up for one chat are merged into a single message.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        *,
+        global_rate: float = NOTIFY_GLOBAL_RATE,
+        global_burst: float = NOTIFY_GLOBAL_BURST,
+        global_share: float = 1.0,
+        chat_rate: float = NOTIFY_CHAT_RATE,
+        chat_burst: float = NOTIFY_CHAT_BURST,
+        merge_backlog: int = NOTIFY_MERGE_BACKLOG,
+        retry_backoff: float = NOTIFY_RETRY_BACKOFF,
+        retry_max_backoff: float = NOTIFY_RETRY_MAX_BACKOFF,
+        retry_attempts: int = NOTIFY_RETRY_ATTEMPTS,
+        concurrency: int = NOTIFY_CONCURRENCY,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.bot = bot
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.merge_backlog = merge_backlog
+        self.retry_backoff = retry_backoff
+        self.retry_max_backoff = retry_max_backoff
+        self.retry_attempts = retry_attempts
+        self._clock = clock
+        self._global = TokenBucket(global_rate, global_burst, clock)
+        self.set_global_share(global_share)
+        self._chat_buckets: dict[int, TokenBucket] = {}
+        self._queues: dict[int, deque[Notification]] = {}
+        # (ready_at, priority, seq, chat_id) for chats with pending notifications
+        self._schedule: list[tuple[float, int, int, int]] = []
+        # The live schedule entry of each chat, others in the heap are stale
+        self._entries: dict[int, tuple[float, int, int]] = {}
+        # Consecutive transient failures per chat
+        self._failures: dict[int, int] = {}
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+        self._slots = asyncio.Semaphore(concurrency)
+        self._sending: set[asyncio.Task[None]] = set()
+        self.sent = 0
+        self.merged = 0
+        self.retries = 0
+        self.failed = 0
+        self.latencies: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+
+    # --- Producer side ---
+    def enqueue(self, notification: Notification) -> None:
+        chat_id = notification.chat_id
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = deque()
+            self._schedule_chat(chat_id, self._clock(), notification.priority)
+        # Queues stay in priority order, FIFO within a priority
+        index = len(queue)
+        while index and queue[index - 1].priority > notification.priority:
+            index -= 1
+        queue.insert(index, notification)
+        entry = self._entries.get(chat_id)
+        if entry is not None and notification.priority < entry[1]:
+            # Jumped ahead of the chat's queue: keep its turn, with the higher priority
+            self._schedule_chat(chat_id, entry[0], notification.priority)
+        self._wakeup.set()
+
+    def enqueue_offers(self, chat_id: int, offers: list[Offer], priority: Priority = Priority.NORMAL) -> None:
+        for offer in offers:
+            self.enqueue(Notification(chat_id=chat_id, offer=offer, priority=priority))
+
+    def enqueue_text(
+        self,
+        chat_id: int,
+        text: str,
+        priority: Priority = Priority.NORMAL,
+        reply_markup: InlineKeyboardMarkup | None = None,
+    ) -> None:
+        self.enqueue(Notification(chat_id=chat_id, text=text, reply_markup=reply_markup, priority=priority))
+
+    def set_global_share(self, share: float) -> None:
+        """
+        Send at `share` of the global rate and burst, the rest is left to other processes.
+        """
+        self._global.rate = self.global_rate * share
+        self._global.capacity = max(1.0, self.global_burst * share)
+        self._global.tokens = min(self._global.tokens, self._global.capacity)
+
+    def _schedule_chat(self, chat_id: int, ready_at: float, priority: int) -> None:
+        seq = next(self._seq)
+        self._entries[chat_id] = (ready_at, priority, seq)
+        heapq.heappush(self._schedule, (ready_at, priority, seq, chat_id))
+
+    # --- Observability ---
+    def queue_depth(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def stats(self) -> dict[str, float]:
+        latencies = sorted(self.latencies)
+        return {
+            "queue_depth": self.queue_depth(),
+            "backlogged_chats": len(self._queues),
+            "sent": self.sent,
+            "merged": self.merged,
+            "retries": self.retries,
+            "failed": self.failed,
+            "global_rate": self._global.rate,
+            "latency_p50": latencies[len(latencies) // 2] if latencies else 0.0,
+            "latency_p99": latencies[int(len(latencies) * 0.99)] if latencies else 0.0,
+        }
+
+    # --- Sender side ---
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, self._clock)
+        return bucket
+
+    def _live(self, chat_id: int, seq: int) -> bool:
+        entry = self._entries.get(chat_id)
+        return entry is not None and entry[2] == seq
+
+    def _next_ready(self) -> tuple[int, float]:
+        """
+        Highest priority chat that may send now, or (-1, seconds to wait).
+        """
+        now = self._clock()
+        ready: list[tuple[int, int, float, int]] = []
+        while self._schedule and self._schedule[0][0] <= now:
+            ready_at, priority, seq, chat_id = heapq.heappop(self._schedule)
+            if self._live(chat_id, seq):
+                ready.append((priority, seq, ready_at, chat_id))
+        if not ready:
+            while self._schedule and not self._live(self._schedule[0][3], self._schedule[0][2]):
+                heapq.heappop(self._schedule)
+            return -1, (self._schedule[0][0] - now) if self._schedule else 3600.0
+        ready.sort()
+        _, _, _, chat_id = ready[0]
+        del self._entries[chat_id]
+        for priority, seq, ready_at, other in ready[1:]:
+            heapq.heappush(self._schedule, (ready_at, priority, seq, other))
+        return chat_id, 0.0
+
+    def _take_batch(self, chat_id: int) -> list[Notification]:
+        queue = self._queues[chat_id]
+        first = queue.popleft()
+        batch = [first]
+        if first.offer is not None and len(queue) + 1 >= self.merge_backlog:
+            while queue and len(batch) < NOTIFY_MERGE_MAX and queue[0].offer is not None:
+                batch.append(queue.popleft())
+        return batch
+
+    async def _send(self, chat_id: int, batch: list[Notification]) -> None:
+        if len(batch) == 1:
+            item = batch[0]
+            text = format_offer(item.offer) if item.offer is not None else item.text or ""
+            await self.bot.send_message(chat_id=chat_id, text=text, reply_markup=item.reply_markup)
+            return
+        # Only offers are ever merged, see _take_batch
+        offers = [item.offer for item in batch if item.offer is not None]
+        with_photos = [(photo, offer) for offer in offers if (photo := get_offer_photo(offer))]
+        if len(with_photos) == len(offers):
+            media = [InputMediaPhoto(media=photo, caption=format_offer(offer)) for photo, offer in with_photos]
+            await self.bot.send_media_group(chat_id=chat_id, media=media)  # type: ignore[arg-type]
+        else:
+            await self.bot.send_message(chat_id=chat_id, text="\n\n".join(format_offer(offer) for offer in offers))
+        self.merged += len(batch) - 1
+
+    def _claim(self, chat_id: int) -> list[Notification] | None:
+        """
+        The chat's next batch with both bucket tokens taken, or None after rescheduling the
+        chat for when its buckets allow it.
+        """
+        bucket = self._chat_bucket(chat_id)
+        queue = self._queues[chat_id]
+        wait = max(bucket.delay(), self._global.delay())
+        if wait > 0:
+            self._schedule_chat(chat_id, self._clock() + wait, queue[0].priority)
+            return None
+        bucket.consume()
+        self._global.consume()
+        return self._take_batch(chat_id)
+
+    async def _deliver(self, chat_id: int, batch: list[Notification]) -> None:
+        bucket = self._chat_bucket(chat_id)
+        queue = self._queues[chat_id]
+        try:
+            await self._send(chat_id, batch)
+        except TelegramRetryAfter as e:
+            self.retries += 1
+            bucket.block(e.retry_after)
+            self._global.block(min(e.retry_after, 1.0))
+            queue.extendleft(reversed(batch))
+        except (TelegramNetworkError, TelegramServerError) as e:
+            failures = self._failures[chat_id] = self._failures.get(chat_id, 0) + 1
+            if failures > self.retry_attempts:
+                self.failed += len(batch)
+                del self._failures[chat_id]
+                logging.warning(
+                    f"Dropping {len(batch)} notifications for chat {chat_id} after {failures} attempts: {e}"
+                )
+            else:
+                self.retries += 1
+                bucket.block(min(self.retry_backoff * 2 ** (failures - 1), self.retry_max_backoff))
+                queue.extendleft(reversed(batch))
+        except TelegramAPIError as e:
+            # 4xx: blocked bot, deleted chat, bad markup; retrying will not help
+            self.failed += len(batch)
+            self._failures.pop(chat_id, None)
+            logging.warning(f"Dropping {len(batch)} notifications for chat {chat_id}: {e}")
+        except Exception:
+            # E.g. an offer that does not validate as media, it would fail the same way again
+            self.failed += len(batch)
+            self._failures.pop(chat_id, None)
+            logging.exception(f"Dropping {len(batch)} notifications for chat {chat_id}.")
+        else:
+            now = self._clock()
+            self.sent += 1
+            self._failures.pop(chat_id, None)
+            self.latencies.extend(now - item.enqueued_at for item in batch)
+        finally:
+            # Whatever happened, the chat must not be left with a queue and no turn
+            if queue:
+                self._schedule_chat(chat_id, self._clock() + bucket.delay(), queue[0].priority)
+                self._wakeup.set()
+            else:
+                del self._queues[chat_id]
+                if bucket.idle:
+                    del self._chat_buckets[chat_id]
+
+    async def _deliver_one(self, chat_id: int) -> None:
+        batch = self._claim(chat_id)
+        if batch is not None:
+            await self._deliver(chat_id, batch)
+
+    async def _deliver_released(self, chat_id: int, batch: list[Notification]) -> None:
+        try:
+            await self._deliver(chat_id, batch)
+        finally:
+            self._slots.release()
+
+    async def run(self) -> None:
+        while True:
+            await self._slots.acquire()
+            # Tokens are taken here, before the send task starts, so concurrent sends never overspend
+            wait = self._global.delay()
+            chat_id = -1
+            if wait <= 0:
+                chat_id, wait = self._next_ready()
+            batch = self._claim(chat_id) if chat_id >= 0 else None
+            if batch is None:
+                self._slots.release()
+                if chat_id < 0:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                    except asyncio.TimeoutError:
+                        pass
+                continue
+            # A chat has no schedule entry while its batch is in flight, so it is never sent to twice at once
+            task = asyncio.create_task(self._deliver_released(chat_id, batch), name=f"notify-{chat_id}")
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run(), name="notifier")
+
+    async def stop(self, drain_timeout: float = 10.0) -> None:
+        """
+        Give queued notifications up to `drain_timeout` seconds, then stop the sender.
+        """
+        if self._task is None:
+            return
+        deadline = self._clock() + drain_timeout
+        while self._queues and self._clock() < deadline:
+            await asyncio.sleep(0.1)
+        self._task.cancel()
+        for task in list(self._sending):
+            task.cancel()
+        await asyncio.gather(self._task, *self._sending, return_exceptions=True)
+        self._task = None
@@ -0,0 +1,253 @@
+"""
+Compact OLX offer records and an incremental parser for offer search pages.
+
+A search page is `{"data": [offer, ...], "metadata": {...}, "links": {...}}` where every
+offer carries nested params, photos, location, contact and promotion blocks. The parser
+is fed the response body chunk by chunk: each offer object is decoded on its own as soon
+as it is complete and immediately reduced to an `Offer`, the other top-level values are
+skipped by scanning without being decoded. Peak memory is one offer, not one page tree.
+"""
+
+import codecs
+import json
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Iterator
+
+
+@dataclass(frozen=True, slots=True)
+class Offer:
+    """
+    The fields of an OLX offer the bot uses; `seller` and a missing `photo` may be filled in
+    later from the offer details (see `OlxClient.enrich_offers`).
+    """
+
+    id: int
+    url: str
+    title: str
+    # Newest of created/last refreshed time
+    refreshed_at: datetime | None = None
+    # Paid "top" ads are pinned to the first page regardless of sort order
+    promoted: bool = False
+    price_value: float | None = None
+    price_currency: str | None = None
+    price_label: str = ""
+    # OLX's own conversion, when it converted to UAH
+    price_uah: float | None = None
+    # Link template with {width}/{height} placeholders
+    photo: str | None = None
+    seller: str | None = None
+
+    @classmethod
+    def from_json(cls, data: dict[str, Any]) -> "Offer":
+        price: dict[str, Any] = {}
+        for param in data.get("params") or ():
+            if param.get("key") == "price":
+                price = param.get("value") or {}
+                break
+        times = [datetime.fromisoformat(data[key]) for key in ("created_time", "last_refresh_time") if data.get(key)]
+        promotion = data.get("promotion") or {}
+        photos = data.get("photos") or ()
+        value = price.get("value")
+        converted = price.get("converted_value") if price.get("converted_currency") == "UAH" else None
+        return cls(
+            id=int(data["id"]),
+            url=data.get("url") or "",
+            title=data.get("title") or "",
+            refreshed_at=max(times) if times else None,
+            promoted=bool(promotion.get("top_ad") or promotion.get("highlighted")),
+            price_value=float(value) if value is not None else None,
+            price_currency=price.get("currency"),
+            price_label=price.get("label") or "",
+            price_uah=float(converted) if converted is not None else None,
+            photo=(photos[0].get("link") if photos else None) or None,
+            seller=(data.get("user") or {}).get("name") or None,
+        )
+
+
+class _Incomplete(Exception):
+    pass
+
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# Next character that changes nesting or starts a string
+_STRUCTURE = re.compile(r'["{}\[\]]')
+# Rest of a string after its opening quote
+_STRING_TAIL = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+# Where a number/true/false/null ends
+_SCALAR_END = re.compile(r"[,}\]\s]")
+
+# Parser states
+_START, _FIRST_KEY, _KEY, _COLON, _VALUE, _FIRST_ITEM, _ITEM, _AFTER_ITEM, _AFTER_VALUE, _DONE = range(10)
+
+
+class OfferStreamParser:
+    """
+    Incremental parser of one offers page: `feed()` bytes as they arrive and collect the
+    offers it returns, then `close()`.
+
+    Only the top-level `data` array is decoded, one element at a time. An element cut off
+    by the end of a chunk is tracked by a resumable regex scan until it is complete, so
+    small chunks do not make the decoder start over again and again.
+    """
+
+    def __init__(self, key: str = "data") -> None:
+        self.key = key
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._state = _START
+        self._current_key = ""
+        # Scan progress through an unfinished value: (value start, scan position, depth)
+        self._scan: tuple[int, int, int] | None = None
+        self.count = 0
+
+    def feed(self, chunk: bytes) -> list[Offer]:
+        self._buffer = self._buffer[self._pos :] + self._decoder.decode(chunk)
+        if self._scan is not None:
+            start, scan, depth = self._scan
+            self._scan = (start - self._pos, scan - self._pos, depth)
+        self._pos = 0
+        return list(self._parse())
+
+    def close(self) -> None:
+        self._buffer = self._buffer[self._pos :] + self._decoder.decode(b"", final=True)
+        self._pos = 0
+        if self._state != _DONE or self._buffer.strip():
+            raise ValueError("Truncated or malformed OLX offers page.")
+
+    # --- scanning ---
+    def _skip_whitespace(self) -> str:
+        self._pos = _WHITESPACE.match(self._buffer, self._pos).end()  # type: ignore[union-attr]
+        if self._pos >= len(self._buffer):
+            raise _Incomplete
+        return self._buffer[self._pos]
+
+    def _expect(self, char: str) -> None:
+        found = self._skip_whitespace()
+        if found != char:
+            raise ValueError(f"Malformed OLX offers page: expected {char!r}, got {found!r} at {self._pos}.")
+        self._pos += 1
+
+    def _string_end(self, start: int) -> int:
+        match = _STRING_TAIL.match(self._buffer, start + 1)
+        if match is None:
+            raise _Incomplete
+        return match.end()
+
+    def _value_end(self) -> int:
+        """
+        End of the JSON value starting at `self._pos`, resuming an earlier partial scan.
+        """
+        buffer = self._buffer
+        if self._scan is not None and self._scan[0] == self._pos:
+            start, scan, depth = self._scan
+        else:
+            start, scan, depth = self._pos, self._pos, 0
+            first = buffer[start]
+            if first == '"':
+                return self._string_end(start)
+            if first not in "{[":
+                match = _SCALAR_END.search(buffer, start)
+                if match is None:
+                    raise _Incomplete
+                return match.start()
+        while True:
+            match = _STRUCTURE.search(buffer, scan)
+            if match is None:
+                self._scan = (start, len(buffer), depth)
+                raise _Incomplete
+            char = match.group()
+            if char == '"':
+                try:
+                    scan = self._string_end(match.start())
+                except _Incomplete:
+                    self._scan = (start, match.start(), depth)
+                    raise
+                continue
+            scan = match.end()
+            depth += 1 if char in "{[" else -1
+            if depth == 0:
+                self._scan = None
+                return scan
+
+    # --- state machine ---
+    def _parse(self) -> Iterator[Offer]:
+        buffer = self._buffer
+        try:
+            while self._state != _DONE:
+                if self._state == _START:
+                    self._expect("{")
+                    self._state = _FIRST_KEY
+                elif self._state in (_FIRST_KEY, _KEY):
+                    if self._skip_whitespace() == "}" and self._state == _FIRST_KEY:
+                        self._pos += 1
+                        self._state = _DONE
+                        continue
+                    if buffer[self._pos] != '"':
+                        raise ValueError(f"Malformed OLX offers page: expected a key at {self._pos}.")
+                    end = self._string_end(self._pos)
+                    self._current_key = json.loads(buffer[self._pos : end])
+                    self._pos = end
+                    self._state = _COLON
+                elif self._state == _COLON:
+                    self._expect(":")
+                    self._state = _VALUE
+                elif self._state == _VALUE:
+                    if self._skip_whitespace() == "[" and self._current_key == self.key:
+                        self._pos += 1
+                        self._state = _FIRST_ITEM
+                    else:
+                        self._pos = self._value_end()
+                        self._state = _AFTER_VALUE
+                elif self._state in (_FIRST_ITEM, _ITEM):
+                    if self._skip_whitespace() == "]" and self._state == _FIRST_ITEM:
+                        self._pos += 1
+                        self._state = _AFTER_VALUE
+                        continue
+                    if self._scan is not None:
+                        # Cut off by an earlier chunk end: finish the scan before decoding again
+                        self._value_end()
+                    try:
+                        item, end = self._json.raw_decode(buffer, self._pos)
+                    except json.JSONDecodeError:
+                        # Raises _Incomplete if the element is just cut off by the chunk end
+                        self._value_end()
+                        raise
+                    self._scan = None
+                    self._pos = end
+                    self._state = _AFTER_ITEM
+                    self.count += 1
+                    yield Offer.from_json(item)
+                elif self._state == _AFTER_ITEM:
+                    char = self._skip_whitespace()
+                    self._pos += 1
+                    if char == "]":
+                        self._state = _AFTER_VALUE
+                    elif char == ",":
+                        self._state = _ITEM
+                    else:
+                        raise ValueError(f"Malformed OLX offers page: unexpected {char!r} in {self.key}.")
+                elif self._state == _AFTER_VALUE:
+                    char = self._skip_whitespace()
+                    self._pos += 1
+                    if char == "}":
+                        self._state = _DONE
+                    elif char == ",":
+                        self._state = _KEY
+                    else:
+                        raise ValueError(f"Malformed OLX offers page: unexpected {char!r} after {self._current_key}.")
+        except _Incomplete:
+            return
+
+
+def parse_offers_page(body: bytes) -> list[Offer]:
+    """
+    All offers of a complete page body.
+    """
+    parser = OfferStreamParser()
+    offers = parser.feed(body)
+    parser.close()
+    return offers
@@ -1,24 +1,449 @@
-from typing import Any
+import asyncio
+import dataclasses
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, TypeVar
 
 import httpx
 
-URL_OLX_LOCATAION = "https://www.olx.ua/api/v1/geo-encoder/location-autocomplete/"
+from metrics import METRICS_ENABLED, olx_latency
+from offers import Offer, OfferStreamParser, parse_offers_page
+from olx_policy import (
+    RETRY_STATUSES,
+    THROTTLE_STATUSES,
+    CircuitBreaker,
+    CircuitOpenError,
+    CircuitState,
+    OlxUnavailableError,
+    backoff_delay,
+    retry_after,
+)
+from rate_limit import AdaptiveRateLimiter, Priority
+from response_cache import RESPONSE_CACHE_ENABLED, ResponseCache, body_hasher
+
+OLX_BASE_URL = os.getenv("OLX_BASE_URL", "https://www.olx.ua")
+LOCATION_AUTOCOMPLETE_PATH = "/api/v1/geo-encoder/location-autocomplete/"
+OFFERS_PATH = "/api/v1/offers/"
+OFFERS_PAGE_SIZE = 40
+OFFER_DETAILS_PATH = "/api/v1/offers/{offer_id}/"
+URL_OLX_LOCATAION = f"{OLX_BASE_URL}{LOCATION_AUTOCOMPLETE_PATH}"
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/123.0.0.0 Safari/537.36",
+    "Accept": "application/json",
+}
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+T = TypeVar("T")
+
+
+async def _read_json(response: httpx.Response) -> Any:
+    await response.aread()
+    return response.json()
+
+
+@dataclass(slots=True)
+class OffersPage:
+    """
+    A fetched offers page with what its response cache entry holds. `OlxClient.save_pages`
+    writes the entry once the offers were processed, so a page whose processing failed is not
+    taken for unchanged the next time.
+    """
+
+    key: str
+    offers: list[Offer]
+    body: bytes = b""
+    digest: bytes = b""
+    etag: str | None = None
+    last_modified: str | None = None
+
+
+async def _read_offers_page(response: httpx.Response, key: str) -> OffersPage | None:
+    """
+    The body of a conditional request, hashed as it streams in but not parsed yet (`offers` is
+    empty), so a body equal to the cached copy is never parsed; None for a 304.
+    """
+    if response.status_code == httpx.codes.NOT_MODIFIED:
+        # Read even the empty body of a 304, or the connection is not reused
+        await response.aread()
+        return None
+    hasher = body_hasher()
+    chunks: list[bytes] = []
+    async for chunk in response.aiter_bytes():
+        hasher.update(chunk)
+        chunks.append(chunk)
+    etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+    return OffersPage(key, [], b"".join(chunks), hasher.digest(), etag, last_modified)
+
+
+async def _read_offers(response: httpx.Response) -> list[Offer]:
+    parser = OfferStreamParser()
+    offers: list[Offer] = []
+    async for chunk in response.aiter_bytes():
+        offers.extend(parser.feed(chunk))
+    parser.close()
+    return offers
+
+
+class OlxClient:
+    """
+    Process-wide OLX API client.
+
+    Wraps one pooled `httpx.AsyncClient` so DNS, TCP and TLS setup is paid once and
+    connections are reused (keep-alive) by every handler and background job.
+
+    Every request goes through one policy: an AIMD rate limiter shared by all callers
+    (interactive lookups are let through before background polling), jittered exponential
+    retries of throttled/failed GETs, and a circuit breaker that fails fast with
+    `CircuitOpenError` while OLX keeps failing.
+
+    Offer pages are stream-parsed into compact `offers.Offer` records; optional per-offer
+    detail requests (`enrich_offers`) share one bounded semaphore.
+
+    With a `cache` (see response_cache.py) offer pages are fetched conditionally instead and
+    parsed only when their body hash differs from the cached copy; `get_changed_offers` skips
+    pages whose body did not change since they were last processed.
+    """
+
+    def __init__(
+        self,
+        base_url: str = OLX_BASE_URL,
+        *,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        http2: bool = False,
+        timeout: float = 10.0,
+        connect_timeout: float = 5.0,
+        headers: dict[str, str] | None = None,
+        transport: httpx.AsyncBaseTransport | None = None,
+        limiter: AdaptiveRateLimiter | None = None,
+        breaker: CircuitBreaker | None = None,
+        retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 10.0,
+        enrich_concurrency: int = 4,
+        cache: ResponseCache | None = None,
+    ) -> None:
+        if http2 and not _http2_available():
+            logging.warning("HTTP/2 requested for OLX client but 'h2' is not installed, falling back to HTTP/1.1.")
+            http2 = False
+        self.base_url = base_url
+        self.http2 = http2
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.headers = {**DEFAULT_HEADERS, **(headers or {})}
+        self._transport = transport
+        self._client: httpx.AsyncClient | None = None
+        self.limiter = limiter
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._enrich_slots = asyncio.BoundedSemaphore(enrich_concurrency)
+        self.cache = cache
+        self.requests = 0
+        self.retried = 0
+        self.failed = 0
+        self.enriched = 0
+        # Conditional fetches answered 304, 200s with the same body as before, what 304s did not
+        # transfer and pages `get_changed_offers` skipped
+        self.not_modified = 0
+        self.unchanged = 0
+        self.bytes_saved = 0
+        self.parses_skipped = 0
+
+    @classmethod
+    def from_env(cls) -> "OlxClient":
+        return cls(
+            base_url=OLX_BASE_URL,
+            max_connections=int(os.getenv("OLX_MAX_CONNECTIONS", "20")),
+            max_keepalive_connections=int(os.getenv("OLX_MAX_KEEPALIVE", "10")),
+            keepalive_expiry=float(os.getenv("OLX_KEEPALIVE_EXPIRY", "30")),
+            http2=os.getenv("OLX_HTTP2", "false").lower() in ("1", "true", "yes"),
+            timeout=float(os.getenv("OLX_TIMEOUT", "10")),
+            connect_timeout=float(os.getenv("OLX_CONNECT_TIMEOUT", "5")),
+            limiter=AdaptiveRateLimiter(
+                rate=float(os.getenv("OLX_RATE", "10")),
+                burst=float(os.getenv("OLX_BURST", "5")),
+                min_rate=float(os.getenv("OLX_RATE_MIN", "0.5")),
+                max_rate=float(os.getenv("OLX_RATE_MAX", "30")),
+            ),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.getenv("OLX_BREAKER_THRESHOLD", "5")),
+                reset_timeout=float(os.getenv("OLX_BREAKER_RESET", "30")),
+            ),
+            retries=int(os.getenv("OLX_RETRIES", "3")),
+            enrich_concurrency=int(os.getenv("OLX_ENRICH_CONCURRENCY", "4")),
+            cache=ResponseCache() if RESPONSE_CACHE_ENABLED else None,
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """
+        Underlying httpx client, created on first use if `start()` was not called.
+        """
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                limits=self.limits,
+                timeout=self.timeout,
+                http2=self.http2,
+                transport=self._transport,
+            )
+        return self._client
+
+    async def start(self) -> None:
+        """
+        Create the connection pool eagerly.
+        """
+        _ = self.client
+        if self.cache is not None:
+            await self.cache.ready()
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "requests": self.requests,
+            "retried": self.retried,
+            "failed": self.failed,
+            "enriched": self.enriched,
+            "rate_limit": self.limiter.rate if self.limiter else 0.0,
+            "rate_limit_waiting": self.limiter.waiting if self.limiter else 0,
+            "throttled": self.limiter.throttled if self.limiter else 0,
+            "circuit_open": self.breaker.state is not CircuitState.CLOSED,
+            "circuit_rejected": self.breaker.rejected,
+            "not_modified": self.not_modified,
+            "unchanged": self.unchanged,
+            "bytes_saved": self.bytes_saved,
+            "parses_skipped": self.parses_skipped,
+            **(self.cache.stats() if self.cache is not None else {}),
+        }
+
+    async def _send(
+        self, path: str, params: dict[str, Any] | None, route: str, headers: dict[str, str] | None = None
+    ) -> httpx.Response:
+        """
+        Send a GET and return once the headers are in; the caller reads and closes the body.
+        """
+        self.requests += 1
+        started = time.perf_counter()
+        status = "error"
+        try:
+            request = self.client.build_request("GET", path, params=params, headers=headers)
+            response = await self.client.send(request, stream=True)
+            status = str(response.status_code)
+            return response
+        finally:
+            if METRICS_ENABLED:
+                olx_latency.observe(time.perf_counter() - started, (route, status))
+
+    async def request(
+        self,
+        path: str,
+        params: dict[str, Any] | None,
+        read: Callable[[httpx.Response], Awaitable[T]],
+        priority: Priority = Priority.NORMAL,
+        route: str | None = None,
+        headers: dict[str, str] | None = None,
+    ) -> T:
+        """
+        GET `path` under the client policy and hand a successful (or 304) response to `read`.
+        Other 4xx answers raise `httpx.HTTPStatusError` right away; throttling, 5xx and network
+        errors (also while reading the body) are retried and end in `OlxUnavailableError`.
+
+        `route` labels the latency metric instead of `path`, for paths with ids in them.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"OLX is unavailable, retrying in {self.breaker.retry_in():.0f}s.")
+        error: Exception | None = None
+        for attempt in range(self.retries + 1):
+            if self.limiter is not None:
+                await self.limiter.acquire(priority)
+            # Other callers' failures may have opened the circuit while this one waited
+            if self.breaker.state is CircuitState.OPEN:
+                break
+            if attempt:
+                self.retried += 1
+            wait = backoff_delay(attempt, self.backoff_base, self.backoff_cap)
+            try:
+                response = await self._send(path, params, route or path, headers)
+                not_modified = response.status_code == httpx.codes.NOT_MODIFIED
+                try:
+                    body = await read(response) if response.is_success or not_modified else None
+                finally:
+                    await response.aclose()
+            except httpx.TransportError as e:
+                error = e
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    if self.limiter is not None:
+                        self.limiter.on_success()
+                    # Anything but throttling and 5xx means OLX itself is fine
+                    self.breaker.record_success()
+                    if not not_modified:
+                        response.raise_for_status()
+                    return body  # type: ignore[return-value]
+                error = httpx.HTTPStatusError(
+                    f"OLX answered {response.status_code}", request=response.request, response=response
+                )
+                if response.status_code in THROTTLE_STATUSES and self.limiter is not None:
+                    self.limiter.on_throttle(retry_after(response))
+                wait = max(wait, retry_after(response) or 0.0)
+            self.breaker.record_failure()
+            if attempt < self.retries:
+                await asyncio.sleep(wait)
+        self.failed += 1
+        if self.breaker.state is CircuitState.OPEN:
+            raise CircuitOpenError(f"OLX is unavailable, retrying in {self.breaker.retry_in():.0f}s.") from error
+        raise OlxUnavailableError(f"OLX request to {path} failed after {self.retries + 1} attempts: {error}") from error
+
+    async def get_json(
+        self,
+        path: str,
+        params: dict[str, Any] | None = None,
+        priority: Priority = Priority.NORMAL,
+        route: str | None = None,
+    ) -> dict[Any, Any]:
+        """
+        GET `path` under the client policy (see `request`) and decode the whole JSON body.
+        """
+        return await self.request(path, params, _read_json, priority, route)  # type: ignore[no-any-return]
+
+    async def get_city_info(self, query: str) -> dict[Any, Any]:
+        """
+        Async call to OLX geo-encoder API to get city info by name.
+        """
+        if len(query) < 3:
+            raise ValueError("Query must be at least 3 characters long.")
+        return await self.get_json(LOCATION_AUTOCOMPLETE_PATH, params={"query": query}, priority=Priority.INTERACTIVE)
+
+    async def _get_page(self, params: dict[str, Any], *, if_changed: bool) -> OffersPage | None:
+        """
+        An offers page requested with the validators of its cached copy. With `if_changed` None
+        when it is the same as that copy, which is then neither parsed nor even loaded. Needs a
+        `cache`.
+        """
+        assert self.cache is not None
+        key = str(httpx.URL(OFFERS_PATH, params=params))
+        cached = await self.cache.get(key)
+        headers = cached.validators() if cached is not None else None
+
+        async def read(response: httpx.Response) -> OffersPage | None:
+            return await _read_offers_page(response, key)
+
+        page = await self.request(OFFERS_PATH, params, read, Priority.BULK, headers=headers)
+        if page is not None:
+            if cached is not None and page.digest == cached.digest:
+                self.unchanged += 1
+                # Same body, only the validators may be new
+                await self.save_pages([page])
+                if if_changed:
+                    self.parses_skipped += 1
+                    return None
+            page.offers = parse_offers_page(page.body)
+            return page
+        if cached is None:
+            raise OlxUnavailableError(f"OLX answered 304 to an unconditional request to {OFFERS_PATH}.")
+        self.not_modified += 1
+        self.bytes_saved += cached.size
+        await self.cache.touch(key)
+        if if_changed:
+            self.parses_skipped += 1
+            return None
+        body = await self.cache.body(key)
+        if body is None:
+            # Evicted while the request was out, fetch it again in full
+            await self.cache.discard(key)
+            return await self._get_page(params, if_changed=False)
+        return OffersPage(key, parse_offers_page(body), body, cached.digest, cached.etag, cached.last_modified)
+
+    async def save_pages(self, pages: list[OffersPage]) -> None:
+        """
+        Make `pages` the cached copies of their URLs, once their offers were processed.
+        """
+        if self.cache is None:
+            return
+        for page in pages:
+            await self.cache.put(page.key, page.body, page.etag, page.last_modified, page.digest)
+
+    async def get_offers(self, params: dict[str, Any], offset: int = 0, limit: int = OFFERS_PAGE_SIZE) -> list[Offer]:
+        """
+        One page of OLX offers for the given search params, newest first, parsed as it streams in
+        (or, with a cache, from the cached copy when OLX confirms it is unchanged).
+        """
+        page_params = {"sort_by": "created_at:desc", **params, "offset": offset, "limit": limit}
+        if self.cache is not None:
+            page = await self._get_page(page_params, if_changed=False)
+            assert page is not None
+            await self.save_pages([page])
+            return page.offers
+        return await self.request(OFFERS_PATH, page_params, _read_offers, priority=Priority.BULK)
+
+    async def get_changed_offers(
+        self, params: dict[str, Any], offset: int = 0, limit: int = OFFERS_PAGE_SIZE
+    ) -> OffersPage | None:
+        """
+        Like `get_offers`, but None when the page is the same as the last time it was processed,
+        i.e. passed to `save_pages`. Without a cache every page counts as changed.
+        """
+        if self.cache is None:
+            return OffersPage("", await self.get_offers(params, offset, limit))
+        page_params = {"sort_by": "created_at:desc", **params, "offset": offset, "limit": limit}
+        return await self._get_page(page_params, if_changed=True)
+
+    async def get_offer_details(self, offer_id: int) -> Offer:
+        path = OFFER_DETAILS_PATH.format(offer_id=offer_id)
+        data = await self.get_json(path, priority=Priority.BULK, route=OFFER_DETAILS_PATH)
+        return Offer.from_json(data["data"])
+
+    async def enrich_offers(self, offers: list[Offer]) -> list[Offer]:
+        """
+        Fill in the seller (and a missing photo) from each offer's details, at most
+        `enrich_concurrency` detail requests at a time across all callers. Offers whose
+        details cannot be fetched are returned as they are.
+        """
+
+        async def enrich(offer: Offer) -> Offer:
+            async with self._enrich_slots:
+                try:
+                    details = await self.get_offer_details(offer.id)
+                except (OlxUnavailableError, httpx.HTTPError, KeyError, ValueError) as e:
+                    logging.debug(f"No details for offer {offer.id}: {e}")
+                    return offer
+            self.enriched += 1
+            return dataclasses.replace(offer, seller=details.seller, photo=offer.photo or details.photo)
+
+        return list(await asyncio.gather(*(enrich(offer) for offer in offers)))
+
+
+# Shared client for the whole process
+olx_client = OlxClient.from_env()
 
 
 async def get_city_info(query: str) -> dict[Any, Any]:
     """
     Async call to OLX geo-encoder API to get city info by name.
     """
-    if len(query) < 3:
-        raise ValueError("Query must be at least 3 characters long.")
-    params = {"query": query}
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-        "AppleWebKit/537.36 (KHTML, like Gecko) "
-        "Chrome/123.0.0.0 Safari/537.36",
-        "Accept": "application/json",
-    }
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url=URL_OLX_LOCATAION, params=params, headers=headers)
-        response.raise_for_status()
-    return response.json()  # type: ignore[no-any-return]
+    return await olx_client.get_city_info(query)
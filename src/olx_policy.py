@@ -0,0 +1,104 @@
+"""
+Failure handling for calls to OLX: which answers are retried, how long to back off, and a
+circuit breaker that stops sending requests to an upstream that keeps failing.
+"""
+
+import random
+import time
+from email.utils import parsedate_to_datetime
+from enum import Enum
+from typing import Callable
+
+import httpx
+
+# OLX answers 429, or 403 from its bot protection, when we are too fast
+THROTTLE_STATUSES = frozenset({403, 429})
+RETRY_STATUSES = frozenset({500, 502, 503, 504}) | THROTTLE_STATUSES
+
+
+class OlxUnavailableError(Exception):
+    """
+    OLX did not give a usable answer: throttled, failing after retries, or the circuit is open.
+    """
+
+
+class CircuitOpenError(OlxUnavailableError):
+    pass
+
+
+def backoff_delay(attempt: int, base: float, cap: float, rng: Callable[[], float] = random.random) -> float:
+    """
+    "Full jitter" exponential backoff: uniform in [0, min(cap, base * 2**attempt)].
+    """
+    return float(rng() * min(cap, base * 2**attempt))
+
+
+def retry_after(response: httpx.Response) -> float | None:
+    """
+    Seconds from a `Retry-After` header (delta seconds or HTTP date), if any.
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return float(max(0.0, parsedate_to_datetime(value).timestamp() - time.time()))
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` failed attempts in a row and rejects calls for `reset_timeout`.
+    Then one probe call is let through (again every `reset_timeout` until one reports back):
+    success closes the circuit, failure opens it for another period.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self.rejected = 0
+
+    def retry_in(self) -> float:
+        if self.state is CircuitState.CLOSED:
+            return 0.0
+        return max(0.0, self._opened_at + self.reset_timeout - self._clock())
+
+    def allow(self) -> bool:
+        if self.state is CircuitState.CLOSED:
+            return True
+        if self.retry_in() > 0:
+            self.rejected += 1
+            return False
+        # Let one probe through and re-arm the timer in case it never reports back
+        self.state = CircuitState.HALF_OPEN
+        self._opened_at = self._clock()
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.state = CircuitState.CLOSED
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state is CircuitState.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = CircuitState.OPEN
+            self._opened_at = self._clock()
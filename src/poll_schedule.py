@@ -0,0 +1,200 @@
+"""
+Adaptive per-query poll intervals.
+
+Each distinct query keeps an exponentially weighted estimate of its ad arrival rate: new ads and
+elapsed time are both summed with weights halving every POLL_RATE_HALF_LIFE, so polls at
+different intervals count by the time they cover and a single lucky ad does not swing the rate.
+
+For a Poisson stream polled every T seconds an ad waits T/2 on average, so the ad-weighted delay
+sum(rate_i * T_i / 2) under a budget of sum(1 / T_i) polls per second is smallest with T_i
+proportional to 1 / sqrt(rate_i): hot queries are polled more often, quiet ones less, and the
+total request rate stays what fixed scheduling would spend. Intervals are clamped to
+[POLL_MIN_INTERVAL, POLL_MAX_INTERVAL]; queries without a measured rate keep the fixed interval.
+
+Due queries come from a heap of (due time, query key); stale entries are skipped when popped.
+"""
+
+import heapq
+import itertools
+import math
+import os
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterable
+
+POLL_ADAPTIVE = os.getenv("POLL_ADAPTIVE", "true").lower() in ("1", "true", "yes")
+POLL_MIN_INTERVAL = float(os.getenv("POLL_MIN_INTERVAL", "60"))
+POLL_MAX_INTERVAL = float(os.getenv("POLL_MAX_INTERVAL", "3600"))
+# Polls per second over all queries, 0 spends what polling each at the fixed interval would
+POLL_BUDGET = float(os.getenv("POLL_BUDGET", "0"))
+# Age (seconds) at which observed ads count half in the arrival rate estimate
+POLL_RATE_HALF_LIFE = float(os.getenv("POLL_RATE_HALF_LIFE", str(6 * 3600)))
+# Queries quieter than this (ads per second, default one a day) are treated as this quiet
+POLL_RATE_FLOOR = float(os.getenv("POLL_RATE_FLOOR", str(1 / 86400)))
+
+
+@dataclass(slots=True)
+class QuerySchedule:
+    # Decayed sums of new ads and of the seconds they arrived in
+    ads: float = 0.0
+    span: float = 0.0
+    polled_at: float | None = None
+    due_at: float = 0.0
+    interval: float = 0.0
+
+    @property
+    def rate(self) -> float | None:
+        """
+        Estimated new ads per second, None until two polls were made.
+        """
+        return self.ads / self.span if self.span else None
+
+
+class PollScheduler:
+    """
+    Next poll time per query key, see the module docstring.
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        *,
+        min_interval: float = POLL_MIN_INTERVAL,
+        max_interval: float = POLL_MAX_INTERVAL,
+        budget: float = POLL_BUDGET,
+        half_life: float = POLL_RATE_HALF_LIFE,
+        rate_floor: float = POLL_RATE_FLOOR,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.interval = interval
+        self.min_interval = min(min_interval, interval)
+        self.max_interval = max(max_interval, interval)
+        self.budget = budget
+        self.half_life = half_life
+        self.rate_floor = rate_floor
+        self._clock = clock
+        self._queries: dict[str, QuerySchedule] = {}
+        self._heap: list[tuple[float, int, str]] = []
+        self._order = itertools.count()
+        # sum(sqrt(rate)) over queries with a measured rate, and how many have none yet
+        self._weights = 0.0
+        self._unmeasured = 0
+
+    def __len__(self) -> int:
+        return len(self._queries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._queries
+
+    def _weight(self, rate: float) -> float:
+        return math.sqrt(max(rate, self.rate_floor))
+
+    def _interval(self, schedule: QuerySchedule) -> float:
+        if schedule.rate is None:
+            return self.interval
+        budget = self.budget or len(self._queries) / self.interval
+        # Polls per second left once unmeasured queries had their fixed share
+        budget = max(budget - self._unmeasured / self.interval, len(self._queries) / self.max_interval)
+        interval = self._weights / budget / self._weight(schedule.rate)
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def _push(self, key: str, schedule: QuerySchedule, due_at: float) -> None:
+        schedule.due_at = due_at
+        heapq.heappush(self._heap, (due_at, next(self._order), key))
+
+    def sync(self, keys: Iterable[str]) -> None:
+        """
+        Track exactly `keys`: new ones are due right away, missing ones are forgotten.
+        """
+        keys = set(keys)
+        now = self._clock()
+        for key in self._queries.keys() - keys:
+            del self._queries[key]
+        for key in keys - self._queries.keys():
+            schedule = self._queries[key] = QuerySchedule(interval=self.interval)
+            self._push(key, schedule, now)
+        # Recomputed in full here so incremental updates cannot drift
+        self._weights = sum(self._weight(s.rate) for s in self._queries.values() if s.rate is not None)
+        self._unmeasured = sum(1 for s in self._queries.values() if s.rate is None)
+        if len(self._heap) > 2 * len(self._queries) + 64:
+            self._heap = [entry for entry in self._heap if self._is_current(entry)]
+            heapq.heapify(self._heap)
+
+    def _is_current(self, entry: tuple[float, int, str]) -> bool:
+        schedule = self._queries.get(entry[2])
+        return schedule is not None and schedule.due_at == entry[0]
+
+    def pop_due(self, now: float | None = None) -> list[str]:
+        """
+        Keys due by `now`, most overdue first. They stay out of the heap until `observe()` or
+        `postpone()` schedules their next poll.
+        """
+        now = self._clock() if now is None else now
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            if self._is_current(entry):
+                self._queries[entry[2]].due_at = math.inf
+                due.append(entry[2])
+        return due
+
+    def next_due(self) -> float | None:
+        """
+        Clock time of the earliest scheduled poll, None when nothing is scheduled.
+        """
+        while self._heap and not self._is_current(self._heap[0]):
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def observe(self, key: str, new_ads: int, now: float | None = None) -> None:
+        """
+        Record a finished poll of `key` that found `new_ads` new ads and schedule the next one.
+        """
+        schedule = self._queries.get(key)
+        if schedule is None:
+            return
+        now = self._clock() if now is None else now
+        if schedule.polled_at is not None and now > schedule.polled_at:
+            elapsed = now - schedule.polled_at
+            if schedule.rate is None:
+                self._unmeasured -= 1
+            else:
+                self._weights -= self._weight(schedule.rate)
+            decay = 0.5 ** (elapsed / self.half_life)
+            schedule.ads = schedule.ads * decay + new_ads
+            schedule.span = schedule.span * decay + elapsed
+            self._weights += self._weight(schedule.ads / schedule.span)
+        schedule.polled_at = now
+        schedule.interval = self._interval(schedule)
+        self._push(key, schedule, now + schedule.interval)
+
+    def postpone(self, key: str, now: float | None = None) -> None:
+        """
+        Schedule the next poll of `key` after a poll that failed or was left to another worker.
+        """
+        schedule = self._queries.get(key)
+        if schedule is None:
+            return
+        now = self._clock() if now is None else now
+        self._push(key, schedule, now + schedule.interval)
+
+    def expected_delays(self) -> dict[str, float]:
+        """
+        Query key -> mean seconds between an ad appearing and the poll that finds it.
+        """
+        return {key: schedule.interval / 2 for key, schedule in self._queries.items()}
+
+    def stats(self) -> dict[str, float]:
+        schedules = list(self._queries.values())
+        measured = [s for s in schedules if s.rate is not None]
+        ads = sum(s.rate for s in measured if s.rate is not None)
+        delay = sum(s.rate * s.interval / 2 for s in measured if s.rate is not None)
+        return {
+            "queries": len(schedules),
+            "unmeasured": len(schedules) - len(measured),
+            "polls_per_second": sum(1 / s.interval for s in schedules),
+            "ads_per_second": ads,
+            # Mean over ads (not over queries) of the expected notification delay
+            "expected_delay_avg": delay / ads if ads else 0.0,
+            "expected_delay_max": max((s.interval / 2 for s in schedules), default=0.0),
+        }
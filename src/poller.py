@@ -0,0 +1,543 @@
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Iterable, NamedTuple
+
+from db import (
+    add_digest_offers,
+    get_active_subscriptions,
+    update_search_filter_watermarks,
+)
+from digest import window_end
+from matching import FilterMatcher, MatchFilter
+from models import DeliveryModeEnum, SearchFilter, UserSearchFilters
+from offers import Offer
+from olx_api import OFFERS_PAGE_SIZE, OffersPage, OlxClient, olx_client
+from olx_policy import OlxUnavailableError
+from poll_schedule import POLL_ADAPTIVE, PollScheduler
+from price_history import PriceHistory, price_history
+from seen_store import SeenStore
+from sharding import ShardCoordinator
+
+POLL_INTERVAL = float(os.getenv("POLL_INTERVAL", "300"))
+POLL_CONCURRENCY = int(os.getenv("POLL_CONCURRENCY", "5"))
+# Safety cap for a cycle that never reaches the watermark (e.g. after a long outage)
+POLL_MAX_PAGES = int(os.getenv("POLL_MAX_PAGES", "10"))
+# Set to false when polling is done by separate sharded workers (poller_worker.py)
+POLLER_EMBEDDED = os.getenv("POLLER_EMBEDDED", "true").lower() in ("1", "true", "yes")
+# Fetch each new offer's details (seller) before delivery, see OlxClient.enrich_offers
+POLL_ENRICH_OFFERS = os.getenv("POLL_ENRICH_OFFERS", "false").lower() in ("1", "true", "yes")
+# With adaptive scheduling: how often subscriptions are reloaded to pick up new queries
+POLL_RELOAD_INTERVAL = float(os.getenv("POLL_RELOAD_INTERVAL", "60"))
+
+Deliver = Callable[[int, list[Offer]], Awaitable[None]]
+LoadSubscriptions = Callable[[], Awaitable[list[tuple[SearchFilter, int, UserSearchFilters]]]]
+SaveWatermarks = Callable[[set[int], "Watermark"], Awaitable[None]]
+# filter ids -> (filter id, telegram_id, subscription id) of their subscriptions not paused
+LoadActive = Callable[[set[int]], Awaitable[list[tuple[int, int, int]]]]
+# (subscription id, digest window end, offers)
+BufferDigests = Callable[[list[tuple[int, datetime, list[Offer]]]], Awaitable[object]]
+
+
+class Watermark(NamedTuple):
+    """
+    Newest (created/refreshed time, ad id) seen for a query. Tuples compare in that order.
+    """
+
+    at: datetime
+    ad_id: int
+
+
+def offer_watermark(offer: Offer) -> Watermark | None:
+    if offer.refreshed_at is None:
+        return None
+    return Watermark(at=offer.refreshed_at, ad_id=offer.id)
+
+
+@dataclass(frozen=True, slots=True)
+class SearchQuery:
+    """
+    One distinct upstream search: location and category. Currency and price ranges are
+    matched locally (see matching.py), so all filters of a city/category share it.
+    """
+
+    category_id: int
+    city_id: int
+    region_id: int
+
+    @classmethod
+    def from_filter(cls, search_filter: SearchFilter) -> "SearchQuery":
+        return cls(
+            category_id=search_filter.category_id,
+            city_id=search_filter.city_id,
+            region_id=search_filter.region_id,
+        )
+
+    @property
+    def key(self) -> str:
+        """
+        Stable string form, used as the seen-ads store key.
+        """
+        return f"{self.category_id}:{self.city_id}:{self.region_id}"
+
+    def params(self) -> dict[str, Any]:
+        return {
+            "category_id": self.category_id,
+            "city_id": self.city_id,
+            "region_id": self.region_id,
+        }
+
+
+@dataclass(slots=True)
+class QueryGroup:
+    """
+    Everything subscribed to one distinct query.
+    """
+
+    # filter id -> chat ids subscribed with instant delivery
+    subscribers: dict[int, set[int]] = field(default_factory=dict)
+    # filter id -> subscriptions delivered as digests
+    digests: dict[int, list[UserSearchFilters]] = field(default_factory=dict)
+    filters: dict[int, MatchFilter] = field(default_factory=dict)
+    watermark: Watermark | None = None
+
+    @property
+    def filter_ids(self) -> set[int]:
+        return set(self.filters)
+
+    @property
+    def chat_ids(self) -> set[int]:
+        return set().union(*self.subscribers.values())
+
+
+def add_subscription(
+    groups: dict[SearchQuery, QueryGroup],
+    search_filter: SearchFilter,
+    telegram_id: int,
+    subscription: UserSearchFilters,
+) -> None:
+    """
+    Add one subscription to the group of its query, raising the group's watermark if needed.
+    Adding a subscription that is already there (e.g. resumed twice) replaces it.
+    """
+    if search_filter.id is None:
+        return
+    group = groups.setdefault(SearchQuery.from_filter(search_filter), QueryGroup())
+    if subscription.delivery_mode == DeliveryModeEnum.INSTANT:
+        group.subscribers.setdefault(search_filter.id, set()).add(telegram_id)
+    else:
+        digests = group.digests.setdefault(search_filter.id, [])
+        digests[:] = [other for other in digests if other.id != subscription.id]
+        digests.append(subscription)
+    group.filters[search_filter.id] = MatchFilter.from_filter(search_filter)
+    if search_filter.watermark_at is not None and search_filter.watermark_id is not None:
+        watermark_at = search_filter.watermark_at
+        if watermark_at.tzinfo is None:
+            # SQLite hands timezone-aware columns back naive, they are stored in UTC
+            watermark_at = watermark_at.replace(tzinfo=timezone.utc)
+        watermark = Watermark(watermark_at, search_filter.watermark_id)
+        group.watermark = max(group.watermark, watermark) if group.watermark else watermark
+
+
+def group_subscriptions(rows: Iterable[tuple[SearchFilter, int, UserSearchFilters]]) -> dict[SearchQuery, QueryGroup]:
+    """
+    Map each distinct query to its filters, their subscribers and the most advanced watermark.
+    """
+    groups: dict[SearchQuery, QueryGroup] = {}
+    for search_filter, telegram_id, subscription in rows:
+        add_subscription(groups, search_filter, telegram_id, subscription)
+    return groups
+
+
+@dataclass(slots=True)
+class PollResult:
+    offers: list[Offer]
+    watermark: Watermark | None
+    pages: int
+    # Changed pages, cached once their offers are processed (see `OlxClient.save_pages`)
+    changed: list[OffersPage] = field(default_factory=list)
+
+
+class ListingPoller:
+    """
+    Fetches every distinct search and fans new offers out to its subscribers.
+
+    Upstream volume grows with the number of distinct queries, not with the number of users.
+    `run_cycle()` polls every query once; the background loop polls each one when `schedule`
+    says it is due (see poll_schedule.py), or every `interval` seconds with `adaptive=False`.
+
+    Pauses and deletions reach an embedded poller at once through `update_subscription`. A
+    poller in another process (poller_worker.py) is given `load_active` instead: before new
+    offers of a query are delivered, its subscriptions are checked against the database.
+    """
+
+    def __init__(
+        self,
+        deliver: Deliver,
+        client: OlxClient = olx_client,
+        load_subscriptions: LoadSubscriptions = get_active_subscriptions,
+        seen_store: SeenStore | None = None,
+        save_watermarks: SaveWatermarks = update_search_filter_watermarks,
+        shard: ShardCoordinator | None = None,
+        matcher: FilterMatcher | None = None,
+        history: PriceHistory = price_history,
+        buffer_digests: BufferDigests = add_digest_offers,
+        schedule: PollScheduler | None = None,
+        load_active: LoadActive | None = None,
+        *,
+        interval: float = POLL_INTERVAL,
+        concurrency: int = POLL_CONCURRENCY,
+        max_pages: int = POLL_MAX_PAGES,
+        enrich_offers: bool = POLL_ENRICH_OFFERS,
+        adaptive: bool = POLL_ADAPTIVE,
+        reload_interval: float = POLL_RELOAD_INTERVAL,
+    ) -> None:
+        self._deliver = deliver
+        self._client = client
+        self._load_subscriptions = load_subscriptions
+        self.interval = interval
+        self.concurrency = concurrency
+        self.seen_store = seen_store if seen_store is not None else SeenStore()
+        self._save_watermarks = save_watermarks
+        self.shard = shard
+        self.matcher = matcher if matcher is not None else FilterMatcher()
+        self.history = history
+        self._buffer_digests = buffer_digests
+        self._load_active = load_active
+        self.max_pages = max_pages
+        self.enrich_offers = enrich_offers
+        self.schedule = schedule if schedule is not None else PollScheduler(interval)
+        self.adaptive = adaptive
+        self.reload_interval = reload_interval
+        # Latest watermark and pages fetched per query, plus how many pages cycles needed overall
+        self.watermarks: dict[SearchQuery, Watermark] = {}
+        self.pages_last_cycle: dict[SearchQuery, int] = {}
+        self.pages_histogram: Counter[int] = Counter()
+        self._task: asyncio.Task[None] | None = None
+        self._saving: asyncio.Future[None] | None = None
+        self._groups: dict[SearchQuery, QueryGroup] = {}
+        self._reload_at = 0.0
+        self._saved_at = time.monotonic()
+        self.cycles = 0
+        self.polls = 0
+        self.requests_made = 0
+        self.pages_unchanged = 0
+
+    async def fetch_since(self, query: SearchQuery, watermark: Watermark | None) -> PollResult:
+        """
+        Walk newest-first pages until reaching `watermark` territory.
+
+        Promoted ads are pinned on top out of order, so they neither stop pagination nor
+        move the watermark. Without a watermark only the first page is read. With one, a page
+        that is the same as when it was last processed has nothing new on or past it and is not
+        diffed at all (see `OlxClient.get_changed_offers`).
+        """
+        offers: list[Offer] = []
+        changed: list[OffersPage] = []
+        newest = watermark
+        pages = 0
+        while pages < self.max_pages:
+            offset = pages * OFFERS_PAGE_SIZE
+            page: list[Offer] | None
+            if watermark is None:
+                page = await self._client.get_offers(query.params(), offset=offset)
+            elif (fetched := await self._client.get_changed_offers(query.params(), offset=offset)) is not None:
+                changed.append(fetched)
+                page = fetched.offers
+            else:
+                page = None
+            pages += 1
+            self.requests_made += 1
+            if page is None:
+                self.pages_unchanged += 1
+                break
+            reached = watermark is None
+            for offer in page:
+                mark = None if offer.promoted else offer_watermark(offer)
+                if mark is None:
+                    offers.append(offer)
+                    continue
+                if watermark is not None and mark <= watermark:
+                    reached = True
+                    continue
+                offers.append(offer)
+                if newest is None or mark > newest:
+                    newest = mark
+            if reached or len(page) < OFFERS_PAGE_SIZE:
+                break
+        return PollResult(offers=offers, watermark=newest, pages=pages, changed=changed)
+
+    async def poll_query(self, query: SearchQuery, group: QueryGroup | None = None) -> list[Offer]:
+        """
+        Offers of `query` not seen in earlier cycles. The first poll only primes the seen set.
+        """
+        group = group or QueryGroup()
+        previous = max(filter(None, (group.watermark, self.watermarks.get(query))), default=None)
+        result = await self.fetch_since(query, previous)
+        self.pages_last_cycle[query] = result.pages
+        self.pages_histogram[result.pages] += 1
+        if result.watermark is not None and result.watermark != previous:
+            self.watermarks[query] = result.watermark
+            if group.filter_ids:
+                await self._save_watermarks(group.filter_ids, result.watermark)
+
+        offers = result.offers
+        ids = [offer.id for offer in offers]
+        # Without a watermark there is no telling what is new: remember everything, send nothing.
+        # With one (e.g. the query just moved here from another worker) the offers are past it.
+        if query.key not in self.seen_store and previous is None:
+            self.seen_store.add(query.key, ids)
+            self.history.record(query.city_id, query.region_id, query.category_id, offers)
+            return []
+        new_ids = set(self.seen_store.filter_new(query.key, ids))
+        new_offers = [offer for offer in offers if offer.id in new_ids]
+        # Each offer's price is recorded once, when it is first seen
+        self.history.record(query.city_id, query.region_id, query.category_id, new_offers)
+        if self.enrich_offers and new_offers:
+            new_offers = await self._client.enrich_offers(new_offers)
+        await self._client.save_pages(result.changed)
+        return new_offers
+
+    def match_subscribers(
+        self, query: SearchQuery, group: QueryGroup, offers: list[Offer]
+    ) -> tuple[dict[int, list[Offer]], list[tuple[UserSearchFilters, list[Offer]]]]:
+        """
+        Chat id -> new offers matching at least one of its instant filters (each offer once per
+        chat), and the matching offers of every digest subscription.
+        """
+        self.matcher.index(query, group.filters.values())
+        per_chat: dict[int, dict[int, Offer]] = {}
+        digests: list[tuple[UserSearchFilters, list[Offer]]] = []
+        for filter_id, matched in self.matcher.match(query, offers).items():
+            for chat_id in group.subscribers.get(filter_id, ()):
+                per_chat.setdefault(chat_id, {}).update((offer.id, offer) for offer in matched)
+            digests.extend((subscription, matched) for subscription in group.digests.get(filter_id, ()))
+        return {chat_id: list(chat_offers.values()) for chat_id, chat_offers in per_chat.items()}, digests
+
+    async def _fan_out(self, per_chat: dict[int, list[Offer]]) -> None:
+        for chat_id, offers in per_chat.items():
+            try:
+                await self._deliver(chat_id, offers)
+            except Exception:
+                logging.exception(f"Failed to deliver {len(offers)} offers to chat {chat_id}.")
+
+    async def _buffer(self, digests: list[tuple[UserSearchFilters, list[Offer]]]) -> None:
+        now = datetime.now(timezone.utc)
+        pending = [
+            (subscription.id, window_end(subscription.delivery_mode, subscription.digest_interval, now), offers)
+            for subscription, offers in digests
+            if subscription.id is not None
+        ]
+        try:
+            await self._buffer_digests(pending)
+        except Exception:
+            logging.exception(f"Failed to buffer offers for {len(pending)} digests.")
+
+    async def _load_groups(self) -> dict[SearchQuery, QueryGroup]:
+        groups = group_subscriptions(await self._load_subscriptions())
+        # Forget queries nobody is subscribed to any more
+        for key in set(self.seen_store.keys()) - {query.key for query in groups}:
+            self.seen_store.drop(key)
+        for query in self.watermarks.keys() - groups.keys():
+            del self.watermarks[query]
+            self.pages_last_cycle.pop(query, None)
+        for matched in set(self.matcher.keys()) - groups.keys():
+            self.matcher.drop(matched)
+        self.schedule.sync(query.key for query in groups)
+        self._groups = groups
+        self._reload_at = time.monotonic() + self.reload_interval
+        return groups
+
+    def update_subscription(
+        self, telegram_id: int, search_filter: SearchFilter, subscription: UserSearchFilters, active: bool
+    ) -> None:
+        """
+        Apply a subscription being resumed (`active`), paused or deleted to the loaded groups
+        right away instead of on the next reload. A query left without subscribers is no longer
+        scheduled, a new one is due at once.
+        """
+        filter_id = search_filter.id
+        if filter_id is None:
+            return
+        query = SearchQuery.from_filter(search_filter)
+        if active:
+            known = query in self._groups
+            add_subscription(self._groups, search_filter, telegram_id, subscription)
+            if not known:
+                self.schedule.sync(query.key for query in self._groups)
+            return
+        group = self._groups.get(query)
+        if group is None:
+            return
+        chat_ids = group.subscribers.get(filter_id)
+        if chat_ids is not None:
+            chat_ids.discard(telegram_id)
+            if not chat_ids:
+                del group.subscribers[filter_id]
+        digests = [other for other in group.digests.get(filter_id, ()) if other.id != subscription.id]
+        if digests:
+            group.digests[filter_id] = digests
+        else:
+            group.digests.pop(filter_id, None)
+        if filter_id not in group.subscribers and filter_id not in group.digests:
+            group.filters.pop(filter_id, None)
+        if not group.filters:
+            del self._groups[query]
+            self.schedule.sync(query.key for query in self._groups)
+
+    async def _drop_inactive(self, query: SearchQuery, group: QueryGroup) -> None:
+        """
+        Remove the subscriptions of `group` paused or deleted since the last reload.
+        """
+        assert self._load_active is not None
+        try:
+            active = await self._load_active(group.filter_ids)
+        except Exception:
+            # Better a late pause than lost ads, they are marked as seen already
+            logging.exception(f"Could not check the subscriptions of {query}, delivering to all of them.")
+            return
+        chats = {(filter_id, telegram_id) for filter_id, telegram_id, _ in active}
+        subscription_ids = {subscription_id for _, _, subscription_id in active}
+        for filter_id in list(group.filters):
+            subscribers = {chat_id for chat_id in group.subscribers.pop(filter_id, ()) if (filter_id, chat_id) in chats}
+            if subscribers:
+                group.subscribers[filter_id] = subscribers
+            digests = [other for other in group.digests.pop(filter_id, ()) if other.id in subscription_ids]
+            if digests:
+                group.digests[filter_id] = digests
+            if filter_id not in group.subscribers and filter_id not in group.digests:
+                del group.filters[filter_id]
+        if not group.filters and self._groups.get(query) is group:
+            del self._groups[query]
+            self.schedule.sync(query.key for query in self._groups)
+
+    async def _poll_groups(self, groups: dict[SearchQuery, QueryGroup], lease: float) -> None:
+        if self.shard is not None:
+            claimed = await self.shard.claim((query.key for query in groups), lease)
+            for query in groups:
+                if query.key not in claimed:
+                    self.schedule.postpone(query.key)
+            groups = {query: group for query, group in groups.items() if query.key in claimed}
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def poll(query: SearchQuery, group: QueryGroup) -> None:
+            async with semaphore:
+                try:
+                    new_offers = await self.poll_query(query, group)
+                except OlxUnavailableError as e:
+                    # Expected while OLX throttles us or the circuit is open, retried next cycle
+                    logging.warning(f"Polling skipped for {query}: {e}")
+                    self.schedule.postpone(query.key)
+                    return
+                except Exception:
+                    logging.exception(f"Polling failed for {query}.")
+                    self.schedule.postpone(query.key)
+                    return
+            self.polls += 1
+            self.schedule.observe(query.key, len(new_offers))
+            if new_offers and self._load_active is not None:
+                await self._drop_inactive(query, group)
+            if new_offers and group.filters:
+                per_chat, digests = self.match_subscribers(query, group, new_offers)
+                await self._fan_out(per_chat)
+                if digests:
+                    await self._buffer(digests)
+
+        await asyncio.gather(*(poll(query, group) for query, group in groups.items()))
+
+    async def _finish_cycle(self) -> None:
+        self.cycles += 1
+        self.seen_store.evict()
+        # Only the poller mutates the store, so it is safe to write it out between cycles.
+        self._saving = asyncio.ensure_future(self._save())
+        await asyncio.shield(self._saving)
+        self._saved_at = time.monotonic()
+
+    async def run_cycle(self) -> None:
+        """
+        Poll every query once, whether due or not.
+        """
+        await self.matcher.rates.refresh()
+        groups = await self._load_groups()
+        await self._poll_groups(groups, self.interval)
+        await self._finish_cycle()
+        logging.info(f"Poll cycle {self.cycles}: {len(groups)} distinct queries.")
+
+    async def run_due(self) -> float:
+        """
+        Poll the queries that are due now, returns how long to wait before calling again.
+        Subscriptions are reloaded every `reload_interval` and the seen set saved every `interval`.
+        """
+        await self.matcher.rates.refresh()
+        now = time.monotonic()
+        if now >= self._reload_at:
+            await self._load_groups()
+        due = set(self.schedule.pop_due(now))
+        groups = {query: group for query, group in self._groups.items() if query.key in due}
+        if groups:
+            await self._poll_groups(groups, self.schedule.min_interval)
+        now = time.monotonic()
+        if now - self._saved_at >= self.interval:
+            await self._finish_cycle()
+        next_due = self.schedule.next_due()
+        wake_at = self._reload_at if next_due is None else min(next_due, self._reload_at)
+        return max(0.0, wake_at - now)
+
+    async def _save(self) -> None:
+        await asyncio.to_thread(self.seen_store.save)
+        await self.history.save()
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "cycles": self.cycles,
+            "polls": self.polls,
+            "requests": self.requests_made,
+            "queries": len(self.watermarks),
+            "pages_last_cycle": sum(self.pages_last_cycle.values()),
+            "pages_unchanged": self.pages_unchanged,
+            "seen_ids": len(self.seen_store),
+            "seen_bytes": self.seen_store.nbytes(),
+            **{f"schedule_{name}": value for name, value in self.schedule.stats().items()},
+        }
+
+    async def run(self) -> None:
+        # Loading rebuilds the Bloom filter, seconds for millions of ids
+        await asyncio.to_thread(self.seen_store.load)
+        while True:
+            started = time.monotonic()
+            if self.adaptive:
+                try:
+                    wait = await self.run_due()
+                except Exception:
+                    logging.exception("Polling due queries failed.")
+                    wait = self.schedule.min_interval
+                await asyncio.sleep(wait)
+                continue
+            try:
+                await self.run_cycle()
+            except Exception:
+                logging.exception("Poll cycle failed.")
+            await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run(), name="listing-poller")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._saving is not None:
+            await self._saving
+        self.seen_store.save()
+        self.history.flush()
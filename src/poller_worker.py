@@ -0,0 +1,130 @@
+"""
+Standalone poller worker. Run as many as needed, on one host or several; they split
+the distinct search queries between them through Postgres (see sharding.py).
+
+Each worker needs an id that stays the same across restarts (`--worker-id` or
+`POLLER_WORKER_ID`): its delivered-ids store and price history files are named after it,
+so a restarted worker carries on where it stopped instead of starting empty.
+
+Usage: python src/poller_worker.py --worker-id poller-1 [--metrics-port 9101]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+from pathlib import Path
+
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.enums import ParseMode
+
+from constants import API_TOKEN
+from db import close_db, get_active_subscription_keys, warm_db
+from metrics import (
+    METRICS_ENABLED,
+    METRICS_PORT,
+    start_loop_monitor,
+    start_server,
+    stop_loop_monitor,
+    track_stats,
+)
+from notifier import NOTIFY_BOT_SHARE, Notifier
+from offers import Offer
+from olx_api import olx_client
+from poller import ListingPoller
+from price_history import PriceHistory
+from seen_store import SEEN_STORE_PATH, SeenStore
+from sharding import ShardCoordinator
+
+POLLER_WORKER_ID = os.getenv("POLLER_WORKER_ID", "")
+
+
+def _warn_legacy_files() -> None:
+    # Worker ids used to default to host:pid, leaving one set of files per run behind
+    pattern = f"{SEEN_STORE_PATH.stem}.{socket.gethostname()}_*{SEEN_STORE_PATH.suffix}"
+    legacy = sorted(path.name for path in SEEN_STORE_PATH.parent.glob(pattern))
+    if legacy:
+        logging.warning(
+            f"Files of earlier host:pid worker ids are no longer used: {', '.join(legacy)} "
+            "(and their price history). Remove them once their ads are older than SEEN_MAX_AGE."
+        )
+
+
+async def run(worker_id: str, metrics_port: int) -> None:
+    if not API_TOKEN:
+        raise ValueError("No API token provided. Please set the API_TOKEN environment variable.")
+    bot = Bot(token=API_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    notifier = Notifier(bot)
+    # Telegram's global limit is per bot: split what the bot leaves between the live workers
+    shard = ShardCoordinator(
+        worker_id, on_workers=lambda workers: notifier.set_global_share((1 - NOTIFY_BOT_SHARE) / len(workers))
+    )
+    # Every worker keeps its own delivered-ids file
+    safe_id = worker_id.replace(":", "_").replace("/", "_")
+    seen_store = SeenStore(Path(SEEN_STORE_PATH).with_name(f"{SEEN_STORE_PATH.stem}.{safe_id}{SEEN_STORE_PATH.suffix}"))
+    # ... and its own price history files, the bot's /stats reads all of them
+    history = PriceHistory(name=safe_id)
+
+    async def deliver(chat_id: int, offers: list[Offer]) -> None:
+        notifier.enqueue_offers(chat_id, offers)
+
+    # Pauses and deletions are made in the bot's process, check them before delivering
+    poller = ListingPoller(
+        deliver=deliver, seen_store=seen_store, shard=shard, history=history, load_active=get_active_subscription_keys
+    )
+    metrics_runner = None
+    if METRICS_ENABLED:
+        track_stats("notifier", notifier.stats)
+        track_stats("poller", poller.stats)
+        track_stats("olx", olx_client.stats)
+        track_stats("price_history", history.stats)
+        metrics_runner = await start_server(port=metrics_port)
+        start_loop_monitor()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    _warn_legacy_files()
+    history.open()
+    await asyncio.gather(warm_db(), olx_client.start())
+    await shard.start()
+    notifier.start()
+    poller.start()
+    logging.info(f"Poller worker {worker_id} started.")
+    try:
+        await stop.wait()
+    finally:
+        await poller.stop()
+        history.close()
+        await shard.stop()
+        await notifier.stop()
+        await olx_client.close()
+        await bot.session.close()
+        await close_db()
+        await stop_loop_monitor()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        logging.info(f"Poller worker {worker_id} stopped.")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run one sharded OLX poller worker.")
+    parser.add_argument(
+        "--worker-id",
+        default=POLLER_WORKER_ID or None,
+        required=not POLLER_WORKER_ID,
+        help="stable across restarts, e.g. poller-1 (default: POLLER_WORKER_ID)",
+    )
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="used when METRICS_ENABLED is set")
+    args = parser.parse_args()
+    asyncio.run(run(args.worker_id, args.metrics_port))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,601 @@
+"""
+Price history of polled offers and a quantile index over it, behind the /stats command.
+
+Every writer (the embedded poller, or each sharded worker) owns two files in
+`PRICE_HISTORY_DIR`, `<name>.arc` and `<name>.idx`; readers merge the indexes of all writers.
+
+Archive: append-only raw history, one frame per flush. Columns are stored one after the
+other, zlib-compressed; ad ids and times are delta-encoded first (little endian):
+
+    frame    magic(8s) row_count(u32) compressed column sizes (8 x u32)
+    columns  ad_id(q, delta) observed_at(q, delta) city_id(I) region_id(I) category_id(I)
+             currency(B) price(d) price_uah(d)
+
+Index: log-bucketed UAH price histograms per (city, category, day), so a quantile over a
+time window sums a few hundred small histograms instead of scanning raw rows. Histograms
+are updated in memory as offers arrive and merged into the file on flush; the file is
+read through mmap.
+
+    header   magic(8s) key_count(u32) keys_offset(u64)
+    blocks   per key: days (day_count x DAY), counts (entry_count x u32),
+             bins (entry_count x u16), zero padding to 4 bytes
+    keys     key_count x KEY, sorted by (city_id, category_id)
+
+A bin `i` holds prices in (GAMMA^(i-1), GAMMA^i], quantiles are accurate to
+`PRICE_HISTORY_ACCURACY` (1%) relative error.
+"""
+
+import asyncio
+import bisect
+import logging
+import math
+import mmap
+import os
+import struct
+import time
+import zlib
+from array import array
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterable, Iterator, NamedTuple, Sequence
+
+from currency_rates import RateCache, rate_cache
+from matching import offer_price_uah
+from models import CurrencyEnum
+from offers import Offer
+
+PRICE_HISTORY_DIR = Path(os.getenv("PRICE_HISTORY_DIR", "data/price_history"))
+PRICE_HISTORY_ACCURACY = float(os.getenv("PRICE_HISTORY_ACCURACY", "0.01"))
+# Older days are dropped from the index on flush, the archive keeps them
+PRICE_HISTORY_MAX_DAYS = int(os.getenv("PRICE_HISTORY_MAX_DAYS", "365"))
+# How often readers look for index files rewritten by other writers
+PRICE_HISTORY_RELOAD = float(os.getenv("PRICE_HISTORY_RELOAD", "30"))
+PRICE_STATS_DAYS = int(os.getenv("PRICE_STATS_DAYS", "30"))
+
+GAMMA = (1 + PRICE_HISTORY_ACCURACY) / (1 - PRICE_HISTORY_ACCURACY)
+_LOG_GAMMA = math.log(GAMMA)
+DAY = 24 * 3600
+
+ARCHIVE_MAGIC = b"OLXPRC01"
+INDEX_MAGIC = b"OLXPIX01"
+# (name, typecode, delta-encoded)
+COLUMNS = (
+    ("ad_id", "q", True),
+    ("observed_at", "q", True),
+    ("city_id", "I", False),
+    ("region_id", "I", False),
+    ("category_id", "I", False),
+    ("currency", "B", False),
+    ("price", "d", False),
+    ("price_uah", "d", False),
+)
+FRAME = struct.Struct(f"<8sI{len(COLUMNS)}I")
+INDEX_HEADER = struct.Struct("<8sIQ")
+# city_id, category_id, block_offset, day_count, entry_count
+KEY = struct.Struct("<IIQII")
+# day, entries up to and including this day
+DAY_ENTRY = struct.Struct("<II")
+
+CURRENCIES = tuple(currency.value for currency in CurrencyEnum)
+_OTHER_CURRENCY = 255
+
+# day -> bin -> count
+DayHistograms = dict[int, Counter[int]]
+
+
+def price_bin(price: float) -> int:
+    return max(0, math.ceil(math.log(price) / _LOG_GAMMA))
+
+
+def bin_price(index: int) -> float:
+    """
+    Representative price of a bin, within the accuracy of every price in it.
+    """
+    return 2 * GAMMA**index / (GAMMA + 1)
+
+
+def _delta(values: array) -> array:
+    return array(values.typecode, (value - prev for value, prev in zip(values, [0, *values[:-1]])))
+
+
+def _undelta(values: array) -> array:
+    total = 0
+    restored = array(values.typecode)
+    for value in values:
+        total += value
+        restored.append(total)
+    return restored
+
+
+def read_archive(path: Path) -> Iterator[dict[str, array]]:
+    """
+    Frames of an archive file as column name -> values. A torn last frame is skipped.
+    """
+    with open(path, "rb") as f:
+        while header := f.read(FRAME.size):
+            if len(header) < FRAME.size:
+                logging.warning(f"Price archive {path} ends with a torn frame, ignored.")
+                return
+            magic, rows, *sizes = FRAME.unpack(header)
+            if magic != ARCHIVE_MAGIC:
+                raise ValueError(f"{path} is not a price archive.")
+            frame: dict[str, array] = {}
+            for (name, typecode, delta), size in zip(COLUMNS, sizes):
+                data = f.read(size)
+                if len(data) < size:
+                    logging.warning(f"Price archive {path} ends with a torn frame, ignored.")
+                    return
+                values = array(typecode)
+                values.frombytes(zlib.decompress(data))
+                frame[name] = _undelta(values) if delta else values
+            if any(len(values) != rows for values in frame.values()):
+                raise ValueError(f"{path} has a frame with mismatched columns.")
+            yield frame
+
+
+class _IndexFile:
+    """
+    One memory-mapped index file.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._file: BinaryIO | None = None
+        self._buf: mmap.mmap | None = None
+        self._keys: list[tuple[int, int]] = []
+        self._blocks: list[tuple[int, int, int]] = []
+        self.mtime = 0.0
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def open(self) -> bool:
+        self.close()
+        if not self.path.exists() or self.path.stat().st_size < INDEX_HEADER.size:
+            return False
+        self.mtime = self.path.stat().st_mtime
+        self._file = open(self.path, "rb")
+        self._buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, key_count, keys_offset = INDEX_HEADER.unpack_from(self._buf, 0)
+        if magic != INDEX_MAGIC:
+            self.close()
+            raise ValueError(f"{self.path} is not a price index file.")
+        # The key table is small (one row per city and category), blocks stay on disk
+        for city_id, category_id, offset, day_count, entry_count in KEY.iter_unpack(
+            self._buf[keys_offset : keys_offset + key_count * KEY.size]
+        ):
+            self._keys.append((city_id, category_id))
+            self._blocks.append((offset, day_count, entry_count))
+        return True
+
+    def close(self) -> None:
+        if self._buf is not None:
+            self._buf.close()
+        if self._file is not None:
+            self._file.close()
+        self._buf = self._file = None
+        self._keys, self._blocks = [], []
+
+    def keys(self) -> list[tuple[int, int]]:
+        return self._keys
+
+    def _read(self, typecode: str, start: int, count: int) -> array:
+        assert self._buf is not None
+        values = array(typecode)
+        values.frombytes(self._buf[start : start + count * values.itemsize])
+        return values
+
+    def _block(self, key: tuple[int, int]) -> tuple[int, array, array] | None:
+        """
+        (key position, days, cumulative entry ends) of `key`.
+        """
+        index = bisect.bisect_left(self._keys, key)
+        if index == len(self._keys) or self._keys[index] != key:
+            return None
+        offset, day_count, _ = self._blocks[index]
+        pairs = self._read("I", offset, 2 * day_count)
+        return index, pairs[0::2], pairs[1::2]
+
+    def _entries(self, index: int, first: int, last: int) -> tuple[array, array]:
+        """
+        (bins, counts) of entries [first, last) of the key at `index`.
+        """
+        offset, day_count, entry_count = self._blocks[index]
+        counts_start = offset + day_count * DAY_ENTRY.size
+        bins_start = counts_start + entry_count * 4
+        counts = self._read("I", counts_start + first * 4, last - first)
+        bins = self._read("H", bins_start + first * 2, last - first)
+        return bins, counts
+
+    def add_histogram(self, key: tuple[int, int], first_day: int, last_day: int, into: dict[int, int]) -> None:
+        """
+        Add the bin counts of `key` over [first_day, last_day] to `into`.
+        """
+        block = self._block(key)
+        if block is None:
+            return
+        index, days, ends = block
+        lo = bisect.bisect_left(days, first_day)
+        hi = bisect.bisect_right(days, last_day)
+        if lo >= hi:
+            return
+        # Days of one key are stored in order, so the window is one contiguous run of entries
+        bins, counts = self._entries(index, ends[lo - 1] if lo else 0, ends[hi - 1])
+        for price_index, count in zip(bins, counts):
+            into[price_index] = into.get(price_index, 0) + count
+
+    def block(self, key: tuple[int, int]) -> "_Block":
+        """
+        All of `key`'s histograms as columns, for merging.
+        """
+        block = self._block(key)
+        if block is None:
+            return _Block(array("I"), array("I"), array("I"), array("H"))
+        index, days, ends = block
+        bins, counts = self._entries(index, 0, ends[-1] if ends else 0)
+        return _Block(days, ends, counts, bins)
+
+
+class _Block(NamedTuple):
+    """
+    One key's histograms: days, cumulative entry ends per day, then count and bin per entry.
+    """
+
+    days: array
+    ends: array
+    counts: array
+    bins: array
+
+
+def _merge_block(block: _Block, histograms: DayHistograms, oldest: int) -> _Block:
+    """
+    `block` with `histograms` added and days up to `oldest` dropped. Untouched days are
+    copied as array slices, only the days in `histograms` are decoded.
+    """
+    merged = _Block(array("I"), array("I"), array("I"), array("H"))
+    days, ends = block.days, block.ends
+
+    def copy(lo: int, hi: int) -> None:
+        if lo >= hi:
+            return
+        first, last = ends[lo - 1] if lo else 0, ends[hi - 1]
+        shift = len(merged.counts) - first
+        merged.days.extend(days[lo:hi])
+        merged.ends.extend(end + shift for end in ends[lo:hi])
+        merged.counts.extend(block.counts[first:last])
+        merged.bins.extend(block.bins[first:last])
+
+    pos = bisect.bisect_right(days, oldest)
+    for day in sorted(day for day in histograms if day > oldest):
+        index = bisect.bisect_left(days, day, pos)
+        copy(pos, index)
+        counts = Counter(histograms[day])
+        pos = index
+        if index < len(days) and days[index] == day:
+            first, last = ends[index - 1] if index else 0, ends[index]
+            counts.update(dict(zip(block.bins[first:last], block.counts[first:last])))
+            pos += 1
+        for price_index, count in sorted(counts.items()):
+            if count:
+                merged.bins.append(price_index)
+                merged.counts.append(count)
+        merged.days.append(day)
+        merged.ends.append(len(merged.bins))
+    copy(pos, len(days))
+    return merged
+
+
+def write_index(path: Path, blocks: Iterable[tuple[tuple[int, int], _Block]]) -> int:
+    """
+    Write (key, block) pairs, sorted by key, as an index file (atomically). Returns the key count.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    table = bytearray()
+    key_count = 0
+    with open(tmp_path, "wb") as f:
+        f.write(bytes(INDEX_HEADER.size))
+        offset = INDEX_HEADER.size
+        for (city_id, category_id), block in blocks:
+            if not block.bins:
+                continue
+            pairs = array("I", bytes(8 * len(block.days)))
+            pairs[0::2], pairs[1::2] = block.days, block.ends
+            data = pairs.tobytes() + block.counts.tobytes() + block.bins.tobytes()
+            data += bytes(-len(data) % 4)
+            f.write(data)
+            table += KEY.pack(city_id, category_id, offset, len(block.days), len(block.bins))
+            offset += len(data)
+            key_count += 1
+        f.write(table)
+        f.seek(0)
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, key_count, offset))
+    os.replace(tmp_path, path)
+    return key_count
+
+
+@dataclass(frozen=True, slots=True)
+class PriceStats:
+    """
+    Offers counted over the window and their price quantiles in UAH, in the order asked for.
+    """
+
+    count: int
+    quantiles: tuple[float, ...]
+
+
+def _merge_days(into: DayHistograms, histograms: DayHistograms) -> None:
+    for day, counts in histograms.items():
+        into.setdefault(day, Counter()).update(counts)
+
+
+class PriceHistory:
+    """
+    Records the price of every new polled offer and answers quantile queries from the
+    per-day histograms of this writer (file, pending and being flushed) and of other
+    writers' index files in the same directory.
+
+    `flush()` is synchronous; from a running loop use `save()`, which writes in a thread
+    while queries keep answering from the batch being written.
+    """
+
+    def __init__(
+        self,
+        directory: Path = PRICE_HISTORY_DIR,
+        name: str = "main",
+        *,
+        rates: RateCache = rate_cache,
+        max_days: int = PRICE_HISTORY_MAX_DAYS,
+        reload_interval: float = PRICE_HISTORY_RELOAD,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.directory = directory
+        self.name = name
+        self.rates = rates
+        self.max_days = max_days
+        self.reload_interval = reload_interval
+        self._clock = clock
+        self._index = _IndexFile(directory / f"{name}.idx")
+        self._others: dict[Path, _IndexFile] = {}
+        self._others_checked = -math.inf
+        # (city_id, category_id) -> day histograms, not yet in the index file
+        self._pending: dict[tuple[int, int], DayHistograms] = {}
+        self._flushing: dict[tuple[int, int], DayHistograms] = {}
+        self._rows = self._empty_rows()
+        self.recorded = 0
+        self.flushes = 0
+        self.queries = 0
+        self.query_seconds = 0.0
+
+    @property
+    def archive_path(self) -> Path:
+        return self.directory / f"{self.name}.arc"
+
+    @staticmethod
+    def _empty_rows() -> dict[str, array]:
+        return {name: array(typecode) for name, typecode, _ in COLUMNS}
+
+    # --- Loading ---
+    def open(self) -> None:
+        if not self._index.open() and self.archive_path.exists():
+            self._rebuild()
+        self._others_checked = -math.inf
+        logging.info(f"Price history {self.name}: {len(self._index)} city/category keys in {self.directory}.")
+
+    def close(self) -> None:
+        self._index.close()
+        for index in self._others.values():
+            index.close()
+        self._others = {}
+
+    def _rebuild(self) -> None:
+        """
+        Recreate a lost index from the archive.
+        """
+        logging.info(f"Rebuilding price index from {self.archive_path}.")
+        for frame in read_archive(self.archive_path):
+            for observed_at, city_id, category_id, price_uah in zip(
+                frame["observed_at"], frame["city_id"], frame["category_id"], frame["price_uah"]
+            ):
+                self._count(city_id, category_id, observed_at, price_uah)
+        self._index.close()
+        write_index(self._index.path, self._merged(self._pending))
+        self._pending = {}
+        self._index.open()
+
+    def _refresh_others(self) -> None:
+        now = time.monotonic()
+        if now - self._others_checked < self.reload_interval:
+            return
+        self._others_checked = now
+        paths = {path for path in self.directory.glob("*.idx") if path != self._index.path}
+        for path in self._others.keys() - paths:
+            self._others.pop(path).close()
+        for path in paths:
+            index = self._others.get(path)
+            try:
+                if index is None:
+                    index = self._others[path] = _IndexFile(path)
+                    index.open()
+                elif path.stat().st_mtime != index.mtime:
+                    index.open()
+            except (OSError, ValueError) as e:
+                logging.warning(f"Skipping price index {path}: {e}")
+                self._others.pop(path).close()
+
+    # --- Recording ---
+    def _count(self, city_id: int, category_id: int, observed_at: float, price_uah: float) -> None:
+        day = int(observed_at // DAY)
+        histogram = self._pending.setdefault((city_id, category_id), {}).setdefault(day, Counter())
+        histogram[price_bin(price_uah)] += 1
+
+    def record(self, city_id: int, region_id: int, category_id: int, offers: Iterable[Offer]) -> int:
+        """
+        Add the priced offers of one query, returns how many were recorded.
+        """
+        rows = self._rows
+        now = self._clock()
+        recorded = 0
+        for offer in offers:
+            price_uah = offer_price_uah(offer, self.rates)
+            if offer.price_value is None or not price_uah or price_uah <= 0:
+                continue
+            observed_at = offer.refreshed_at.timestamp() if offer.refreshed_at is not None else now
+            currency = offer.price_currency
+            rows["ad_id"].append(offer.id)
+            rows["observed_at"].append(int(observed_at))
+            rows["city_id"].append(city_id)
+            rows["region_id"].append(region_id)
+            rows["category_id"].append(category_id)
+            rows["currency"].append(CURRENCIES.index(currency) if currency in CURRENCIES else _OTHER_CURRENCY)
+            rows["price"].append(offer.price_value)
+            rows["price_uah"].append(price_uah)
+            self._count(city_id, category_id, observed_at, price_uah)
+            recorded += 1
+        self.recorded += recorded
+        return recorded
+
+    # --- Queries ---
+    def histogram(self, city_id: int, category_id: int, first_day: int, last_day: int) -> dict[int, int]:
+        """
+        Bin -> offer count for a city and category over [first_day, last_day], all writers.
+        """
+        key = (city_id, category_id)
+        self._refresh_others()
+        totals: dict[int, int] = {}
+        self._index.add_histogram(key, first_day, last_day, totals)
+        for index in self._others.values():
+            index.add_histogram(key, first_day, last_day, totals)
+        for in_memory in (self._flushing, self._pending):
+            for day, counts in in_memory.get(key, {}).items():
+                if first_day <= day <= last_day:
+                    for price_index, count in counts.items():
+                        totals[price_index] = totals.get(price_index, 0) + count
+        return totals
+
+    def quantiles(
+        self,
+        city_id: int,
+        category_id: int,
+        days: int = PRICE_STATS_DAYS,
+        quantiles: Sequence[float] = (0.25, 0.5, 0.75),
+    ) -> PriceStats | None:
+        """
+        Price quantiles (UAH) of offers seen over the last `days` days, None without data.
+        """
+        started = time.perf_counter()
+        today = int(self._clock() // DAY)
+        totals = self.histogram(city_id, category_id, today - days + 1, today)
+        result = None
+        count = sum(totals.values())
+        if count:
+            ranks = [max(1, math.ceil(q * count)) for q in quantiles]
+            values: list[float] = [0.0] * len(ranks)
+            order = sorted(range(len(ranks)), key=ranks.__getitem__)
+            seen = 0
+            pos = 0
+            for price_index in sorted(totals):
+                seen += totals[price_index]
+                while pos < len(order) and ranks[order[pos]] <= seen:
+                    values[order[pos]] = bin_price(price_index)
+                    pos += 1
+                if pos == len(order):
+                    break
+            result = PriceStats(count=count, quantiles=tuple(values))
+        self.queries += 1
+        self.query_seconds += time.perf_counter() - started
+        return result
+
+    # --- Persistence ---
+    def _merged(self, batch: dict[tuple[int, int], DayHistograms]) -> Iterator[tuple[tuple[int, int], _Block]]:
+        """
+        Index file keys merged with `batch`, in key order, without days past `max_days`.
+        """
+        oldest = int(self._clock() // DAY) - self.max_days
+        for key in sorted(set(self._index.keys()) | batch.keys()):
+            yield key, _merge_block(self._index.block(key), batch.get(key, {}), oldest)
+
+    def detach(self) -> tuple[dict[tuple[int, int], DayHistograms], dict[str, array]]:
+        """
+        Hand the pending histograms and rows over to a flush; they stay visible to queries.
+        """
+        batch, rows = self._pending, self._rows
+        for key, histograms in batch.items():
+            _merge_days(self._flushing.setdefault(key, {}), histograms)
+        self._pending, self._rows = {}, self._empty_rows()
+        return batch, rows
+
+    def write(self, batch: dict[tuple[int, int], DayHistograms], rows: dict[str, array]) -> None:
+        """
+        Append `rows` to the archive and rewrite the index with `batch` merged in.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        row_count = len(rows["ad_id"])
+        if row_count:
+            columns = [
+                zlib.compress((_delta(rows[name]) if delta else rows[name]).tobytes()) for name, _, delta in COLUMNS
+            ]
+            with open(self.archive_path, "ab") as f:
+                f.write(FRAME.pack(ARCHIVE_MAGIC, row_count, *map(len, columns)))
+                for column in columns:
+                    f.write(column)
+        if batch:
+            write_index(self._index.path, self._merged(batch))
+
+    def _finish(self, batch: dict[tuple[int, int], DayHistograms], ok: bool) -> None:
+        self._flushing = {}
+        if ok:
+            self._index.open()
+            self.flushes += 1
+            return
+        # Keep the histograms for the next flush; the rows are dropped rather than risk appending them twice
+        for key, histograms in batch.items():
+            _merge_days(self._pending.setdefault(key, {}), histograms)
+
+    def flush(self) -> None:
+        if not self._pending and not self._rows["ad_id"]:
+            return
+        batch, rows = self.detach()
+        try:
+            self.write(batch, rows)
+        except Exception:
+            self._finish(batch, ok=False)
+            raise
+        self._finish(batch, ok=True)
+
+    async def save(self) -> None:
+        """
+        `flush()` without blocking the loop.
+        """
+        if not self._pending and not self._rows["ad_id"]:
+            return
+        batch, rows = self.detach()
+        try:
+            await asyncio.to_thread(self.write, batch, rows)
+        except Exception:
+            logging.exception("Writing price history failed, retrying on the next flush.")
+            self._finish(batch, ok=False)
+            return
+        self._finish(batch, ok=True)
+
+    def nbytes(self) -> int:
+        """
+        Size on disk of this writer's archive and index.
+        """
+        return sum(path.stat().st_size for path in (self.archive_path, self._index.path) if path.exists())
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "recorded": self.recorded,
+            "pending_rows": len(self._rows["ad_id"]),
+            "flushes": self.flushes,
+            "index_keys": len(self._index),
+            "disk_bytes": self.nbytes(),
+            "queries": self.queries,
+            "query_seconds": self.query_seconds,
+        }
+
+
+# Shared history for the whole process
+price_history = PriceHistory()
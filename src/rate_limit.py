@@ -0,0 +1,130 @@
+import asyncio
+import heapq
+import itertools
+import time
+from enum import IntEnum
+from typing import Callable
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    NORMAL = 1
+    BULK = 2
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self.tokens = capacity
+        self._updated = clock()
+        self._blocked_until = 0.0
+
+    def _refill(self) -> float:
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return now
+
+    def delay(self) -> float:
+        """
+        Seconds until one token is available (0 if available now).
+        """
+        now = self._refill()
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self._blocked_until - now)
+
+    def consume(self) -> None:
+        self._refill()
+        self.tokens -= 1
+
+    def block(self, seconds: float) -> None:
+        """
+        Honour a `retry_after` from upstream: no tokens until it passes.
+        """
+        now = self._refill()
+        self._blocked_until = max(self._blocked_until, now + seconds)
+        self.tokens = min(self.tokens, 0.0)
+
+    @property
+    def idle(self) -> bool:
+        return self.delay() == 0 and self.tokens >= self.capacity
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket whose rate follows AIMD: every success adds `increase` req/s up to `max_rate`,
+    a throttling answer multiplies it by `decrease` (at most once per `cooldown`) down to `min_rate`.
+
+    Waiters are released strictly by priority, FIFO within one priority, so interactive calls
+    overtake queued background work.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float = 1.0,
+        *,
+        min_rate: float = 0.5,
+        max_rate: float = 20.0,
+        increase: float = 0.05,
+        decrease: float = 0.5,
+        cooldown: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.bucket = TokenBucket(rate, burst, clock)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self._clock = clock
+        self._decreased_at = float("-inf")
+        self._waiters: list[tuple[int, int, asyncio.Future[None]]] = []
+        self._order = itertools.count()
+        self._pump_task: asyncio.Task[None] | None = None
+        self.throttled = 0
+
+    @property
+    def rate(self) -> float:
+        return self.bucket.rate
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, priority: Priority = Priority.NORMAL) -> None:
+        if not self._waiters and self.bucket.delay() == 0:
+            self.bucket.consume()
+            return
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump(), name="rate-limiter")
+        # A cancelled waiter leaves a done future behind, the pump skips it
+        await future
+
+    async def _pump(self) -> None:
+        while self._waiters:
+            delay = self.bucket.delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.bucket.consume()
+                future.set_result(None)
+
+    def on_success(self) -> None:
+        self.bucket.rate = min(self.max_rate, self.bucket.rate + self.increase)
+
+    def on_throttle(self, retry_after: float | None = None) -> None:
+        self.throttled += 1
+        now = self._clock()
+        # Requests in flight all see the same throttling wave, back off once for it
+        if now - self._decreased_at >= self.cooldown:
+            self._decreased_at = now
+            self.bucket.rate = max(self.min_rate, self.bucket.rate * self.decrease)
+        if retry_after:
+            self.bucket.block(retry_after)
@@ -0,0 +1,303 @@
+"""
+Bounded cache of OLX response bodies with their validators, for conditional requests.
+
+Per URL it keeps the `ETag`/`Last-Modified` OLX sent, a hash of the body and the body itself.
+Bodies live in memory up to `memory_bytes` and on disk up to `disk_bytes` (one file per URL, so
+validators survive restarts); the least recently used are dropped first. The client sends the
+validators with the next request of the same URL: a 304 means the stored body is still current,
+and a 200 with the same body hash is just as unchanged.
+
+Files are read and written in threads. The file changes of `put()`, `touch()` and `discard()`
+are applied one batch at a time, in the order the in-memory index made them.
+
+File format (little endian):
+
+    header   magic(8s) digest(16s) key_len(u16) etag_len(u16) last_modified_len(u16)
+    fields   key etag last_modified (utf-8)
+    body     the rest of the file
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import struct
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Empty keeps the cache in memory only
+RESPONSE_CACHE_DIR = os.getenv("RESPONSE_CACHE_DIR", "data/olx_cache")
+RESPONSE_CACHE_MEMORY_BYTES = int(os.getenv("RESPONSE_CACHE_MEMORY_BYTES", str(32 << 20)))
+RESPONSE_CACHE_DISK_BYTES = int(os.getenv("RESPONSE_CACHE_DISK_BYTES", str(256 << 20)))
+
+MAGIC = b"OLXRESP1"
+HEADER = struct.Struct("<8s16sHHH")
+
+
+def body_hasher() -> "hashlib.blake2b":
+    """
+    Incremental `body_digest`, for bodies hashed as they stream in.
+    """
+    return hashlib.blake2b(digest_size=16)
+
+
+def body_digest(body: bytes) -> bytes:
+    return hashlib.blake2b(body, digest_size=16).digest()
+
+
+# (kind, key, file, data): kind is "write" (data is the file content in parts), "unlink" or "touch"
+_FileOp = tuple[str, str, Path, tuple[bytes, ...]]
+
+
+def _apply_file_ops(ops: list[_FileOp]) -> None:
+    for kind, key, file, data in ops:
+        try:
+            if kind == "write":
+                tmp_file = file.with_suffix(".tmp")
+                file.parent.mkdir(parents=True, exist_ok=True)
+                with open(tmp_file, "wb") as f:
+                    f.writelines(data)
+                os.replace(tmp_file, file)
+            elif kind == "unlink":
+                file.unlink(missing_ok=True)
+            else:
+                os.utime(file)
+        except OSError as e:
+            if kind != "touch":
+                logging.warning(f"Could not {kind} cached response for {key}: {e}")
+
+
+@dataclass(slots=True)
+class CachedResponse:
+    digest: bytes
+    size: int
+    etag: str | None = None
+    last_modified: str | None = None
+
+    def validators(self) -> dict[str, str]:
+        """
+        Request headers that make the next GET of this URL conditional.
+        """
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """
+    URL -> last response body, see the module docstring. Every entry has its body in memory,
+    on disk or both; an entry whose body is evicted from both is forgotten.
+    """
+
+    def __init__(
+        self,
+        path: Path | None = Path(RESPONSE_CACHE_DIR) if RESPONSE_CACHE_DIR else None,
+        *,
+        memory_bytes: int = RESPONSE_CACHE_MEMORY_BYTES,
+        disk_bytes: int = RESPONSE_CACHE_DISK_BYTES,
+    ) -> None:
+        self.path = path
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        # Least recently used first
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._bodies: OrderedDict[str, bytes] = OrderedDict()
+        self._on_disk: set[str] = set()
+        self._memory = 0
+        self._disk = 0
+        self._loaded = path is None
+        # Held while the index is loaded and while a batch of file changes is applied
+        self._io = asyncio.Lock()
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _file(self, key: str) -> Path:
+        assert self.path is not None
+        return self.path / f"{hashlib.blake2b(key.encode(), digest_size=16).hexdigest()}.bin"
+
+    async def ready(self) -> None:
+        """
+        Index the entries saved on disk by earlier runs, once, in a thread.
+        """
+        if self._loaded:
+            return
+        async with self._io:
+            if not self._loaded:
+                await asyncio.to_thread(self._load)
+                self._loaded = True
+
+    def _load(self) -> None:
+        """
+        Blocking part of `ready()`: index the files, oldest first. Only headers are read.
+        """
+        assert self.path is not None
+        if not self.path.is_dir():
+            return
+        files = sorted(self.path.glob("*.bin"), key=lambda file: file.stat().st_mtime)
+        for file in files:
+            try:
+                with open(file, "rb") as f:
+                    magic, digest, key_len, etag_len, modified_len = HEADER.unpack(f.read(HEADER.size))
+                    if magic != MAGIC:
+                        raise ValueError("bad magic")
+                    key, etag, last_modified = (f.read(n).decode() for n in (key_len, etag_len, modified_len))
+                size = file.stat().st_size - HEADER.size - key_len - etag_len - modified_len
+            except (OSError, ValueError, struct.error) as e:
+                logging.warning(f"Dropping unreadable cached response {file}: {e}")
+                file.unlink(missing_ok=True)
+                continue
+            self._entries[key] = CachedResponse(digest, size, etag or None, last_modified or None)
+            self._on_disk.add(key)
+            self._disk += size
+        _apply_file_ops(self._evict())
+        logging.info(f"Response cache loaded: {len(self._entries)} entries from {self.path}.")
+
+    async def _apply(self, ops: list[_FileOp]) -> None:
+        if ops:
+            async with self._io:
+                await asyncio.to_thread(_apply_file_ops, ops)
+
+    async def get(self, key: str) -> CachedResponse | None:
+        await self.ready()
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    async def body(self, key: str) -> bytes | None:
+        """
+        Stored body of `key`, read back from disk (and kept in memory again) if needed.
+        """
+        await self.ready()
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        body = self._bodies.get(key)
+        if body is not None:
+            self._bodies.move_to_end(key)
+            return body
+        body = await asyncio.to_thread(self._read, key, entry)
+        if self._entries.get(key) is not entry:
+            # Replaced or dropped while the file was read
+            return body
+        if body is None:
+            await self.discard(key)
+            return None
+        self._remember(key, body)
+        await self._apply(self._evict())
+        return body
+
+    def _read(self, key: str, entry: CachedResponse) -> bytes | None:
+        try:
+            with open(self._file(key), "rb") as f:
+                body = f.read()[-entry.size :] if entry.size else b""
+        except OSError as e:
+            logging.warning(f"Cached response for {key} is gone: {e}")
+            return None
+        return body if body_digest(body) == entry.digest else None
+
+    async def put(
+        self,
+        key: str,
+        body: bytes,
+        etag: str | None = None,
+        last_modified: str | None = None,
+        digest: bytes | None = None,
+    ) -> bool:
+        """
+        Store the latest response of `key` (`digest` if it was hashed already). Returns False
+        when the body is the same as before.
+        """
+        await self.ready()
+        digest = digest if digest is not None else body_digest(body)
+        old = self._entries.get(key)
+        changed = old is None or old.digest != digest
+        entry = CachedResponse(digest, len(body), etag, last_modified)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        ops: list[_FileOp] = []
+        if changed and old is not None:
+            ops += self._forget_body(key, old)
+        if key not in self._bodies:
+            self._remember(key, body)
+        if self.path is not None and (changed or key not in self._on_disk or old != entry):
+            ops += self._write(key, entry, body)
+        ops += self._evict()
+        await self._apply(ops)
+        return changed
+
+    async def touch(self, key: str) -> None:
+        """
+        Mark `key` as just used (e.g. confirmed by a 304), so it is evicted last.
+        """
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            if key in self._bodies:
+                self._bodies.move_to_end(key)
+            if key in self._on_disk:
+                await self._apply([("touch", key, self._file(key), ())])
+
+    async def discard(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            await self._apply(self._forget_body(key, entry))
+
+    def _remember(self, key: str, body: bytes) -> None:
+        if len(body) <= self.memory_bytes:
+            self._bodies[key] = body
+            self._memory += len(body)
+
+    def _forget_body(self, key: str, entry: CachedResponse) -> list[_FileOp]:
+        body = self._bodies.pop(key, None)
+        if body is not None:
+            self._memory -= len(body)
+        if key not in self._on_disk:
+            return []
+        self._on_disk.discard(key)
+        self._disk -= entry.size
+        return [("unlink", key, self._file(key), ())]
+
+    def _write(self, key: str, entry: CachedResponse, body: bytes) -> list[_FileOp]:
+        if key in self._on_disk:
+            self._on_disk.discard(key)
+            self._disk -= entry.size
+        if len(body) > self.disk_bytes:
+            return []
+        fields = [value.encode() for value in (key, entry.etag or "", entry.last_modified or "")]
+        header = HEADER.pack(MAGIC, entry.digest, *(len(value) for value in fields))
+        self._on_disk.add(key)
+        self._disk += entry.size
+        return [("write", key, self._file(key), (header, *fields, body))]
+
+    def _evict(self) -> list[_FileOp]:
+        ops: list[_FileOp] = []
+        while self._memory > self.memory_bytes and self._bodies:
+            key, body = self._bodies.popitem(last=False)
+            self._memory -= len(body)
+            if key not in self._on_disk:
+                del self._entries[key]
+                self.evicted += 1
+        while self._disk > self.disk_bytes and self._on_disk:
+            key = next(key for key in self._entries if key in self._on_disk)
+            self._on_disk.discard(key)
+            self._disk -= self._entries[key].size
+            ops.append(("unlink", key, self._file(key), ()))
+            if key not in self._bodies:
+                del self._entries[key]
+                self.evicted += 1
+        return ops
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "cache_entries": len(self._entries),
+            "cache_memory_bytes": self._memory,
+            "cache_disk_bytes": self._disk,
+            "cache_evicted": self.evicted,
+        }
@@ -0,0 +1,323 @@
+"""
+Compact "already delivered" ad id store, one entry per search query key.
+
+Ids live in sorted `array` segments (4 bytes per id while they fit in uint32), one segment
+per `segment_span` seconds, so age-based eviction just drops whole old segments. Fresh ids
+go to a small set buffer that is merged into the open segment once it grows past 1/8 of
+it. An optional Bloom filter in front answers most "never seen" checks without a search.
+Evicted ids stay in the Bloom filter (costing only false positives) until they make up
+`SEEN_BLOOM_STALE` of it; it is then rebuilt in a worker thread while lookups keep using the old one.
+
+File format (little endian):
+
+    header   magic(8s) key_count(u32)
+    key      key_len(u16) key(utf-8) segment_count(u32)
+    segment  started(f64) typecode(1s) count(u32) ids(count x itemsize)
+"""
+
+import asyncio
+import bisect
+import hashlib
+import heapq
+import logging
+import os
+import struct
+import time
+from array import array
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterable
+
+SEEN_STORE_PATH = Path(os.getenv("SEEN_STORE_PATH", "data/seen_ads.bin"))
+SEEN_MAX_AGE = float(os.getenv("SEEN_MAX_AGE", str(30 * 24 * 3600)))
+SEEN_SEGMENT_SPAN = float(os.getenv("SEEN_SEGMENT_SPAN", str(24 * 3600)))
+# 0 disables the Bloom filter
+SEEN_BLOOM_BITS = int(os.getenv("SEEN_BLOOM_BITS", str(1 << 27)))
+# Rebuild the Bloom filter once evicted ids are this fraction of the ids in it
+SEEN_BLOOM_STALE = float(os.getenv("SEEN_BLOOM_STALE", "0.25"))
+
+MAGIC = b"OLXSEEN1"
+HEADER = struct.Struct("<8sI")
+KEY_HEADER = struct.Struct("<H")
+KEY_SEGMENTS = struct.Struct("<I")
+SEGMENT_HEADER = struct.Struct("<d1sI")
+
+_UINT32_MAX = 0xFFFFFFFF
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+_MIN_PENDING = 256
+
+
+def _typecode_for(max_id: int) -> str:
+    return "I" if max_id <= _UINT32_MAX else "Q"
+
+
+def _sorted_contains(ids: array, ad_id: int) -> bool:
+    index = bisect.bisect_left(ids, ad_id)
+    return index < len(ids) and ids[index] == ad_id
+
+
+@dataclass(slots=True)
+class _Segment:
+    started: float
+    ids: array = field(default_factory=lambda: array("I"))
+    pending: set[int] = field(default_factory=set)
+
+    def __contains__(self, ad_id: int) -> bool:
+        return ad_id in self.pending or _sorted_contains(self.ids, ad_id)
+
+    def __len__(self) -> int:
+        return len(self.ids) + len(self.pending)
+
+    def add(self, ad_id: int) -> None:
+        self.pending.add(ad_id)
+        if len(self.pending) > max(_MIN_PENDING, len(self.ids) >> 3):
+            self.compact()
+
+    def compact(self) -> None:
+        if not self.pending:
+            return
+        ids = self.ids
+        fresh = sorted(ad_id for ad_id in self.pending if not _sorted_contains(ids, ad_id))
+        self.pending = set()
+        if not fresh:
+            return
+        typecode = _typecode_for(max(fresh[-1], ids[-1] if ids else 0)) if ids.typecode == "I" else "Q"
+        self.ids = array(typecode, heapq.merge(ids, fresh))
+
+    def nbytes(self) -> int:
+        # set slots are ~8 bytes each plus the int objects themselves
+        return len(self.ids) * self.ids.itemsize + len(self.pending) * 40
+
+
+class _BloomFilter:
+    def __init__(self, bits: int, hashes: int = 4) -> None:
+        self.size = bits
+        self.hashes = hashes
+        self.bits = bytearray((bits + 7) // 8)
+
+    def _positions(self, key_hash: int, ad_id: int) -> Iterable[int]:
+        h = ((ad_id * 0x9E3779B97F4A7C15) ^ key_hash) & _MASK64
+        h = ((h ^ (h >> 31)) * 0xBF58476D1CE4E5B9) & _MASK64
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key_hash: int, ad_id: int) -> None:
+        for pos in self._positions(key_hash, ad_id):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: tuple[int, int]) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(*item))
+
+
+# (key hash, sorted ids, pending ids) of every segment, see `SeenStore._snapshot`
+_BloomSource = list[tuple[int, array, tuple[int, ...]]]
+
+
+def _build_bloom(bits: int, source: _BloomSource) -> _BloomFilter:
+    bloom = _BloomFilter(bits)
+    for key_hash, ids, pending in source:
+        for ad_id in ids:
+            bloom.add(key_hash, ad_id)
+        for ad_id in pending:
+            bloom.add(key_hash, ad_id)
+    return bloom
+
+
+def _key_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little")
+
+
+class SeenStore:
+    def __init__(
+        self,
+        path: Path | None = SEEN_STORE_PATH,
+        *,
+        max_age: float = SEEN_MAX_AGE,
+        segment_span: float = SEEN_SEGMENT_SPAN,
+        bloom_bits: int = SEEN_BLOOM_BITS,
+        bloom_stale: float = SEEN_BLOOM_STALE,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.path = path
+        self.max_age = max_age
+        self.segment_span = segment_span
+        self.bloom_bits = bloom_bits
+        self.bloom_stale = bloom_stale
+        self._clock = clock
+        self._keys: dict[str, list[_Segment]] = {}
+        self._key_hashes: dict[str, int] = {}
+        self._bloom = _BloomFilter(bloom_bits) if bloom_bits else None
+        # Ids added to the Bloom filter and ids evicted since it was built
+        self._bloom_ids = 0
+        self._bloom_evicted = 0
+        # Ids added while a rebuild runs, replayed into the new filter
+        self._bloom_journal: list[tuple[int, int]] | None = None
+        self._rebuild_task: asyncio.Task[None] | None = None
+        self.bloom_negatives = 0
+        self.bloom_rebuilds = 0
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._keys
+
+    def __len__(self) -> int:
+        return sum(len(segment) for segments in self._keys.values() for segment in segments)
+
+    def keys(self) -> list[str]:
+        return list(self._keys)
+
+    def nbytes(self) -> int:
+        """
+        Approximate memory used by stored ids (Bloom filter included).
+        """
+        size = sum(segment.nbytes() for segments in self._keys.values() for segment in segments)
+        return size + (len(self._bloom.bits) if self._bloom else 0)
+
+    def _hash(self, key: str) -> int:
+        key_hash = self._key_hashes.get(key)
+        if key_hash is None:
+            key_hash = self._key_hashes[key] = _key_hash(key)
+        return key_hash
+
+    def _open_segment(self, key: str) -> _Segment:
+        segments = self._keys.setdefault(key, [])
+        now = self._clock()
+        if not segments or now - segments[-1].started >= self.segment_span:
+            if segments:
+                segments[-1].compact()
+            segments.append(_Segment(started=now))
+        return segments[-1]
+
+    def contains(self, key: str, ad_id: int) -> bool:
+        segments = self._keys.get(key)
+        if not segments:
+            return False
+        if self._bloom is not None and (self._hash(key), ad_id) not in self._bloom:
+            self.bloom_negatives += 1
+            return False
+        return any(ad_id in segment for segment in reversed(segments))
+
+    def add(self, key: str, ad_ids: Iterable[int]) -> None:
+        segment = self._open_segment(key)
+        key_hash = self._hash(key)
+        for ad_id in ad_ids:
+            segment.add(ad_id)
+            if self._bloom is not None:
+                self._bloom.add(key_hash, ad_id)
+                self._bloom_ids += 1
+                if self._bloom_journal is not None:
+                    self._bloom_journal.append((key_hash, ad_id))
+
+    def filter_new(self, key: str, ad_ids: Iterable[int]) -> list[int]:
+        """
+        Ids of `ad_ids` not seen before for `key`, which are then marked as seen.
+        """
+        new_ids = [ad_id for ad_id in ad_ids if not self.contains(key, ad_id)]
+        self.add(key, new_ids)
+        return new_ids
+
+    def drop(self, key: str) -> None:
+        self._keys.pop(key, None)
+        self._key_hashes.pop(key, None)
+
+    def evict(self) -> int:
+        """
+        Drop segments older than `max_age`, returns how many ids were removed.
+        """
+        cutoff = self._clock() - self.max_age
+        removed = 0
+        for key, segments in self._keys.items():
+            while segments and segments[0].started < cutoff and len(segments) > 1:
+                removed += len(segments.pop(0))
+        if removed and self._bloom is not None:
+            self._bloom_evicted += removed
+            if self._bloom_evicted > self._bloom_ids * self.bloom_stale and self._rebuild_task is None:
+                try:
+                    self._rebuild_task = asyncio.get_running_loop().create_task(self.rebuild_bloom())
+                except RuntimeError:
+                    # No running event loop, nothing to block
+                    self._set_bloom(_build_bloom(self.bloom_bits, self._snapshot()))
+        return removed
+
+    def _snapshot(self) -> _BloomSource:
+        # Segments replace their id arrays when compacting, so the arrays can be read from a thread
+        return [
+            (self._hash(key), segment.ids, tuple(segment.pending))
+            for key, segments in self._keys.items()
+            for segment in segments
+        ]
+
+    def _set_bloom(self, bloom: _BloomFilter) -> None:
+        self._bloom = bloom
+        self._bloom_ids = len(self)
+        self._bloom_evicted = 0
+        self.bloom_rebuilds += 1
+
+    async def rebuild_bloom(self) -> None:
+        """
+        Rebuild the Bloom filter without evicted ids in a worker thread.
+        """
+        if self._bloom is None:
+            return
+        try:
+            evicted = self._bloom_evicted
+            self._bloom_journal = []
+            bloom = await asyncio.to_thread(_build_bloom, self.bloom_bits, self._snapshot())
+            for key_hash, ad_id in self._bloom_journal:
+                bloom.add(key_hash, ad_id)
+            # Ids evicted meanwhile are still in the new filter
+            evicted = self._bloom_evicted - evicted
+            self._set_bloom(bloom)
+            self._bloom_evicted = evicted
+        finally:
+            self._bloom_journal = None
+            if self._rebuild_task is asyncio.current_task():
+                self._rebuild_task = None
+
+    # --- Persistence ---
+    def save(self) -> None:
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, len(self._keys)))
+            for key, segments in self._keys.items():
+                encoded = key.encode()
+                f.write(KEY_HEADER.pack(len(encoded)) + encoded + KEY_SEGMENTS.pack(len(segments)))
+                for segment in segments:
+                    segment.compact()
+                    f.write(SEGMENT_HEADER.pack(segment.started, segment.ids.typecode.encode(), len(segment.ids)))
+                    segment.ids.tofile(f)
+        os.replace(tmp_path, self.path)
+
+    def load(self) -> None:
+        """
+        Read the store from `path`, Bloom filter included; slow for big stores, call it from a thread.
+        """
+        if self.path is None or not self.path.exists():
+            return
+        with open(self.path, "rb") as f:
+            magic, key_count = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{self.path} is not a seen-ads store.")
+            self._keys = {}
+            self._key_hashes = {}
+            for _ in range(key_count):
+                key = self._read_key(f)
+                (segment_count,) = KEY_SEGMENTS.unpack(f.read(KEY_SEGMENTS.size))
+                self._keys[key] = [self._read_segment(f) for _ in range(segment_count)]
+        if self._bloom is not None:
+            self._set_bloom(_build_bloom(self.bloom_bits, self._snapshot()))
+        logging.info(f"Seen-ads store loaded: {len(self._keys)} keys from {self.path}.")
+
+    @staticmethod
+    def _read_key(f: BinaryIO) -> str:
+        (length,) = KEY_HEADER.unpack(f.read(KEY_HEADER.size))
+        return f.read(length).decode()
+
+    @staticmethod
+    def _read_segment(f: BinaryIO) -> _Segment:
+        started, typecode, count = SEGMENT_HEADER.unpack(f.read(SEGMENT_HEADER.size))
+        ids = array(typecode.decode())
+        ids.fromfile(f, count)
+        return _Segment(started=started, ids=ids)
@@ -0,0 +1,148 @@
+"""
+Split distinct search queries between poller worker processes.
+
+Workers heartbeat into `pollerworker`; each one owns the queries that rendezvous-hash to
+it among the live workers, so a worker joining or dying only moves its share. Ownership
+alone can briefly disagree while membership changes, so every poll is also claimed
+through an atomic lease upsert on `pollerlease`: a query is handed out at most once per
+poll interval, whichever worker asks first.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterable
+
+from sqlalchemy import delete
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from db import async_session
+from models import PollerLease, PollerWorker
+
+SHARD_HEARTBEAT_INTERVAL = float(os.getenv("SHARD_HEARTBEAT_INTERVAL", "10"))
+# A worker silent for this long is considered dead and its queries move to the others
+SHARD_HEARTBEAT_TTL = float(os.getenv("SHARD_HEARTBEAT_TTL", "30"))
+# Leases become claimable slightly early so cycle jitter does not skip a whole interval
+SHARD_LEASE_SLACK = 0.05
+
+
+def _score(worker_id: str, key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(f"{worker_id}|{key}".encode(), digest_size=8).digest(), "big")
+
+
+def owner(key: str, workers: Iterable[str]) -> str:
+    """
+    Rendezvous (highest random weight) hashing: stable, minimal movement on membership change.
+    """
+    return max(workers, key=lambda worker_id: _score(worker_id, key))
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class ShardCoordinator:
+    def __init__(
+        self,
+        worker_id: str,
+        session_factory: Callable[[], AsyncSession] = async_session,
+        *,
+        heartbeat_interval: float = SHARD_HEARTBEAT_INTERVAL,
+        heartbeat_ttl: float = SHARD_HEARTBEAT_TTL,
+        on_workers: Callable[[list[str]], None] | None = None,
+    ) -> None:
+        # Stable across restarts: the worker's seen-ads store and price history are named after it
+        self.worker_id = worker_id
+        self._session_factory = session_factory
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_ttl = heartbeat_ttl
+        # Called with the live workers after every heartbeat
+        self._on_workers = on_workers
+        self.workers: list[str] = [self.worker_id]
+        self._task: asyncio.Task[None] | None = None
+
+    def _insert(self, session: AsyncSession, table: type) -> postgresql.Insert | sqlite.Insert:
+        # Same upsert on Postgres (production) and SQLite (local multi-process checks)
+        dialect = session.bind.dialect.name if session.bind is not None else "postgresql"
+        return (sqlite.insert if dialect == "sqlite" else postgresql.insert)(table)
+
+    async def heartbeat(self) -> list[str]:
+        """
+        Refresh our row and return the sorted ids of all live workers.
+        """
+        now = _now()
+        async with self._session_factory() as session:
+            statement = self._insert(session, PollerWorker).values(worker_id=self.worker_id, heartbeat_at=now)
+            statement = statement.on_conflict_do_update(index_elements=["worker_id"], set_={"heartbeat_at": now})
+            await session.execute(statement)
+            cutoff = now - timedelta(seconds=self.heartbeat_ttl)
+            rows = await session.exec(select(PollerWorker.worker_id).where(PollerWorker.heartbeat_at > cutoff))
+            workers = sorted(rows.all())
+            await session.commit()
+        self.workers = workers or [self.worker_id]
+        if self._on_workers is not None:
+            self._on_workers(self.workers)
+        return self.workers
+
+    def owns(self, key: str) -> bool:
+        return owner(key, self.workers) == self.worker_id
+
+    async def claim(self, keys: Iterable[str], interval: float) -> set[str]:
+        """
+        Keys we own whose last poll is at least `interval` old, leased to us atomically.
+        """
+        owned = [key for key in keys if self.owns(key)]
+        if not owned:
+            return set()
+        now = _now()
+        due = now - timedelta(seconds=interval * (1 - SHARD_LEASE_SLACK))
+        async with self._session_factory() as session:
+            insert = self._insert(session, PollerLease).values(
+                [{"query_key": key, "worker_id": self.worker_id, "polled_at": now} for key in owned]
+            )
+            statement = insert.on_conflict_do_update(
+                index_elements=[col(PollerLease.query_key)],
+                set_={"worker_id": self.worker_id, "polled_at": now},
+                where=col(PollerLease.polled_at) <= due,
+            ).returning(col(PollerLease.query_key))
+            claimed: set[str] = set((await session.execute(statement)).scalars().all())
+            await session.commit()
+        return claimed
+
+    async def leave(self) -> None:
+        """
+        Drop our heartbeat so the other workers take over right away.
+        """
+        async with self._session_factory() as session:
+            await session.execute(
+                delete(PollerWorker).where(PollerWorker.worker_id == self.worker_id)  # type: ignore[arg-type]
+            )
+            await session.commit()
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.heartbeat()
+            except Exception:
+                logging.exception("Shard heartbeat failed.")
+            await asyncio.sleep(self.heartbeat_interval)
+
+    async def start(self) -> None:
+        if self._task is None:
+            await self.heartbeat()
+            self._task = asyncio.create_task(self.run(), name="shard-heartbeat")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.leave()
@@ -1,41 +1,79 @@
 import asyncio
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
 
-from aiogram import Bot, Dispatcher, F, types
+from aiogram import Bot, Dispatcher, Router, types
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import (
-    InlineKeyboardButton,
-    InlineKeyboardMarkup,
-    KeyboardButton,
-    ReplyKeyboardMarkup,
-)
+from aiogram.types import InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
+from callbacks import (
+    CallbackPayload,
+    CallbackRouter,
+    CategoryDetail,
+    ChooseCity,
+    ChooseCurrency,
+    ChoosePriceFrom,
+    ChoosePriceTo,
+    DeleteFilter,
+    DigestPage,
+    FiltersPage,
+    RealEstateMenu,
+    SetDelivery,
+    ToggleFilter,
+)
+from city_cache import city_cache
 from constants import (
     API_TOKEN,
-    CURRENCY_EUR,
-    CURRENCY_UAH,
-    CURRENCY_USD,
+    CATEGORY_NAMES,
+    CATEGORY_OPTIONS,
+    CURRENCY_OPTIONS,
+    DELIVERY_OPTIONS,
     PRICE_FROM_OPTIONS,
     PRICE_TO_OPTIONS,
-    REAL_ESTATE_BUY_APPARTMENT,
-    REAL_ESTATE_BUY_HOUSE,
 )
-from db import add_telegram_user
-from olx_api import get_city_info
-from utils import remove_duplicate_cities
-
-# --- Initialize bot and dispatcher ---
-if not API_TOKEN:
-    raise ValueError("No API token provided. Please set the API_TOKEN environment variable.")
-bot = Bot(
-    token=API_TOKEN,
-    default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+from currency_rates import rate_cache
+from db import (
+    add_user_search_filter,
+    close_db,
+    delete_user_subscription,
+    get_digest_page,
+    get_user_search_filters,
+    set_delivery_mode,
+    toggle_subscription_paused,
+    warm_db,
+)
+from digest import DIGEST_PAGE_SIZE, DigestScheduler, render_digest_page
+from filter_pages import filter_pages
+from fsm_storage import BufferedStorage, FSMBatchMiddleware, create_fsm_storage
+from gazetteer import gazetteer
+from metrics import (
+    METRICS_ENABLED,
+    instrument_dispatcher,
+    start_loop_monitor,
+    start_server,
+    stop_loop_monitor,
+    track_stats,
 )
-dp = Dispatcher()
+from models import CurrencyEnum, DeliveryModeEnum
+from notifier import NOTIFY_BOT_SHARE, Notifier
+from offers import Offer
+from olx_api import olx_client
+from olx_policy import OlxUnavailableError
+from poller import POLLER_EMBEDDED, ListingPoller
+from price_history import PRICE_HISTORY_MAX_DAYS, PRICE_STATS_DAYS, price_history
+from user_registry import known_users
+from utils import format_price_stats
+
+# Seconds shutdown waits for updates still being handled, then again for queued notifications
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "10"))
 
 
 # --- FSM States ---
@@ -47,28 +85,74 @@ class SearchStates(StatesGroup):
     waiting_for_price_to = State()
 
 
+# --- Keyboards ---
+# Static keyboards are built once, only the city list depends on the user's input
+def _inline_keyboard(buttons: list[tuple[str, CallbackPayload]], width: int) -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+    for text, payload in buttons:
+        builder.button(text=text, callback_data=payload.pack())
+    builder.adjust(width)
+    return builder.as_markup()
+
+
+PERSISTENT_MENU = ReplyKeyboardMarkup(
+    keyboard=[[KeyboardButton(text="/start")]], resize_keyboard=True, one_time_keyboard=False
+)
+MAIN_MENU = _inline_keyboard([("🏠 Нерухомість", RealEstateMenu())], 1)
+CATEGORY_KEYBOARD = _inline_keyboard([(name, CategoryDetail(category_id)) for name, category_id in CATEGORY_OPTIONS], 1)
+CURRENCY_KEYBOARD = _inline_keyboard(
+    [(label, ChooseCurrency(index)) for index, (label, _) in enumerate(CURRENCY_OPTIONS)], 1
+)
+PRICE_FROM_KEYBOARD = _inline_keyboard(
+    [(label, ChoosePriceFrom(index)) for index, (label, _) in enumerate(PRICE_FROM_OPTIONS)], 2
+)
+PRICE_TO_KEYBOARD = _inline_keyboard(
+    [(label, ChoosePriceTo(index)) for index, (label, _) in enumerate(PRICE_TO_OPTIONS)], 2
+)
+
+
+def delivery_option(mode: DeliveryModeEnum) -> int | None:
+    """
+    Index of the `DELIVERY_OPTIONS` entry for `mode`.
+    """
+    return next((index for index, (_, option, _) in enumerate(DELIVERY_OPTIONS) if option == mode.value), None)
+
+
+def delivery_keyboard(filter_id: int, selected: int | None = None) -> InlineKeyboardMarkup:
+    return _inline_keyboard(
+        [
+            (f"✅ {label}" if index == selected else label, SetDelivery(filter_id, index))
+            for index, (label, _, _) in enumerate(DELIVERY_OPTIONS)
+        ],
+        1,
+    )
+
+
 # --- Persistent menu ---
 def get_persistent_menu() -> ReplyKeyboardMarkup:
-    keyboard = [[KeyboardButton(text="/start")]]
-    return ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True, one_time_keyboard=False)
+    return PERSISTENT_MENU
 
 
 # --- Inline main menu ---
 def get_main_menu() -> InlineKeyboardMarkup:
-    keyboard = [[InlineKeyboardButton(text="🏠 Нерухомість", callback_data="category_real_estate")]]
-    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+    return MAIN_MENU
+
+
+def _bot(event: types.TelegramObject) -> Bot:
+    # Every update fed by the dispatcher is bound to the bot that received it
+    assert event.bot is not None
+    return event.bot
 
 
 # --- /start handler ---
-@dp.message(Command("start"))
 async def start_handler(message: types.Message) -> None:
     user = message.from_user
     if not user:
         await message.answer("Помилка: не вдалося отримати дані користувача.")
         return
 
-    # Save user in DB
-    add_telegram_user(telegram_id=user.id, telegram_username=user.username or "")
+    # Known users skip the DB, new ones and changed usernames are written behind in batches
+    known_users.remember(user.id, user.username or "")
 
     text = (
         f"Привіт, <b>{user.first_name}</b>!\n\n"
@@ -80,42 +164,86 @@ async def start_handler(message: types.Message) -> None:
     await message.answer("Меню доступне завжди 👇", reply_markup=get_persistent_menu())
 
 
+# --- /stats handler ---
+async def stats_handler(message: types.Message) -> None:
+    """
+    Price quantiles for the cities and categories of the user's filters: `/stats [days]`.
+    """
+    user = message.from_user
+    if not user:
+        await message.answer("Помилка: не вдалося отримати дані користувача.")
+        return
+    argument = (message.text or "").partition(" ")[2].strip()
+    days = int(argument) if argument.isdigit() else PRICE_STATS_DAYS
+    days = min(max(days, 1), PRICE_HISTORY_MAX_DAYS)
+
+    filters = await get_user_search_filters(user.id)
+    if not filters:
+        await message.answer("У вас ще немає фільтрів. Налаштуйте пошук через /start.")
+        return
+    # Filters differing only in currency or price range share one city/category answer
+    names: dict[tuple[int, int], str] = {}
+    for search_filter in filters:
+        names.setdefault((search_filter.city_id, search_filter.category_id), search_filter.filter_name)
+    usd_rate = rate_cache.rates[CurrencyEnum.USD.value]
+    blocks = [
+        format_price_stats(name, price_history.quantiles(city_id, category_id, days), usd_rate)
+        for (city_id, category_id), name in names.items()
+    ]
+    await message.answer(f"📊 Ціни за {days} дн.:\n\n" + "\n\n".join(blocks))
+
+
+# --- /filters handler ---
+async def filters_handler(message: types.Message) -> None:
+    """
+    The user's filters, a page at a time, with pause/resume and delete buttons.
+    """
+    user = message.from_user
+    if not user:
+        await message.answer("Помилка: не вдалося отримати дані користувача.")
+        return
+    text, markup = await filter_pages.get(user.id)
+    await message.answer(text, reply_markup=markup)
+
+
+# --- Callback dispatch ---
+callbacks = CallbackRouter()
+
+
+async def callback_handler(callback: types.CallbackQuery, state: FSMContext) -> None:
+    if not await callbacks.dispatch(callback, state):
+        # Buttons from before the callback format change or garbage data
+        await callback.answer("⚠️ Ця кнопка застаріла. Почніть спочатку: /start", show_alert=True)
+
+
 # --- Real estate category handler ---
-@dp.callback_query(F.data == "category_real_estate")
-async def category_real_estate_handler(callback: types.CallbackQuery, state: FSMContext) -> None:
+@callbacks.route(RealEstateMenu)
+async def category_real_estate_handler(
+    callback: types.CallbackQuery, state: FSMContext, payload: RealEstateMenu
+) -> None:
     if not callback.message:
         await callback.answer("Помилка: повідомлення недоступне.", show_alert=True)
         return
 
-    # Show category buttons
-    builder = InlineKeyboardBuilder()
-    builder.button(text="Купити будинок", callback_data=f"category_detail:{REAL_ESTATE_BUY_HOUSE}:Купити будинок")
-    builder.button(
-        text="Купити квартиру", callback_data=f"category_detail:{REAL_ESTATE_BUY_APPARTMENT}:Купити квартиру"
-    )
-    builder.adjust(1)
-
     if isinstance(callback.message, types.Message):
         await callback.message.edit_text(
             "✅ Ви обрали категорію: Нерухомість\nОберіть тип нерухомості:",
-            reply_markup=builder.as_markup(),
+            reply_markup=CATEGORY_KEYBOARD,
         )
     await state.set_state(SearchStates.waiting_for_category_detail)
     await callback.answer()
 
 
 # --- Category detail handler ---
-@dp.callback_query(F.data.startswith("category_detail:"))
-async def category_detail_handler(callback: types.CallbackQuery, state: FSMContext) -> None:
-    if callback.data is None:
-        await callback.answer("⚠️ Не вдалося отримати дані callback.", show_alert=True)
+@callbacks.route(CategoryDetail)
+async def category_detail_handler(callback: types.CallbackQuery, state: FSMContext, payload: CategoryDetail) -> None:
+    category_name = CATEGORY_NAMES.get(payload.category_id)
+    if category_name is None:
+        await callback.answer("⚠️ Невідома категорія.", show_alert=True)
         return
-    parts = callback.data.split(":")
-    category_id = int(parts[1])
-    category_name = parts[2]
 
     # Save category to state
-    await state.update_data(category_id=category_id, category_name=category_name)
+    await state.update_data(category_id=payload.category_id, category_name=category_name)
 
     if isinstance(callback.message, types.Message):
         await callback.message.edit_text(f"✅ Ви обрали: {category_name}\n\nВведіть назву міста:")
@@ -124,7 +252,6 @@ async def category_detail_handler(callback: types.CallbackQuery, state: FSMConte
 
 
 # --- City input handler ---
-@dp.message(SearchStates.waiting_for_city)
 async def process_city_input(message: types.Message, state: FSMContext) -> None:
     if message.text is None:
         await message.answer("⚠️ Не вдалося отримати текст повідомлення.")
@@ -137,26 +264,43 @@ async def process_city_input(message: types.Message, state: FSMContext) -> None:
     # Send temporary "searching city" message
     searching_msg = await message.answer("⏳ Шукаю місто...")
 
-    try:
-        data = await get_city_info(city_name)
-    except Exception as e:
-        await searching_msg.edit_text(f"❌ Помилка при виклику API: {e}")
-        return
-
-    if not data.get("data"):
+    # Offline index first, live geo-encoder when the index may not know every match yet
+    unique_cities = gazetteer.search(city_name)
+    if not gazetteer.complete(city_name, unique_cities):
+        try:
+            live_cities = await city_cache.lookup(city_name)
+        except OlxUnavailableError:
+            live_cities = None
+            if not unique_cities:
+                await searching_msg.edit_text("❌ OLX зараз не відповідає. Спробуйте ще раз за хвилину.")
+                return
+        except Exception:
+            logging.exception(f"City lookup failed for {city_name!r}.")
+            live_cities = None
+            if not unique_cities:
+                await searching_msg.edit_text("❌ Не вдалося знайти місто. Спробуйте ще раз.")
+                return
+        if live_cities is not None:
+            gazetteer.add(live_cities)
+            live_ids = {item["city"]["id"] for item in live_cities}
+            unique_cities = live_cities + [item for item in unique_cities if item["city"]["id"] not in live_ids]
+
+    if not unique_cities:
         await searching_msg.edit_text("❌ Місто не знайдено. Спробуйте ще раз.")
         return
 
-    unique_cities = remove_duplicate_cities(data["data"])
     options = unique_cities[:5]
 
+    # City names stay in the FSM state, the buttons only carry the ids
+    city_options: dict[str, str] = {}
     builder = InlineKeyboardBuilder()
     for item in options:
         city = item["city"]
         region = item["region"]["name"]
         region_id = item["region"]["id"]
+        city_options[str(city["id"])] = city["name"]
         builder.button(
-            text=f"{city['name']} ({region})", callback_data=f"choose_city:{city['id']}:{city['name']}:{region_id}"
+            text=f"{city['name']} ({region})", callback_data=ChooseCity(int(city["id"]), int(region_id)).pack()
         )
 
     builder.adjust(1)
@@ -164,53 +308,45 @@ async def process_city_input(message: types.Message, state: FSMContext) -> None:
         "✅ Знайдено ось такі населені пункти. Оберіть ваш:", reply_markup=builder.as_markup()
     )
     await state.set_state(SearchStates.waiting_for_currency)
-    await state.update_data(temp_msg_id=searching_msg.message_id)
-    await state.update_data(temp_chat_id=searching_msg.chat.id)
+    await state.update_data(
+        temp_msg_id=searching_msg.message_id, temp_chat_id=searching_msg.chat.id, city_options=city_options
+    )
 
 
 # --- City selection handler ---
-@dp.callback_query(F.data.startswith("choose_city:"))
-async def choose_city_handler(callback: types.CallbackQuery, state: FSMContext) -> None:
-    if callback.data is None:
-        await callback.answer("⚠️ Не вдалося отримати дані callback.", show_alert=True)
+@callbacks.route(ChooseCity)
+async def choose_city_handler(callback: types.CallbackQuery, state: FSMContext, payload: ChooseCity) -> None:
+    data = await state.get_data()
+    city_name = data.get("city_options", {}).get(str(payload.city_id))
+    if city_name is None:
+        await callback.answer("⚠️ Ця кнопка застаріла. Почніть спочатку: /start", show_alert=True)
         return
-    parts = callback.data.split(":")
-    city_id = parts[1]
-    city_name = parts[2]
-    region_id = parts[3]
 
     # Save city to state
-    await state.update_data(city_id=city_id, city_name=city_name, region_id=region_id)
+    await state.update_data(city_id=payload.city_id, city_name=city_name, region_id=payload.region_id)
 
     # Retrieve temporary message
-    data = await state.get_data()
     msg_id = data.get("temp_msg_id")
     chat_id = data.get("temp_chat_id")
 
     # Show currency selection
-    builder = InlineKeyboardBuilder()
-    builder.button(text="USD - Долар США", callback_data=f"currency:{CURRENCY_USD}")
-    builder.button(text="UAH - Гривня", callback_data=f"currency:{CURRENCY_UAH}")
-    builder.button(text="EUR - Євро", callback_data=f"currency:{CURRENCY_EUR}")
-    builder.adjust(1)
-
-    await bot.edit_message_text(
+    await _bot(callback).edit_message_text(
         chat_id=chat_id,
         message_id=msg_id,
         text=f"✨ Обрані параметри пошуку:\n\n🏙 Місто: <b>{city_name}</b>\n\nТепер оберіть валюту:",
-        reply_markup=builder.as_markup(),
+        reply_markup=CURRENCY_KEYBOARD,
     )
     await state.set_state(SearchStates.waiting_for_currency)
     await callback.answer()
 
 
 # --- Currency handler ---
-@dp.callback_query(F.data.startswith("currency:"))
-async def currency_handler(callback: types.CallbackQuery, state: FSMContext) -> None:
-    if callback.data is None:
-        await callback.answer("⚠️ Не вдалося отримати дані callback.", show_alert=True)
+@callbacks.route(ChooseCurrency)
+async def currency_handler(callback: types.CallbackQuery, state: FSMContext, payload: ChooseCurrency) -> None:
+    if payload.currency_index >= len(CURRENCY_OPTIONS):
+        await callback.answer("⚠️ Невідома валюта.", show_alert=True)
         return
-    currency = callback.data.split(":", 1)[1]
+    currency = CURRENCY_OPTIONS[payload.currency_index][1]
     await state.update_data(currency=currency)
 
     # Retrieve temporary message
@@ -219,28 +355,23 @@ async def currency_handler(callback: types.CallbackQuery, state: FSMContext) ->
     chat_id = data.get("temp_chat_id")
 
     # Show "price from" selection
-    builder = InlineKeyboardBuilder()
-    for label, value in PRICE_FROM_OPTIONS:
-        builder.button(text=label, callback_data=f"price_from:{value}")
-    builder.adjust(2)
-
-    await bot.edit_message_text(
+    await _bot(callback).edit_message_text(
         chat_id=chat_id,
         message_id=msg_id,
         text=f"✨ Обрані параметри пошуку:\n\n💵 Валюта: {currency}\n\nОберіть <b>Ціну від</b>:",
-        reply_markup=builder.as_markup(),
+        reply_markup=PRICE_FROM_KEYBOARD,
     )
     await state.set_state(SearchStates.waiting_for_price_from)
     await callback.answer()
 
 
 # --- Price from handler ---
-@dp.callback_query(F.data.startswith("price_from:"))
-async def price_from_handler(callback: types.CallbackQuery, state: FSMContext) -> None:
-    if callback.data is None:
-        await callback.answer("⚠️ Не вдалося отримати дані callback.", show_alert=True)
+@callbacks.route(ChoosePriceFrom)
+async def price_from_handler(callback: types.CallbackQuery, state: FSMContext, payload: ChoosePriceFrom) -> None:
+    if payload.option_index >= len(PRICE_FROM_OPTIONS):
+        await callback.answer("⚠️ Невідома ціна.", show_alert=True)
         return
-    price_from = callback.data.split(":", 1)[1]
+    price_from = PRICE_FROM_OPTIONS[payload.option_index][1]
     await state.update_data(price_from=price_from)
 
     # Retrieve temporary message
@@ -249,28 +380,24 @@ async def price_from_handler(callback: types.CallbackQuery, state: FSMContext) -
     chat_id = data.get("temp_chat_id")
 
     # Show "price to" selection
-    builder = InlineKeyboardBuilder()
-    for label, value in PRICE_TO_OPTIONS:
-        builder.button(text=label, callback_data=f"price_to:{value}")
-    builder.adjust(2)
     price_from = price_from if price_from else "немає"
-    await bot.edit_message_text(
+    await _bot(callback).edit_message_text(
         chat_id=chat_id,
         message_id=msg_id,
         text=f"✨ Обрані параметри пошуку:\n\n📈 Ціна від: {price_from}\n\nОберіть <b>Ціну до</b>:",
-        reply_markup=builder.as_markup(),
+        reply_markup=PRICE_TO_KEYBOARD,
     )
     await state.set_state(SearchStates.waiting_for_price_to)
     await callback.answer()
 
 
 # --- Price to handler ---
-@dp.callback_query(F.data.startswith("price_to:"))
-async def price_to_handler(callback: types.CallbackQuery, state: FSMContext) -> None:
-    if callback.data is None:
-        await callback.answer("⚠️ Не вдалося отримати дані callback.", show_alert=True)
+@callbacks.route(ChoosePriceTo)
+async def price_to_handler(callback: types.CallbackQuery, state: FSMContext, payload: ChoosePriceTo) -> None:
+    if payload.option_index >= len(PRICE_TO_OPTIONS):
+        await callback.answer("⚠️ Невідома ціна.", show_alert=True)
         return
-    price_to = callback.data.split(":", 1)[1]
+    price_to = PRICE_TO_OPTIONS[payload.option_index][1]
     await state.update_data(price_to=price_to)
 
     # Retrieve all data
@@ -287,6 +414,11 @@ async def price_to_handler(callback: types.CallbackQuery, state: FSMContext) ->
     price_to_str: str = price_to_val if isinstance(price_to_val, str) and price_to_val is not None else ""
     msg_id = data.get("temp_msg_id")
     chat_id = data.get("temp_chat_id")
+    if city_id is None or region_id is None or category_id is None or currency is None:
+        # The wizard state expired or was cleared (restart, another /start) halfway through
+        await state.clear()
+        await callback.answer("⚠️ Ця кнопка застаріла. Почніть спочатку: /start", show_alert=True)
+        return
 
     # Show final selected parameters
     text = (
@@ -298,15 +430,261 @@ async def price_to_handler(callback: types.CallbackQuery, state: FSMContext) ->
         f"📉 Ціна до: {price_to_str if price_to_str else 'немає'}"
     )
 
-    await bot.edit_message_text(chat_id=chat_id, message_id=msg_id, text=text)
+    # Save filter and subscribe the user, the poller picks it up on its next cycle
+    reply_markup = None
+    if callback.from_user:
+        filter_id, subscription = await add_user_search_filter(
+            telegram_id=callback.from_user.id,
+            filter_name=f"{category_name} / {city_name}",
+            category_id=int(category_id),
+            city_id=int(city_id),
+            region_id=int(region_id),
+            currency=CurrencyEnum(currency),
+            price_from=int(price_from) if price_from else None,
+            price_to=int(price_to_str) if price_to_str else None,
+            telegram_username=callback.from_user.username or "",
+        )
+        filter_pages.invalidate(callback.from_user.id)
+        text += "\n\nЯк надсилати нові оголошення?"
+        # Saving a filter the user already has keeps its delivery mode
+        reply_markup = delivery_keyboard(filter_id, selected=delivery_option(subscription.delivery_mode))
+
+    await _bot(callback).edit_message_text(chat_id=chat_id, message_id=msg_id, text=text, reply_markup=reply_markup)
     await state.clear()
     await callback.answer()
 
 
+# --- Delivery mode handler ---
+@callbacks.route(SetDelivery)
+async def delivery_handler(callback: types.CallbackQuery, state: FSMContext, payload: SetDelivery) -> None:
+    if payload.option_index >= len(DELIVERY_OPTIONS):
+        await callback.answer("⚠️ Невідомий режим.", show_alert=True)
+        return
+    label, mode, interval = DELIVERY_OPTIONS[payload.option_index]
+    if not await set_delivery_mode(callback.from_user.id, payload.filter_id, DeliveryModeEnum(mode), interval):
+        await callback.answer("⚠️ Фільтр не знайдено.", show_alert=True)
+        return
+    filter_pages.invalidate(callback.from_user.id)
+    if isinstance(callback.message, types.Message):
+        await callback.message.edit_reply_markup(
+            reply_markup=delivery_keyboard(payload.filter_id, selected=payload.option_index)
+        )
+    await callback.answer(f"Збережено: {label}")
+
+
+# --- Digest paging handler ---
+@callbacks.route(DigestPage)
+async def digest_page_handler(callback: types.CallbackQuery, state: FSMContext, payload: DigestPage) -> None:
+    digest, offers = await get_digest_page(payload.digest_id, payload.page, DIGEST_PAGE_SIZE)
+    if digest is None or digest.id is None or not offers:
+        await callback.answer("⚠️ Цей дайджест вже недоступний.", show_alert=True)
+        return
+    text, markup = render_digest_page(digest.id, digest.title, digest.offer_count, offers, payload.page)
+    if isinstance(callback.message, types.Message):
+        await callback.message.edit_text(text, reply_markup=markup)
+    await callback.answer()
+
+
+# --- /filters paging and actions ---
+async def _show_filters_page(callback: types.CallbackQuery, anchor: int, backward: bool = False) -> None:
+    text, markup = await filter_pages.get(callback.from_user.id, anchor, backward)
+    if not isinstance(callback.message, types.Message):
+        return
+    try:
+        await callback.message.edit_text(text, reply_markup=markup)
+    except TelegramBadRequest as e:
+        # A second tap on a button of an already refreshed page renders the same page again
+        if "message is not modified" not in e.message:
+            raise
+
+
+@callbacks.route(FiltersPage)
+async def filters_page_handler(callback: types.CallbackQuery, state: FSMContext, payload: FiltersPage) -> None:
+    await _show_filters_page(callback, payload.anchor, payload.backward)
+    await callback.answer()
+
+
+@callbacks.route(ToggleFilter)
+async def toggle_filter_handler(callback: types.CallbackQuery, state: FSMContext, payload: ToggleFilter) -> None:
+    row = await toggle_subscription_paused(callback.from_user.id, payload.filter_id)
+    if row is None:
+        filter_pages.invalidate(callback.from_user.id)
+        await _show_filters_page(callback, payload.anchor)
+        await callback.answer("⚠️ Фільтр не знайдено.", show_alert=True)
+        return
+    subscription, search_filter = row
+    filter_pages.changed(callback.from_user.id, search_filter, subscription, active=not subscription.paused)
+    await _show_filters_page(callback, payload.anchor)
+    await callback.answer("⏸ Призупинено" if subscription.paused else "▶️ Відновлено")
+
+
+@callbacks.route(DeleteFilter)
+async def delete_filter_handler(callback: types.CallbackQuery, state: FSMContext, payload: DeleteFilter) -> None:
+    row = await delete_user_subscription(callback.from_user.id, payload.filter_id)
+    if row is None:
+        filter_pages.invalidate(callback.from_user.id)
+    else:
+        subscription, search_filter = row
+        filter_pages.changed(callback.from_user.id, search_filter, subscription, active=False)
+    await _show_filters_page(callback, payload.anchor)
+    await callback.answer("🗑 Видалено" if row is not None else "⚠️ Фільтр вже видалено.")
+
+
+# --- Application ---
+def register_handlers(router: Router) -> None:
+    router.message.register(start_handler, Command("start"))
+    router.message.register(stats_handler, Command("stats"))
+    router.message.register(filters_handler, Command("filters"))
+    router.callback_query.register(callback_handler)
+    router.message.register(process_city_input, SearchStates.waiting_for_city)
+
+
+class InFlightUpdates:
+    """
+    Outer update middleware counting updates being handled, so shutdown can wait for them.
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def __call__(
+        self,
+        handler: Callable[[types.TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: types.TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        self.count += 1
+        self._idle.clear()
+        try:
+            return await handler(event, data)
+        finally:
+            self.count -= 1
+            if not self.count:
+                self._idle.set()
+
+    async def drain(self, timeout: float) -> bool:
+        """
+        Wait up to `timeout` seconds for handlers still running, False if some did not finish.
+        """
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Shutting down with {self.count} updates still being handled.")
+            return False
+        return True
+
+
+@dataclass
+class BotApp:
+    """
+    One bot process: bot, dispatcher and background jobs, built by `create_bot_app()`.
+
+    Nothing connects until `startup()`, which the dispatcher runs before the first update.
+    """
+
+    bot: Bot
+    dp: Dispatcher
+    notifier: Notifier
+    poller: ListingPoller
+    digests: DigestScheduler
+    updates: InFlightUpdates
+
+    async def startup(self, run_background_jobs: bool = True) -> None:
+        start_loop_monitor()
+        gazetteer.open()
+        price_history.open()
+        # Warm up side by side: pooled DB and OLX connections, known users, currency rates
+        await asyncio.gather(warm_db(), olx_client.start(), known_users.warm(), rate_cache.refresh())
+        known_users.start()
+        # With several webhook workers only one of them polls OLX and sends notifications
+        if run_background_jobs:
+            self.notifier.start()
+            self.digests.start()
+            if POLLER_EMBEDDED:
+                # Pauses and deletions from /filters reach the poller at once
+                filter_pages.listeners.append(self.poller.update_subscription)
+                self.poller.start()
+
+    async def shutdown(self) -> None:
+        # Updates still in handlers may enqueue notifications and write to the DB, finish them first
+        await self.updates.drain(SHUTDOWN_DRAIN_TIMEOUT)
+        if self.poller.update_subscription in filter_pages.listeners:
+            filter_pages.listeners.remove(self.poller.update_subscription)
+        await self.poller.stop()
+        await self.digests.stop()
+        await self.notifier.stop(SHUTDOWN_DRAIN_TIMEOUT)
+        await gazetteer.flush()
+        gazetteer.close()
+        price_history.flush()
+        price_history.close()
+        await olx_client.close()
+        await known_users.stop()
+        await close_db()
+        await stop_loop_monitor()
+
+
+def create_bot_app(token: str | None = API_TOKEN) -> BotApp:
+    """
+    Build the bot, dispatcher, FSM storage, notifier, poller and digest scheduler.
+    """
+    if not token:
+        raise ValueError("No API token provided. Please set the API_TOKEN environment variable.")
+    bot = Bot(token=token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    storage = create_fsm_storage()
+    # A buffered storage gets the FSM middleware registered below, inside its batch
+    dp = Dispatcher(storage=storage, disable_fsm=isinstance(storage, BufferedStorage))
+    updates = InFlightUpdates()
+    dp.update.outer_middleware(updates)
+    if isinstance(storage, BufferedStorage):
+        # Flush FSM writes once per update instead of once per state call. The FSM middleware
+        # loads the state for every update, so it runs inside the batch and that read is shared.
+        dp.update.outer_middleware(FSMBatchMiddleware(storage))
+        dp.update.outer_middleware(dp.fsm)
+    router = Router(name="olx_bot")
+    register_handlers(router)
+    dp.include_router(router)
+    if METRICS_ENABLED:
+        instrument_dispatcher(dp)
+
+    # Sharded poller workers send through the same bot, see NOTIFY_BOT_SHARE
+    notifier = Notifier(bot, global_share=1.0 if POLLER_EMBEDDED else NOTIFY_BOT_SHARE)
+
+    async def send_new_offers(chat_id: int, offers: list[Offer]) -> None:
+        notifier.enqueue_offers(chat_id, offers)
+
+    poller = ListingPoller(deliver=send_new_offers)
+    digests = DigestScheduler(
+        send=lambda chat_id, text, markup: notifier.enqueue_text(chat_id, text, reply_markup=markup)
+    )
+    app = BotApp(bot=bot, dp=dp, notifier=notifier, poller=poller, digests=digests, updates=updates)
+    dp.startup.register(app.startup)
+    dp.shutdown.register(app.shutdown)
+
+    if METRICS_ENABLED:
+        track_stats("city_cache", city_cache.stats)
+        track_stats("olx", olx_client.stats)
+        track_stats("notifier", notifier.stats)
+        track_stats("poller", poller.stats)
+        track_stats("known_users", known_users.stats)
+        track_stats("price_history", price_history.stats)
+        track_stats("digests", digests.stats)
+        track_stats("filter_pages", filter_pages.stats)
+    return app
+
+
 # --- Entrypoint ---
 async def main() -> None:
-    await dp.start_polling(bot)
+    app = create_bot_app()
+    metrics_runner = await start_server() if METRICS_ENABLED else None
+    try:
+        await app.dp.start_polling(app.bot)
+    finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     asyncio.run(main())
@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from typing import Awaitable, Callable, Iterable
+
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+
+from db import load_telegram_users, upsert_telegram_users
+
+USER_REGISTRY_MAXSIZE = int(os.getenv("USER_REGISTRY_MAXSIZE", "100000"))
+USER_REGISTRY_FLUSH_INTERVAL = float(os.getenv("USER_REGISTRY_FLUSH_INTERVAL", "1.0"))
+# Flush early once this many users are waiting
+USER_REGISTRY_FLUSH_BATCH = int(os.getenv("USER_REGISTRY_FLUSH_BATCH", "500"))
+
+SaveUsers = Callable[[Iterable[tuple[int, str]]], Awaitable[object]]
+LoadUsers = Callable[[int], Awaitable[list[tuple[int, str]]]]
+
+
+def _transient(error: Exception) -> bool:
+    """
+    Whether `error` is the database being unavailable rather than a row it rejects.
+    """
+    if isinstance(error, (OperationalError, InterfaceError, OSError, asyncio.TimeoutError)):
+        return True
+    return isinstance(error, DBAPIError) and error.connection_invalidated
+
+
+class UserRegistry:
+    """
+    Bounded LRU of known Telegram users (telegram_id -> username) in front of `telegramuser`.
+
+    A repeat /start from a known user with an unchanged username does not touch the database.
+    New users and changed usernames are remembered at once and written behind in batches by
+    `run()`. A batch that fails because the database is unavailable is retried on the next
+    flush; one the database rejects is split until the rejected rows are found, and only those
+    are dropped. Warmed at startup with the most recently registered users.
+    """
+
+    def __init__(
+        self,
+        save: SaveUsers = upsert_telegram_users,
+        load: LoadUsers = load_telegram_users,
+        *,
+        maxsize: int = USER_REGISTRY_MAXSIZE,
+        flush_interval: float = USER_REGISTRY_FLUSH_INTERVAL,
+        flush_batch: int = USER_REGISTRY_FLUSH_BATCH,
+    ) -> None:
+        self._save = save
+        self._load = load
+        self.maxsize = maxsize
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self._known: OrderedDict[int, str] = OrderedDict()
+        self._pending: dict[int, str] = {}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+        self.hits = 0
+        self.misses = 0
+        self.written = 0
+        self.failed_flushes = 0
+        self.rejected = 0
+
+    def __len__(self) -> int:
+        return len(self._known)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._known),
+            "pending": len(self._pending),
+            "hits": self.hits,
+            "misses": self.misses,
+            "written": self.written,
+            "failed_flushes": self.failed_flushes,
+            "rejected": self.rejected,
+        }
+
+    async def warm(self) -> None:
+        try:
+            users = await self._load(self.maxsize)
+        except Exception:
+            # Not fatal: unknown users are simply written once more
+            logging.exception("Could not warm the user registry, starting cold.")
+            return
+        # Newest first from the database, so the newest end up most recently used
+        for telegram_id, username in reversed(users):
+            self._known[telegram_id] = username
+        logging.info(f"User registry warmed with {len(users)} users.")
+
+    def remember(self, telegram_id: int, username: str) -> bool:
+        """
+        Record a user seen by the bot, True if they have to be written to the database.
+        """
+        if self._known.get(telegram_id) == username:
+            self._known.move_to_end(telegram_id)
+            self.hits += 1
+            return False
+        self.misses += 1
+        self._known[telegram_id] = username
+        self._known.move_to_end(telegram_id)
+        while len(self._known) > self.maxsize:
+            self._known.popitem(last=False)
+        self._pending[telegram_id] = username
+        if len(self._pending) >= self.flush_batch:
+            self._wakeup.set()
+        return True
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        # Written or rejected, either way not to be retried
+        done: set[int] = set()
+        try:
+            await self._save_isolating(batch, done)
+        except Exception:
+            self.failed_flushes += 1
+            # Keep anything remembered since, it is newer than the failed batch
+            unsaved = {telegram_id: name for telegram_id, name in batch.items() if telegram_id not in done}
+            self._pending = unsaved | self._pending
+            raise
+
+    async def _save_isolating(self, batch: dict[int, str], done: set[int]) -> None:
+        """
+        Save `batch`, halving it on a rejected write so one bad row does not hold back the rest
+        forever; rows rejected on their own are dropped. Unavailability errors propagate.
+        """
+        try:
+            await self._save(batch.items())
+        except Exception as e:
+            if _transient(e):
+                raise
+            if len(batch) == 1:
+                [(telegram_id, username)] = batch.items()
+                self.rejected += 1
+                done.add(telegram_id)
+                # Forgotten, so the next /start of this user tries again
+                if self._known.get(telegram_id) == username:
+                    del self._known[telegram_id]
+                logging.error(f"Dropping Telegram user {telegram_id} rejected by the database: {e}")
+                return
+            items = list(batch.items())
+            await self._save_isolating(dict(items[: len(items) // 2]), done)
+            await self._save_isolating(dict(items[len(items) // 2 :]), done)
+            return
+        done.update(batch)
+        self.written += len(batch)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logging.exception(f"Failed to write {len(self._pending)} Telegram users, retrying later.")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run(), name="user-registry")
+
+    async def stop(self) -> None:
+        """
+        Stop the writer and flush what is still pending.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+# Shared registry for the whole process
+known_users = UserRegistry()
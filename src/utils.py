@@ -1,5 +1,10 @@
 # src/utils.py
 
+import html
+
+from offers import Offer
+from price_history import PriceStats
+
 
 def remove_duplicate_cities(data: list[dict]) -> list[dict]:
     seen = set()
@@ -10,3 +15,38 @@ def remove_duplicate_cities(data: list[dict]) -> list[dict]:
             seen.add(city_id)
             unique.append(item)
     return unique
+
+
+def format_offer(offer: Offer) -> str:
+    title = html.escape(offer.title)
+    text = f"🆕 <b>{title}</b>"
+    if offer.price_label:
+        text += f"\n💵 {html.escape(offer.price_label)}"
+    if offer.seller:
+        text += f"\n👤 {html.escape(offer.seller)}"
+    return f"{text}\n{offer.url}"
+
+
+def get_offer_photo(offer: Offer, width: int = 1000, height: int = 750) -> str | None:
+    if not offer.photo:
+        return None
+    return offer.photo.replace("{width}", str(width)).replace("{height}", str(height))
+
+
+def _format_amount(value: float) -> str:
+    return f"{value:,.0f}".replace(",", " ")
+
+
+def format_price_stats(name: str, stats: PriceStats | None, usd_rate: float) -> str:
+    """
+    One /stats block: median and interquartile range in UAH, the median in USD too.
+    """
+    text = f"<b>{html.escape(name)}</b>\n"
+    if stats is None:
+        return text + "ще немає даних"
+    low, median, high = stats.quantiles
+    return (
+        text
+        + f"медіана {_format_amount(median)} ₴ (≈ {_format_amount(median / usd_rate)} $)\n"
+        + f"25–75%: {_format_amount(low)} – {_format_amount(high)} ₴, оголошень: {stats.count}"
+    )
@@ -0,0 +1,359 @@
+"""
+Webhook entry point: aiohttp server, optionally several worker processes on one port.
+
+Updates are acknowledged immediately and handled in the background. Telegram retries
+an update it did not get a timely 200 for, so update ids are de-duplicated across
+workers through a small shared SQLite table. /filters pauses and deletions are passed
+between workers through the same file. Polling (`telegram_bot.main`) stays available
+for development.
+
+Usage: python src/webhook.py [--workers 4] [--port 8080]
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.types import TelegramObject, Update
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from metrics import METRICS_ENABLED, handle_metrics
+
+if TYPE_CHECKING:
+    from filter_pages import FilterPages
+    from models import SearchFilter, UserSearchFilters
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # public base url, e.g. https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "1"))
+UPDATE_DEDUP_PATH = Path(os.getenv("UPDATE_DEDUP_PATH", "data/updates.sqlite3"))
+# Telegram gives up retrying long before this
+UPDATE_DEDUP_TTL = 3600.0
+UPDATE_DEDUP_MEMORY = 10_000
+# Subscription changes made through one worker reach the others within this many seconds
+SUBSCRIPTION_FEED_INTERVAL = float(os.getenv("SUBSCRIPTION_FEED_INTERVAL", "1"))
+
+LoadSubscription = Callable[[int, int], Awaitable["tuple[UserSearchFilters, SearchFilter] | None"]]
+
+
+class UpdateDeduplicator:
+    """
+    Remembers recently handled update ids: per-process LRU in front of an optional shared table.
+    """
+
+    def __init__(self, path: Path | None = UPDATE_DEDUP_PATH, ttl: float = UPDATE_DEDUP_TTL) -> None:
+        self.ttl = ttl
+        self._recent: OrderedDict[int, None] = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._inserts = 0
+        self.duplicates = 0
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS seen_update (update_id INTEGER PRIMARY KEY, seen_at REAL)")
+
+    def _claim_shared(self, update_id: int) -> bool:
+        assert self._conn is not None
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO seen_update (update_id, seen_at) VALUES (?, ?)", (update_id, now)
+            )
+            self._inserts += 1
+            if self._inserts % 1000 == 0:
+                self._conn.execute("DELETE FROM seen_update WHERE seen_at < ?", (now - self.ttl,))
+        return cursor.rowcount == 1
+
+    async def claim(self, update_id: int) -> bool:
+        """
+        True the first time `update_id` is seen by any worker.
+        """
+        if update_id in self._recent:
+            self.duplicates += 1
+            return False
+        self._recent[update_id] = None
+        if len(self._recent) > UPDATE_DEDUP_MEMORY:
+            self._recent.popitem(last=False)
+        if self._conn is not None and not await asyncio.to_thread(self._claim_shared, update_id):
+            self.duplicates += 1
+            return False
+        return True
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+
+
+class UpdateDedupMiddleware(BaseMiddleware):
+    def __init__(self, deduplicator: UpdateDeduplicator) -> None:
+        self.deduplicator = deduplicator
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        if isinstance(event, Update) and not await self.deduplicator.claim(event.update_id):
+            logging.info(f"Skipping duplicate update {event.update_id}.")
+            return UNHANDLED
+        return await handler(event, data)
+
+
+class SubscriptionFeed:
+    """
+    Subscription pauses, resumes and deletions made through one webhook worker, replayed on the
+    others: `publish` (a `FilterPages` listener) queues them, and every `interval` each worker
+    appends its own to a table in the shared SQLite file and reads the other workers' ones.
+    Replaying goes through `FilterPages.changed`, so the primary's poller and every worker's
+    cached pages follow.
+    """
+
+    def __init__(
+        self,
+        pages: "FilterPages",
+        load: LoadSubscription,
+        path: Path = UPDATE_DEDUP_PATH,
+        *,
+        interval: float = SUBSCRIPTION_FEED_INTERVAL,
+        ttl: float = UPDATE_DEDUP_TTL,
+    ) -> None:
+        self.pages = pages
+        self._load = load
+        self.interval = interval
+        self.ttl = ttl
+        self.origin = os.getpid()
+        # (telegram_id, filter_id, filter json, subscription json) not written yet
+        self._outbox: list[tuple[int, int, str, str]] = []
+        self._replaying = False
+        self._task: asyncio.Task[None] | None = None
+        self.published = 0
+        self.replayed = 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS subscription_change (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "origin INTEGER, telegram_id INTEGER, filter_id INTEGER, search_filter TEXT, subscription TEXT, "
+            "changed_at REAL)"
+        )
+        # Only changes made from now on
+        (self._last_id,) = self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM subscription_change").fetchone()
+
+    def publish(
+        self, telegram_id: int, search_filter: "SearchFilter", subscription: "UserSearchFilters", active: bool
+    ) -> None:
+        if self._replaying or search_filter.id is None:
+            return
+        self._outbox.append(
+            (telegram_id, search_filter.id, search_filter.model_dump_json(), subscription.model_dump_json())
+        )
+        self.published += 1
+
+    def _exchange(self, outbox: list[tuple[int, int, str, str]]) -> list[tuple[int, int, int, str, str]]:
+        now = time.time()
+        if outbox:
+            self._conn.executemany(
+                "INSERT INTO subscription_change (origin, telegram_id, filter_id, search_filter, subscription, "
+                "changed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(self.origin, *change, now) for change in outbox],
+            )
+            self._conn.execute("DELETE FROM subscription_change WHERE changed_at < ?", (now - self.ttl,))
+        return self._conn.execute(
+            "SELECT id, telegram_id, filter_id, search_filter, subscription FROM subscription_change "
+            "WHERE id > ? AND origin != ? ORDER BY id",
+            (self._last_id, self.origin),
+        ).fetchall()
+
+    async def sync(self) -> None:
+        """
+        Write this worker's changes and apply the other workers' ones.
+        """
+        from models import SearchFilter, UserSearchFilters
+
+        outbox, self._outbox = self._outbox, []
+        changes = await asyncio.to_thread(self._exchange, outbox)
+        for change_id, telegram_id, filter_id, filter_json, subscription_json in changes:
+            self._last_id = change_id
+            # The database has the outcome of every change so far, the row is only needed once deleted
+            row = await self._load(telegram_id, filter_id)
+            if row is not None:
+                subscription, search_filter = row
+                active = not subscription.paused
+            else:
+                search_filter = SearchFilter.model_validate_json(filter_json)
+                subscription = UserSearchFilters.model_validate_json(subscription_json)
+                active = False
+            self._replaying = True
+            try:
+                self.pages.changed(telegram_id, search_filter, subscription, active)
+            finally:
+                self._replaying = False
+            self.replayed += 1
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sync()
+            except Exception:
+                logging.exception("Subscription feed sync failed.")
+
+    def start(self) -> None:
+        if self._task is None:
+            self.pages.listeners.append(self.publish)
+            self._task = asyncio.create_task(self.run(), name="subscription-feed")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self.pages.listeners.remove(self.publish)
+        # Changes made during the last interval still reach the other workers
+        await asyncio.to_thread(self._exchange, self._outbox)
+        self._outbox = []
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def create_app(
+    dp: Dispatcher,
+    bot: Bot,
+    *,
+    primary: bool = True,
+    path: str = WEBHOOK_PATH,
+    drain: Callable[[], Awaitable[object]] | None = None,
+    subscription_feed: SubscriptionFeed | None = None,
+) -> web.Application:
+    """
+    aiohttp application serving the webhook. Only the primary worker runs background jobs.
+    `drain` waits for updates still being handled on shutdown, before the bot session closes.
+    `subscription_feed` exchanges subscription changes with the other workers.
+    """
+    deduplicator = UpdateDeduplicator()
+    # First of the outer middlewares, so a duplicate does not even load or flush FSM state
+    registered = list(dp.update.outer_middleware)
+    for middleware in registered:
+        dp.update.outer_middleware.unregister(middleware)
+    dp.update.outer_middleware(UpdateDedupMiddleware(deduplicator))
+    for middleware in registered:
+        dp.update.outer_middleware(middleware)
+
+    app = web.Application()
+    if drain is not None:
+
+        async def drain_updates(_: web.Application) -> None:
+            await drain()
+
+        # Shutdown callbacks run in order, this one before the request handler closes the bot
+        app.on_shutdown.append(drain_updates)
+    SimpleRequestHandler(
+        dispatcher=dp, bot=bot, handle_in_background=True, secret_token=WEBHOOK_SECRET or None
+    ).register(app, path=path)
+    setup_application(app, dp, bot=bot, run_background_jobs=primary)
+
+    async def register_webhook(_: web.Application) -> None:
+        if WEBHOOK_URL:
+            await bot.set_webhook(
+                url=f"{WEBHOOK_URL.rstrip('/')}{path}",
+                secret_token=WEBHOOK_SECRET or None,
+                allowed_updates=dp.resolve_used_update_types(),
+                max_connections=100,
+            )
+
+    async def close_deduplicator(_: web.Application) -> None:
+        deduplicator.close()
+
+    if METRICS_ENABLED:
+        # Every worker reports its own process; scrape them all or run a single worker
+        app.router.add_get("/metrics", handle_metrics)
+    if primary:
+        app.on_startup.append(register_webhook)
+    if subscription_feed is not None:
+        feed = subscription_feed
+
+        async def start_feed(_: web.Application) -> None:
+            feed.start()
+
+        async def stop_feed(_: web.Application) -> None:
+            await feed.stop()
+            feed.close()
+
+        app.on_startup.append(start_feed)
+        app.on_shutdown.append(stop_feed)
+    app.on_shutdown.append(close_deduplicator)
+    return app
+
+
+def run_worker(index: int, host: str, port: int, reuse_port: bool) -> None:
+    # Imported here so every spawned worker builds its own bot, pools and storage.
+    from db import get_user_subscription
+    from filter_pages import filter_pages
+    from telegram_bot import SHUTDOWN_DRAIN_TIMEOUT, create_bot_app
+
+    bot_app = create_bot_app()
+    app = create_app(
+        bot_app.dp,
+        bot_app.bot,
+        primary=index == 0,
+        drain=lambda: bot_app.updates.drain(SHUTDOWN_DRAIN_TIMEOUT),
+        # Ports are only shared between several workers
+        subscription_feed=SubscriptionFeed(filter_pages, get_user_subscription) if reuse_port else None,
+    )
+    logging.info(f"Webhook worker {index} (pid {os.getpid()}) listening on {host}:{port}.")
+    web.run_app(app, host=host, port=port, reuse_port=reuse_port, print=None)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the bot in webhook mode.")
+    parser.add_argument("--host", default=WEBHOOK_HOST)
+    parser.add_argument("--port", type=int, default=WEBHOOK_PORT)
+    parser.add_argument("--workers", type=int, default=WEBHOOK_WORKERS)
+    args = parser.parse_args()
+
+    if not WEBHOOK_SECRET:
+        logging.warning("WEBHOOK_SECRET is not set, webhook requests are not authenticated.")
+    if args.workers <= 1:
+        run_worker(0, args.host, args.port, reuse_port=False)
+        return
+
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=run_worker, args=(index, args.host, args.port, True), name=f"webhook-{index}")
+        for index in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,121 @@
+import asyncio
+import struct
+from dataclasses import dataclass
+from typing import Any, ClassVar
+
+import pytest
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import CallbackQuery, User
+
+from callbacks import (
+    MAX_CALLBACK_DATA,
+    CallbackPayload,
+    CallbackRouter,
+    CategoryDetail,
+    ChooseCity,
+    ChooseCurrency,
+    ChoosePriceFrom,
+    ChoosePriceTo,
+    DeleteFilter,
+    DigestPage,
+    FiltersPage,
+    RealEstateMenu,
+    SetDelivery,
+    ToggleFilter,
+)
+
+# The largest value of every field, so a payload never gets longer than these
+PAYLOADS: list[CallbackPayload] = [
+    RealEstateMenu(),
+    CategoryDetail(2**32 - 1),
+    ChooseCity(2**32 - 1, 2**32 - 1),
+    ChooseCurrency(255),
+    ChoosePriceFrom(255),
+    ChoosePriceTo(0),
+    SetDelivery(2**32 - 1, 255),
+    DigestPage(2**32 - 1, 2**16 - 1),
+    FiltersPage(2**32 - 1, True),
+    ToggleFilter(1, 0),
+    DeleteFilter(2**32 - 1, 7),
+]
+
+
+def test_every_payload_type_round_trips_within_the_limit() -> None:
+    # slots=True dataclasses are new classes, the originals may linger among the subclasses
+    routed = {cls.__name__ for cls in CallbackPayload.__subclasses__() if cls.__module__ == "callbacks"}
+    assert {type(payload).__name__ for payload in PAYLOADS} == routed
+    assert len({payload.code for payload in PAYLOADS}) == len(PAYLOADS)
+    for payload in PAYLOADS:
+        data = payload.pack()
+        assert len(data.encode()) <= MAX_CALLBACK_DATA
+        assert data[0] == payload.code and type(payload).unpack(data) == payload
+
+
+def test_payload_over_64_bytes_is_refused() -> None:
+    @dataclass(frozen=True, slots=True)
+    class Fits(CallbackPayload):
+        code: ClassVar[str] = "Y"
+        layout: ClassVar[struct.Struct] = struct.Struct("<47s")
+        blob: bytes
+
+    @dataclass(frozen=True, slots=True)
+    class Oversized(CallbackPayload):
+        code: ClassVar[str] = "Z"
+        layout: ClassVar[struct.Struct] = struct.Struct("<48s")
+        blob: bytes
+
+    assert len(Fits(b"x").pack()) == MAX_CALLBACK_DATA
+    with pytest.raises(ValueError):
+        Oversized(b"x").pack()
+
+
+def test_out_of_range_field_does_not_pack() -> None:
+    with pytest.raises(struct.error):
+        ChooseCurrency(256).pack()
+
+
+def _callback(data: str | None) -> CallbackQuery:
+    return CallbackQuery(id="1", from_user=User(id=1, is_bot=False, first_name="User"), chat_instance="1", data=data)
+
+
+def test_router_dispatches_known_payloads_and_rejects_garbage() -> None:
+    router = CallbackRouter()
+    handled: list[tuple[str, Any]] = []
+
+    @router.route(ChooseCity)
+    async def choose_city(callback: CallbackQuery, state: FSMContext, payload: ChooseCity) -> None:
+        handled.append(("city", payload))
+
+    @router.route(FiltersPage)
+    async def filters_page(callback: CallbackQuery, state: FSMContext, payload: FiltersPage) -> None:
+        handled.append(("filters", payload))
+
+    with pytest.raises(ValueError):
+        router.route(ChooseCity)(choose_city)
+
+    garbage = [
+        None,
+        "",
+        "choose_city:268:Київ:25",  # old style data of messages sent before the codec
+        "Z" + ChooseCity(1, 2).pack()[1:],  # unknown code
+        "C",  # no fields
+        "C!!!!",  # not base64
+        ChooseCity(268, 25).pack()[:-2],  # cut short
+        ChooseCity(268, 25).pack() + "AAAA",  # too long
+        "C" + "Ж" * 12,
+    ]
+    state = FSMContext(MemoryStorage(), StorageKey(bot_id=42, chat_id=1, user_id=1))
+
+    async def run() -> list[bool]:
+        results = [
+            await router.dispatch(_callback(ChooseCity(268, 25).pack()), state),
+            await router.dispatch(_callback(FiltersPage(9, False).pack()), state),
+        ]
+        for data in garbage:
+            results.append(await router.dispatch(_callback(data), state))
+        return results
+
+    assert asyncio.run(run()) == [True, True] + [False] * len(garbage)
+    assert handled == [("city", ChooseCity(268, 25)), ("filters", FiltersPage(9, False))]
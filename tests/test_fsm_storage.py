@@ -0,0 +1,67 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import Any, Mapping
+
+import pytest
+from aiogram import F, Router
+from aiogram.fsm.context import FSMContext
+from aiogram.types import Chat, Message, Update, User
+
+import telegram_bot
+from fsm_storage import BufferedStorage, Record
+
+
+class DictBackend:
+    def __init__(self) -> None:
+        self.rows: dict[str, Record] = {}
+        self.reads = 0
+        self.writes = 0
+
+    async def read(self, key: str) -> Record | None:
+        self.reads += 1
+        return self.rows.get(key)
+
+    async def write(self, key: str, state: str | None, data: Mapping[str, Any]) -> None:
+        self.writes += 1
+        self.rows[key] = (state, dict(data))
+
+    async def close(self) -> None:
+        pass
+
+
+def _update(update_id: int, text: str) -> Update:
+    user = User(id=7, is_bot=False, first_name="Test")
+    message = Message(
+        message_id=update_id,
+        date=datetime.now(timezone.utc),
+        chat=Chat(id=7, type="private"),
+        from_user=user,
+        text=text,
+    )
+    return Update(update_id=update_id, message=message)
+
+
+def test_one_backend_read_and_write_per_update(monkeypatch: pytest.MonkeyPatch) -> None:
+    backend = DictBackend()
+    storage = BufferedStorage(backend)
+    monkeypatch.setattr(telegram_bot, "create_fsm_storage", lambda: storage)
+    app = telegram_bot.create_bot_app("42:TEST")
+    router = Router()
+
+    @router.message(F.text == "probe")
+    async def probe(message: Message, state: FSMContext, raw_state: str | None) -> None:
+        await state.get_state()
+        await state.update_data(seen=(await state.get_data()).get("seen", 0) + 1)
+        await state.set_state(telegram_bot.SearchStates.waiting_for_currency)
+
+    app.dp.include_router(router)
+
+    async def run() -> None:
+        for update_id in (1, 2):
+            await app.dp.feed_update(app.bot, _update(update_id, "probe"))
+        await app.bot.session.close()
+
+    asyncio.run(run())
+
+    assert backend.reads == 2 and backend.writes == 2
+    assert list(backend.rows.values()) == [(telegram_bot.SearchStates.waiting_for_currency.state, {"seen": 2})]
@@ -0,0 +1,73 @@
+import asyncio
+import os
+from typing import Any
+
+import pytest
+from sqlalchemy import exists, text
+from sqlmodel import col, select
+
+import db
+from models import (
+    FILTER_IDENTITY,
+    CurrencyEnum,
+    SearchFilter,
+    TelegramUser,
+    UserSearchFilters,
+)
+
+# Plans depend on the database, so this runs against the Postgres in DATABASE_URL only
+pytestmark = pytest.mark.skipif(
+    not os.getenv("DATABASE_URL", "").startswith("postgresql"), reason="needs DATABASE_URL of a Postgres database"
+)
+
+INDEX_MARKERS = ("Index Scan", "Index Only Scan", "Bitmap Index Scan")
+
+
+def _hot_queries() -> dict[str, Any]:
+    spec = db.FilterSpec(1, 2, 3, CurrencyEnum.UAH, None, 10000)
+    identity = (*spec[:4], -1, spec.price_to)
+    return {
+        "user by telegram_id": select(col(TelegramUser.id)).where(col(TelegramUser.telegram_id) == 10_000_001),
+        "filters of a user": select(SearchFilter)
+        .join(UserSearchFilters, col(UserSearchFilters.search_filter_id) == col(SearchFilter.id))
+        .where(col(UserSearchFilters.user_id) == 42),
+        "subscribers of a filter": select(col(TelegramUser.telegram_id))
+        .join(UserSearchFilters, col(UserSearchFilters.user_id) == col(TelegramUser.id))
+        .where(col(UserSearchFilters.search_filter_id) == 42),
+        "filter by identity": select(col(SearchFilter.id)).where(
+            *(column == value for column, value in zip(FILTER_IDENTITY, identity))
+        ),
+        "orphaned filter check": select(col(SearchFilter.id)).where(
+            col(SearchFilter.id) == 42,
+            ~exists().where(col(UserSearchFilters.search_filter_id) == col(SearchFilter.id)),
+        ),
+        "filters page of a user": db.user_filters_page_query(10_000_001, anchor=42, limit=6),
+        "previous filters page": db.user_filters_page_query(10_000_001, anchor=42, backward=True, limit=6),
+    }
+
+
+async def _plans() -> dict[str, str]:
+    await db.create_db_and_tables()
+    plans = {}
+    try:
+        async with db.get_engine().connect() as connection:
+            # Small tables would be scanned anyway; this shows whether an index *can* be used
+            await connection.execute(text("SET enable_seqscan = off"))
+            for name, statement in _hot_queries().items():
+                sql = statement.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True})
+                rows = await connection.execute(text(f"EXPLAIN {sql}"))
+                plans[name] = "\n".join(row[0] for row in rows)
+    finally:
+        await db.close_db()
+    return plans
+
+
+def test_hot_lookups_are_index_scans_without_sorting() -> None:
+    plans = asyncio.run(_plans())
+
+    slow = {
+        name: plan
+        for name, plan in plans.items()
+        if not any(marker in plan for marker in INDEX_MARKERS) or "Seq Scan" in plan or "Sort  (" in plan
+    }
+    assert slow == {}
@@ -0,0 +1,25 @@
+import asyncio
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from metrics import instrument_engine
+
+
+def test_failed_statements_do_not_leave_start_times_behind() -> None:
+    async def run() -> list[float]:
+        engine = create_async_engine("sqlite+aiosqlite://")
+        instrument_engine(engine)
+        async with engine.connect() as conn:
+            for _ in range(3):
+                with pytest.raises(OperationalError):
+                    await conn.execute(text("SELECT * FROM missing"))
+            await conn.execute(text("SELECT 1"))
+            assert conn.sync_connection is not None
+            started = list(conn.sync_connection.info["metrics_started"])
+        await engine.dispose()
+        return started
+
+    assert asyncio.run(run()) == []
@@ -0,0 +1,200 @@
+import asyncio
+from typing import Any
+
+from aiogram.exceptions import (
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramServerError,
+)
+from aiogram.methods import SendMessage
+
+from notifier import Notification, Notifier
+from offers import Offer
+from rate_limit import Priority
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class StubBot:
+    """
+    Records sends; `errors` are raised by the next calls, one per call.
+    """
+
+    def __init__(self, *errors: Exception) -> None:
+        self.errors = list(errors)
+        self.messages: list[tuple[int, str]] = []
+        self.albums: list[tuple[int, int]] = []
+
+    def _fail(self) -> None:
+        if self.errors:
+            raise self.errors.pop(0)
+
+    async def send_message(self, chat_id: int, text: str, reply_markup: Any = None) -> None:
+        self._fail()
+        self.messages.append((chat_id, text))
+
+    async def send_media_group(self, chat_id: int, media: list[Any]) -> None:
+        self._fail()
+        self.albums.append((chat_id, len(media)))
+
+
+def _method() -> SendMessage:
+    return SendMessage(chat_id=1, text="")
+
+
+def _offer(ad_id: int, photo: str | None = "https://img/{width}x{height}.jpg") -> Offer:
+    return Offer(id=ad_id, url=f"https://www.olx.ua/{ad_id}", title=f"Offer {ad_id}", photo=photo)
+
+
+def _notifier(bot: StubBot, clock: FakeClock, **kwargs: Any) -> Notifier:
+    return Notifier(bot, global_rate=100, global_burst=100, clock=clock, **kwargs)  # type: ignore[arg-type]
+
+
+async def _drain(notifier: Notifier, clock: FakeClock, limit: int = 100) -> None:
+    """
+    Deliver everything, jumping the clock over every wait.
+    """
+    for _ in range(limit):
+        if not notifier._queues:
+            return
+        chat_id, wait = notifier._next_ready()
+        if chat_id < 0:
+            clock.now += wait
+            continue
+        await notifier._deliver_one(chat_id)
+    raise AssertionError("queue did not drain")
+
+
+def test_network_and_server_errors_are_retried_with_backoff() -> None:
+    clock = FakeClock()
+    bot = StubBot(TelegramNetworkError(_method(), "timeout"), TelegramServerError(_method(), "bad gateway"))
+    notifier = _notifier(bot, clock, retry_backoff=2, chat_rate=100, chat_burst=100)
+    notifier.enqueue_text(1, "hello")
+
+    started = clock.now
+    asyncio.run(_drain(notifier, clock))
+
+    assert bot.messages == [(1, "hello")]
+    assert notifier.retries == 2 and notifier.failed == 0 and notifier.sent == 1
+    # 2s after the first failure, 4s after the second
+    assert clock.now - started >= 6
+
+
+def test_client_errors_drop_the_batch() -> None:
+    clock = FakeClock()
+    bot = StubBot(TelegramForbiddenError(_method(), "bot was blocked by the user"))
+    notifier = _notifier(bot, clock)
+    notifier.enqueue_text(1, "first")
+    notifier.enqueue_text(1, "second")
+
+    asyncio.run(_drain(notifier, clock))
+
+    assert bot.messages == [(1, "second")]
+    assert notifier.failed == 1 and notifier.retries == 0
+
+
+def test_unexpected_errors_drop_the_batch_and_keep_the_chat_scheduled() -> None:
+    clock = FakeClock()
+    bot = StubBot(RuntimeError("invalid media"))
+    notifier = _notifier(bot, clock)
+    for text in ("a", "b", "c"):
+        notifier.enqueue_text(1, text)
+
+    asyncio.run(_drain(notifier, clock))
+
+    assert bot.messages == [(1, "b"), (1, "c")]
+    assert notifier.failed == 1 and not notifier._queues
+
+
+def test_transient_errors_give_up_after_the_retry_budget() -> None:
+    clock = FakeClock()
+    bot = StubBot(*(TelegramNetworkError(_method(), "down") for _ in range(3)))
+    notifier = _notifier(bot, clock, retry_attempts=2)
+    notifier.enqueue_text(1, "lost")
+    notifier.enqueue_text(1, "next")
+
+    asyncio.run(_drain(notifier, clock))
+
+    assert bot.messages == [(1, "next")]
+    assert notifier.retries == 2 and notifier.failed == 1
+
+
+class SlowBot(StubBot):
+    def __init__(self) -> None:
+        super().__init__()
+        self.in_flight = self.peak = 0
+
+    async def send_message(self, chat_id: int, text: str, reply_markup: Any = None) -> None:
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(0.05)
+        self.in_flight -= 1
+        await super().send_message(chat_id, text, reply_markup)
+
+
+def test_sends_to_different_chats_overlap_up_to_the_concurrency() -> None:
+    bot = SlowBot()
+
+    async def run() -> None:
+        notifier = Notifier(bot, global_rate=1000, global_burst=1000, concurrency=4)  # type: ignore[arg-type]
+        for chat_id in range(12):
+            notifier.enqueue_text(chat_id, "first")
+            notifier.enqueue_text(chat_id, "second")
+        notifier.start()
+        await notifier.stop(drain_timeout=5)
+
+    asyncio.run(run())
+
+    assert bot.peak == 4
+    assert len(bot.messages) == 24
+    # One send at a time per chat keeps each chat's order
+    for chat_id in range(12):
+        assert [text for chat, text in bot.messages if chat == chat_id] == ["first", "second"]
+
+
+def test_higher_priority_item_reprioritises_its_chat() -> None:
+    clock = FakeClock()
+    notifier = _notifier(StubBot(), clock)
+    notifier.enqueue(Notification(chat_id=1, text="bulk", priority=Priority.BULK))
+    notifier.enqueue(Notification(chat_id=2, text="normal", priority=Priority.NORMAL))
+    assert notifier._next_ready()[0] == 2
+
+    notifier = _notifier(StubBot(), clock)
+    notifier.enqueue(Notification(chat_id=1, text="bulk", priority=Priority.BULK))
+    notifier.enqueue(Notification(chat_id=2, text="normal", priority=Priority.NORMAL))
+    notifier.enqueue(Notification(chat_id=1, text="reply", priority=Priority.INTERACTIVE))
+    assert notifier._next_ready()[0] == 1
+    # Within the chat the interactive item goes first too
+    assert [item.text for item in notifier._queues[1]] == ["reply", "bulk"]
+    assert notifier._next_ready()[0] == 2
+    assert notifier._next_ready()[0] == -1
+
+
+def test_album_only_when_every_offer_has_a_photo() -> None:
+    clock = FakeClock()
+    bot = StubBot()
+    notifier = _notifier(bot, clock, merge_backlog=3)
+    notifier.enqueue_offers(1, [_offer(1), _offer(2), _offer(3)])
+    notifier.enqueue_offers(2, [_offer(4), _offer(5, photo=None), _offer(6)])
+
+    asyncio.run(_drain(notifier, clock))
+
+    assert bot.albums == [(1, 3)]
+    assert [chat_id for chat_id, _ in bot.messages] == [2]
+    assert notifier.merged == 4
+
+
+def test_global_share_scales_the_global_bucket() -> None:
+    notifier = Notifier(StubBot(), global_rate=25, global_burst=5, global_share=0.2)  # type: ignore[arg-type]
+    assert notifier.stats()["global_rate"] == 5 and notifier._global.capacity == 1
+
+    notifier.set_global_share((1 - 0.2) / 4)
+    assert notifier.stats()["global_rate"] == 5 and notifier._global.capacity == 1
+    notifier.set_global_share(1.0)
+    assert notifier.stats()["global_rate"] == 25 and notifier._global.capacity == 5
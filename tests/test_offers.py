@@ -0,0 +1,133 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from offers import Offer, OfferStreamParser, parse_offers_page
+
+
+def _offer_json(ad_id: int, **extra: object) -> dict[str, object]:
+    return {
+        "id": ad_id,
+        "url": f"https://www.olx.ua/d/uk/obyavlenie/{ad_id}.html",
+        "title": f"Квартира №{ad_id}",
+        "created_time": "2025-09-20T10:00:00+03:00",
+        "last_refresh_time": "2025-09-21T12:30:00+03:00",
+        "params": [
+            {"key": "floor", "value": {"key": "3", "label": "3"}},
+            {
+                "key": "price",
+                "value": {
+                    "value": 12000 + ad_id,
+                    "currency": "UAH",
+                    "label": f"{12000 + ad_id} грн.",
+                    "converted_value": None,
+                    "converted_currency": None,
+                },
+            },
+        ],
+        "photos": [{"link": "https://img/{width}x{height}.jpg"}],
+        "promotion": {"top_ad": False, "highlighted": False},
+        "user": {"name": "Олена"},
+        **extra,
+    }
+
+
+def _page() -> bytes:
+    """
+    A page with everything the scanner has to get right: multi-byte text, escapes, brackets
+    inside strings and nested values around `data`.
+    """
+    data = [
+        _offer_json(1),
+        _offer_json(2, title='Escapes: "quoted" \\ back\\slash {not} [nested] с\n', photos=[]),
+        _offer_json(
+            3,
+            promotion={"top_ad": True},
+            params=[
+                {
+                    "key": "price",
+                    "value": {"value": 100, "currency": "USD", "converted_value": 4100.5, "converted_currency": "UAH"},
+                }
+            ],
+        ),
+        _offer_json(4, description={"nested": [[{"deep": ["]", "}", '\\"']}], {}], "empty": []}),
+    ]
+    page = {
+        "metadata": {"total_elements": 4, "visible_total_count": 4, "promoted": [3], "note": 'ends "data": ['},
+        "data": data,
+        "links": {"self": {"href": "https://www.olx.ua/api/v1/offers/?offset=0"}, "next": None},
+        "flags": [True, False, None, -1.5e3],
+    }
+    return json.dumps(page, ensure_ascii=False, indent=1).encode()
+
+
+def _expected(body: bytes) -> list[Offer]:
+    return [Offer.from_json(item) for item in json.loads(body)["data"]]
+
+
+def test_page_split_at_every_byte_parses_the_same() -> None:
+    body = _page()
+    expected = _expected(body)
+    assert parse_offers_page(body) == expected and len(expected) == 4
+
+    for cut in range(len(body) + 1):
+        parser = OfferStreamParser()
+        offers = parser.feed(body[:cut]) + parser.feed(body[cut:])
+        parser.close()
+        assert offers == expected, f"split at byte {cut}"
+
+    parser = OfferStreamParser()
+    offers = [offer for index in range(len(body)) for offer in parser.feed(body[index : index + 1])]
+    parser.close()
+    assert offers == expected and parser.count == 4
+
+
+def test_strings_escapes_and_nested_values() -> None:
+    first, escaped, promoted, nested = parse_offers_page(_page())
+
+    assert escaped.title == 'Escapes: "quoted" \\ back\\slash {not} [nested] с\n' and escaped.photo is None
+    assert promoted.promoted and promoted.price_currency == "USD" and promoted.price_uah == 4100.5
+    assert nested.id == 4 and nested.seller == "Олена"
+    assert first.price_value == 12001 and first.price_label == "12001 грн." and first.price_uah is None
+    assert first.refreshed_at == datetime(2025, 9, 21, 9, 30, tzinfo=timezone.utc)
+
+
+def test_empty_and_missing_data() -> None:
+    assert parse_offers_page(b'{"data": []}') == []
+    assert parse_offers_page(b' {"metadata": {"data": [1]}} ') == []
+    assert parse_offers_page(b"{}") == []
+
+
+def test_torn_page_fails_on_close() -> None:
+    body = _page()
+    # Every offer that is complete is still handed out before the page turns out to be cut off
+    for cut in range(0, len(body), 7):
+        parser = OfferStreamParser()
+        offers = parser.feed(body[:cut])
+        assert offers == _expected(body)[: len(offers)]
+        with pytest.raises(ValueError):
+            parser.close()
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        b'["data"]',
+        b'{"data" []}',
+        b'{"data": [{"id": 1} {"id": 2}]}',
+        b'{"data": [{"id": 1,}]}',
+        b'{"data": [{"id": 1}]} trailing',
+        b'{"data": [], "links": {}',
+        b"{data: []}",
+    ],
+)
+def test_invalid_page_is_rejected(body: bytes) -> None:
+    with pytest.raises(ValueError):
+        parse_offers_page(body)
+
+
+def test_offer_without_optional_fields() -> None:
+    offer = Offer.from_json({"id": "7", "params": None, "photos": None, "promotion": None, "user": None})
+
+    assert offer == Offer(id=7, url="", title="")
@@ -0,0 +1,98 @@
+import asyncio
+import json
+from pathlib import Path
+
+import httpx
+import pytest
+
+import olx_api
+from offers import Offer
+from olx_api import OlxClient
+from response_cache import ResponseCache
+
+
+class OffersPages:
+    """
+    One search page served with an ETag; 304 when the client already has the current version.
+    """
+
+    def __init__(self) -> None:
+        self.ids = [1, 2]
+        self.not_modified = 0
+
+    def body(self) -> bytes:
+        offers = [{"id": ad_id, "url": f"https://www.olx.ua/{ad_id}", "title": f"Offer {ad_id}"} for ad_id in self.ids]
+        return json.dumps({"data": offers, "metadata": {}}).encode()
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        etag = f'"{self.ids[-1]}"'
+        if request.headers.get("If-None-Match") == etag:
+            self.not_modified += 1
+            return httpx.Response(304)
+        return httpx.Response(200, content=self.body(), headers={"ETag": etag})
+
+
+def _client(pages: OffersPages, path: Path) -> OlxClient:
+    return OlxClient("https://olx.test", transport=httpx.MockTransport(pages.handler), cache=ResponseCache(path))
+
+
+def test_page_counts_as_unchanged_only_after_it_was_saved(tmp_path: Path) -> None:
+    pages = OffersPages()
+
+    async def run() -> list[object]:
+        client = _client(pages, tmp_path)
+        await client.start()
+        results: list[object] = [[offer.id for offer in await client.get_offers({})]]
+        pages.ids.append(3)
+        changed = await client.get_changed_offers({})
+        assert changed is not None
+        results.append([offer.id for offer in changed.offers])
+        # Not processed (e.g. the poll failed): the next poll sees the change again
+        retried = await client.get_changed_offers({})
+        assert retried is not None
+        results.append([offer.id for offer in retried.offers])
+        await client.save_pages([retried])
+        results.append(await client.get_changed_offers({}))
+        await client.close()
+
+        # After a restart the saved copy is read back from disk
+        restarted = _client(pages, tmp_path)
+        await restarted.start()
+        results.append(await restarted.get_changed_offers({}))
+        results.append([offer.id for offer in await restarted.get_offers({})])
+        await restarted.close()
+        return results
+
+    assert asyncio.run(run()) == [[1, 2], [1, 2, 3], [1, 2, 3], None, None, [1, 2, 3]]
+    assert pages.not_modified == 3
+
+
+def test_identical_200_is_not_parsed(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    pages = OffersPages()
+    parsed: list[bytes] = []
+    parse = olx_api.parse_offers_page
+
+    def counting_parse(body: bytes) -> list[Offer]:
+        parsed.append(body)
+        return parse(body)
+
+    monkeypatch.setattr(olx_api, "parse_offers_page", counting_parse)
+
+    def ignore_validators(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=pages.body(), headers={"ETag": '"v"'})
+
+    async def run() -> list[object]:
+        client = OlxClient(
+            "https://olx.test", transport=httpx.MockTransport(ignore_validators), cache=ResponseCache(tmp_path)
+        )
+        await client.start()
+        first = await client.get_changed_offers({})
+        assert first is not None
+        await client.save_pages([first])
+        results: list[object] = [[offer.id for offer in first.offers], await client.get_changed_offers({})]
+        stats = client.stats()
+        await client.close()
+        return [*results, stats["unchanged"], stats["parses_skipped"]]
+
+    assert asyncio.run(run()) == [[1, 2], None, 1, 1]
+    assert len(parsed) == 1
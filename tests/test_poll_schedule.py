@@ -0,0 +1,112 @@
+import math
+
+import pytest
+
+from poll_schedule import PollScheduler
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+# New ads per second
+RATES = {"hot": 0.4, "warm": 0.1, "cool": 0.025, "quiet": 0.00625}
+
+
+def _measured(clock: FakeClock, **kwargs: float) -> PollScheduler:
+    """
+    A scheduler that saw RATES over 1600 seconds, with every interval computed from all of them.
+    """
+    schedule = PollScheduler(300, half_life=math.inf, clock=clock, **kwargs)
+    schedule.sync(RATES)
+    for key in RATES:
+        schedule.observe(key, 0)
+    clock.now = 1600
+    for key, rate in RATES.items():
+        schedule.observe(key, round(rate * 1600))
+    # Same time again: no new measurement, only intervals from the final weights
+    for key in RATES:
+        schedule.observe(key, 0)
+    return schedule
+
+
+def _intervals(schedule: PollScheduler) -> dict[str, float]:
+    return {key: 2 * delay for key, delay in schedule.expected_delays().items()}
+
+
+def test_unmeasured_queries_keep_the_fixed_interval() -> None:
+    clock = FakeClock()
+    schedule = PollScheduler(300, clock=clock)
+    schedule.sync(RATES)
+    assert sorted(schedule.pop_due()) == sorted(RATES)
+
+    for key in RATES:
+        schedule.observe(key, 3)
+
+    assert set(_intervals(schedule).values()) == {300}
+    assert schedule.next_due() == 300 and schedule.stats()["unmeasured"] == 4
+
+
+def test_hot_queries_get_shorter_intervals_in_sqrt_proportion() -> None:
+    schedule = _measured(FakeClock(), min_interval=1, max_interval=10**6)
+    intervals = _intervals(schedule)
+
+    assert intervals["hot"] < intervals["warm"] < intervals["cool"] < intervals["quiet"]
+    # T ~ 1 / sqrt(rate): four times the rate, half the interval
+    for faster, slower in zip(RATES, list(RATES)[1:]):
+        assert intervals[slower] / intervals[faster] == pytest.approx(2)
+
+
+@pytest.mark.parametrize("budget", [0.0, 0.05])
+def test_total_poll_rate_stays_within_the_budget(budget: float) -> None:
+    schedule = _measured(FakeClock(), min_interval=1, max_interval=10**6, budget=budget)
+
+    # Without a budget: what polling each query every 300s would spend
+    expected = budget or len(RATES) / 300
+    assert schedule.stats()["polls_per_second"] == pytest.approx(expected)
+    assert sum(1 / interval for interval in _intervals(schedule).values()) == pytest.approx(expected)
+
+
+def test_intervals_are_clamped() -> None:
+    clock = FakeClock()
+    schedule = PollScheduler(300, min_interval=200, max_interval=3600, half_life=math.inf, clock=clock)
+    schedule.sync(["flood", "dead"])
+    for key in ("flood", "dead"):
+        schedule.observe(key, 0)
+    clock.now = 1000
+    schedule.observe("flood", 100_000)
+    schedule.observe("dead", 0)
+    schedule.observe("flood", 0)
+
+    # Unclamped the flood would be polled every ~150s, the dead query every ~5 days
+    assert _intervals(schedule) == {"flood": 200, "dead": 3600}
+
+
+def test_stale_entries_are_skipped_and_postpone_reschedules() -> None:
+    clock = FakeClock()
+    schedule = PollScheduler(300, clock=clock)
+    schedule.sync(["a", "b", "c"])
+    assert sorted(schedule.pop_due()) == ["a", "b", "c"]
+    # Popped keys wait for observe/postpone
+    assert schedule.pop_due(10**6) == [] and schedule.next_due() is None
+
+    schedule.observe("a", 0)
+    schedule.postpone("b")
+    clock.now = 10
+    # Polled again early (e.g. by run_cycle): its entry due at 300 is stale now
+    schedule.observe("a", 0)
+    schedule.observe("c", 0)
+    schedule.sync(["a", "b"])
+
+    assert schedule.next_due() == 300
+    assert schedule.pop_due(305) == ["b"]
+    assert schedule.next_due() == 310
+    assert schedule.pop_due(10**6) == ["a"]
+    # Unknown keys are ignored
+    schedule.observe("c", 1)
+    schedule.postpone("c")
+    assert schedule.pop_due(10**6) == [] and len(schedule) == 2
@@ -0,0 +1,155 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any
+
+from models import CurrencyEnum, DeliveryModeEnum, SearchFilter, UserSearchFilters
+from offers import Offer
+from olx_api import OFFERS_PAGE_SIZE, OffersPage
+from poller import ListingPoller, SearchQuery, Watermark
+from price_history import PriceHistory
+from seen_store import SeenStore
+
+START = datetime(2025, 10, 1, tzinfo=timezone.utc)
+QUERY = SearchQuery(category_id=1, city_id=268, region_id=25)
+
+
+async def _deliver(chat_id: int, offers: list[Any]) -> None:
+    pass
+
+
+class StubListings:
+    """
+    Search results newest first, one minute apart, with `promoted` ads pinned on top of the first page.
+    """
+
+    def __init__(self, count: int, promoted: list[Offer] | None = None) -> None:
+        self.offers = [
+            Offer(id=1000 - i, url="", title="", refreshed_at=START - timedelta(minutes=i)) for i in range(count)
+        ]
+        self.promoted = promoted or []
+        self.offsets: list[int] = []
+
+    def _page(self, offset: int) -> list[Offer]:
+        self.offsets.append(offset)
+        listing = self.promoted + self.offers
+        return listing[offset : offset + OFFERS_PAGE_SIZE]
+
+    async def get_offers(self, params: dict[str, Any], offset: int = 0) -> list[Offer]:
+        return self._page(offset)
+
+    async def get_changed_offers(self, params: dict[str, Any], offset: int = 0) -> OffersPage | None:
+        return OffersPage(str(offset), self._page(offset))
+
+
+def _poller(listings: StubListings, tmp_path: Path, **kwargs: Any) -> ListingPoller:
+    return ListingPoller(
+        deliver=_deliver,
+        client=listings,  # type: ignore[arg-type]
+        seen_store=SeenStore(path=None),
+        history=PriceHistory(tmp_path),
+        **kwargs,
+    )
+
+
+def _mark(offer: Offer) -> Watermark:
+    assert offer.refreshed_at is not None
+    return Watermark(offer.refreshed_at, offer.id)
+
+
+def test_fetch_since_stops_at_the_watermark(tmp_path: Path) -> None:
+    listings = StubListings(5 * OFFERS_PAGE_SIZE)
+    poller = _poller(listings, tmp_path)
+    watermark = _mark(listings.offers[OFFERS_PAGE_SIZE + 5])
+
+    result = asyncio.run(poller.fetch_since(QUERY, watermark))
+
+    assert listings.offsets == [0, OFFERS_PAGE_SIZE] and result.pages == 2
+    assert result.offers == listings.offers[: OFFERS_PAGE_SIZE + 5]
+    assert result.watermark == _mark(listings.offers[0])
+    assert len(result.changed) == 2
+
+
+def test_fetch_since_without_a_watermark_reads_one_page(tmp_path: Path) -> None:
+    listings = StubListings(3 * OFFERS_PAGE_SIZE)
+
+    result = asyncio.run(_poller(listings, tmp_path).fetch_since(QUERY, None))
+
+    assert listings.offsets == [0] and result.offers == listings.offers[:OFFERS_PAGE_SIZE]
+    assert result.watermark == _mark(listings.offers[0])
+
+
+def test_promoted_ads_neither_stop_paging_nor_move_the_watermark(tmp_path: Path) -> None:
+    # An old ad pinned on top looks like "reached the watermark", a fresh one like the newest ad
+    old = Offer(id=1, url="", title="", refreshed_at=START - timedelta(days=30), promoted=True)
+    fresh = Offer(id=2, url="", title="", refreshed_at=START + timedelta(days=1), promoted=True)
+    listings = StubListings(2 * OFFERS_PAGE_SIZE, promoted=[old, fresh])
+    watermark = _mark(listings.offers[OFFERS_PAGE_SIZE + 10])
+
+    result = asyncio.run(_poller(listings, tmp_path).fetch_since(QUERY, watermark))
+
+    assert listings.offsets == [0, OFFERS_PAGE_SIZE]
+    assert result.offers == [old, fresh, *listings.offers[: OFFERS_PAGE_SIZE + 10]]
+    assert result.watermark == _mark(listings.offers[0])
+
+
+def test_fetch_since_gives_up_after_max_pages(tmp_path: Path) -> None:
+    listings = StubListings(10 * OFFERS_PAGE_SIZE)
+    # Far behind, e.g. after a long outage
+    watermark = Watermark(START - timedelta(days=365), 1)
+
+    result = asyncio.run(_poller(listings, tmp_path, max_pages=3).fetch_since(QUERY, watermark))
+
+    assert result.pages == 3 and listings.offsets == [0, OFFERS_PAGE_SIZE, 2 * OFFERS_PAGE_SIZE]
+    assert result.offers == listings.offers[: 3 * OFFERS_PAGE_SIZE]
+    assert result.watermark == _mark(listings.offers[0])
+
+
+def test_repeated_resume_keeps_one_digest_subscription(tmp_path: Path) -> None:
+    poller = ListingPoller(deliver=_deliver, seen_store=SeenStore(path=None), history=PriceHistory(tmp_path))
+    search_filter = SearchFilter(
+        id=5, filter_name="Квартири / Київ", category_id=1, city_id=268, region_id=25, currency=CurrencyEnum.UAH
+    )
+    subscription = UserSearchFilters(
+        id=9, user_id=1, search_filter_id=5, delivery_mode=DeliveryModeEnum.BATCHED, digest_interval=60
+    )
+    query = SearchQuery.from_filter(search_filter)
+
+    poller.update_subscription(7, search_filter, subscription, True)
+    poller.update_subscription(7, search_filter, subscription, True)
+    assert [other.id for other in poller._groups[query].digests[5]] == [9]
+
+    poller.update_subscription(7, search_filter, subscription, False)
+    assert query not in poller._groups
+
+
+def test_worker_drops_subscriptions_paused_elsewhere_before_delivering(tmp_path: Path) -> None:
+    active = {(5, 7, 1), (6, 8, 3)}
+
+    async def load_active(filter_ids: set[int]) -> list[tuple[int, int, int]]:
+        return [key for key in active if key[0] in filter_ids]
+
+    poller = ListingPoller(
+        deliver=_deliver, seen_store=SeenStore(path=None), history=PriceHistory(tmp_path), load_active=load_active
+    )
+    filters = [
+        SearchFilter(id=filter_id, filter_name="Квартири", category_id=1, city_id=268, region_id=25, price_to=price)
+        for filter_id, price in ((5, 1000), (6, 2000))
+    ]
+    subscriptions = [
+        (7, filters[0], UserSearchFilters(id=1, user_id=1, search_filter_id=5)),
+        (8, filters[0], UserSearchFilters(id=2, user_id=2, search_filter_id=5)),
+        (8, filters[1], UserSearchFilters(id=3, user_id=2, search_filter_id=6, delivery_mode=DeliveryModeEnum.DAILY)),
+    ]
+    for telegram_id, search_filter, subscription in subscriptions:
+        poller.update_subscription(telegram_id, search_filter, subscription, True)
+    query = SearchQuery.from_filter(filters[0])
+    group = poller._groups[query]
+
+    asyncio.run(poller._drop_inactive(query, group))
+    assert group.subscribers == {5: {7}} and [other.id for other in group.digests[6]] == [3]
+
+    # Paused in the bot: the worker forgets the query before sending anything
+    active.clear()
+    asyncio.run(poller._drop_inactive(query, group))
+    assert not group.filters and query not in poller._groups
@@ -0,0 +1,98 @@
+import asyncio
+import multiprocessing
+import os
+import signal
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from sharding import ShardCoordinator
+
+INTERVAL = 1.0
+HEARTBEAT_INTERVAL = 0.2
+HEARTBEAT_TTL = 1.0
+QUERIES = 100
+SECONDS = 6.0
+
+
+def _worker(worker_id: str, db_path: str, log_path: str, seconds: float) -> None:
+    """
+    Claim every query in a loop for `seconds`, logging "key,worker,time" per claim.
+    """
+
+    async def run() -> None:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}", connect_args={"timeout": 30})
+        sessions = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        shard = ShardCoordinator(
+            worker_id, sessions, heartbeat_interval=HEARTBEAT_INTERVAL, heartbeat_ttl=HEARTBEAT_TTL
+        )
+        await shard.start()
+        keys = [f"query-{i}" for i in range(QUERIES)]
+        deadline = time.time() + seconds
+        with open(log_path, "a") as log:
+            while time.time() < deadline:
+                started = time.time()
+                for key in await shard.claim(keys, INTERVAL):
+                    log.write(f"{key},{worker_id},{started}\n")
+                log.flush()
+                await asyncio.sleep(max(0.0, INTERVAL / 4 - (time.time() - started)))
+        await shard.stop()
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+def _create_schema(db_path: str) -> None:
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+    SQLModel.metadata.create_all(
+        engine, tables=[SQLModel.metadata.tables[name] for name in ("pollerlease", "pollerworker")]
+    )
+    engine.dispose()
+
+
+def test_every_query_is_claimed_once_per_interval_through_joins_and_crashes(tmp_path: Path) -> None:
+    db_path, log_path = str(tmp_path / "shard.sqlite3"), str(tmp_path / "claims.csv")
+    _create_schema(db_path)
+    context = multiprocessing.get_context("spawn")
+
+    def spawn(name: str, duration: float) -> multiprocessing.process.BaseProcess:
+        process = context.Process(target=_worker, args=(name, db_path, log_path, duration))
+        process.start()
+        return process
+
+    processes = [spawn(f"w{i}", SECONDS) for i in range(3)]
+    time.sleep(SECONDS / 3)
+    processes.append(spawn("late", SECONDS / 2))  # joins mid-run
+    time.sleep(SECONDS / 6)
+    os.kill(processes[0].pid or 0, signal.SIGKILL)  # dies without deregistering
+    for process in processes:
+        process.join(timeout=SECONDS * 3)
+
+    claims: dict[str, list[float]] = defaultdict(list)
+    workers: set[str] = set()
+    for line in Path(log_path).read_text().splitlines():
+        key, worker_id, at = line.split(",")
+        claims[key].append(float(at))
+        workers.add(worker_id)
+
+    doubles, gaps = [], []
+    # Failover bound: dead worker detected after the TTL, picked up on the next claim round
+    max_gap = INTERVAL + HEARTBEAT_TTL + INTERVAL / 2 + HEARTBEAT_INTERVAL
+    for key in (f"query-{i}" for i in range(QUERIES)):
+        times = sorted(claims[key])
+        assert times, f"{key} was never claimed"
+        for previous, current in zip(times, times[1:]):
+            if current - previous < INTERVAL * 0.9:
+                doubles.append(key)
+            if current - previous > max_gap:
+                gaps.append(key)
+
+    assert workers == {"w0", "w1", "w2", "late"}
+    assert doubles == [] and gaps == []
@@ -0,0 +1,8 @@
+from constants import DELIVERY_OPTIONS
+from models import DeliveryModeEnum
+from telegram_bot import delivery_option
+
+
+def test_delivery_keyboard_marks_the_stored_mode() -> None:
+    for index, (_, mode, _) in enumerate(DELIVERY_OPTIONS):
+        assert delivery_option(DeliveryModeEnum(mode)) == index
@@ -0,0 +1,160 @@
+import asyncio
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, AsyncGenerator, Iterable, cast
+
+import pytest
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import Chat, Message, Update, User
+from sqlalchemy import event, func
+from sqlalchemy.exc import DataError, OperationalError
+from sqlmodel import col, select
+
+import db
+import telegram_bot
+from models import TelegramUser
+from user_registry import UserRegistry
+
+
+class StubSession(BaseSession):
+    """
+    Answers every Bot API call with a message and records the calls.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.calls: list[TelegramMethod[Any]] = []
+
+    async def make_request(
+        self, bot: Bot, method: TelegramMethod[TelegramType], timeout: int | None = None
+    ) -> TelegramType:
+        self.calls.append(method)
+        sent = Message(message_id=len(self.calls), date=datetime.now(timezone.utc), chat=Chat(id=1, type="private"))
+        return cast(TelegramType, sent)
+
+    async def stream_content(
+        self,
+        url: str,
+        headers: dict[str, Any] | None = None,
+        timeout: int = 30,
+        chunk_size: int = 65536,
+        raise_for_status: bool = True,
+    ) -> AsyncGenerator[bytes, None]:
+        yield b""
+
+    async def close(self) -> None:
+        pass
+
+
+def _start(update_id: int, telegram_id: int, username: str) -> Update:
+    message = Message(
+        message_id=update_id,
+        date=datetime.now(timezone.utc),
+        chat=Chat(id=telegram_id, type="private"),
+        from_user=User(id=telegram_id, is_bot=False, first_name="User", username=username),
+        text="/start",
+    )
+    return Update(update_id=update_id, message=message)
+
+
+def test_repeat_start_makes_no_database_queries(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("DATABASE_URL", f"sqlite+aiosqlite:///{tmp_path}/registry.sqlite3")
+    registry = UserRegistry()
+    monkeypatch.setattr(telegram_bot, "known_users", registry)
+    monkeypatch.setattr(telegram_bot, "create_fsm_storage", MemoryStorage)
+    app = telegram_bot.create_bot_app("42:TEST")
+    app.bot.session = session = StubSession()
+    existing = {10_000_000 + i: f"user{i}" for i in range(20)}
+    statements: list[str] = []
+
+    async def run() -> tuple[list[str], list[str], int]:
+        await db.close_db()
+        await db.create_db_and_tables()
+        await db.upsert_telegram_users(existing.items())
+        await registry.warm()
+        event.listen(
+            db.get_engine().sync_engine,
+            "before_cursor_execute",
+            lambda conn, cursor, statement, *args: statements.append(statement),
+        )
+        update_ids = iter(range(1, 10**6))
+        for _ in range(3):
+            for telegram_id, username in existing.items():
+                await app.dp.feed_update(app.bot, _start(next(update_ids), telegram_id, username))
+        repeat = list(statements)
+
+        # New users and a changed username are written behind, together
+        statements.clear()
+        for i in range(5):
+            await app.dp.feed_update(app.bot, _start(next(update_ids), 20_000_000 + i, f"new{i}"))
+        await app.dp.feed_update(app.bot, _start(next(update_ids), 10_000_000, "renamed"))
+        in_handlers = list(statements)
+        await registry.flush()
+        async with db.async_session() as db_session:
+            stored = await db_session.scalar(select(func.count(col(TelegramUser.id))))
+        await db.close_db()
+        return repeat, in_handlers, stored or 0
+
+    repeat, in_handlers, stored = asyncio.run(run())
+
+    assert repeat == [] and in_handlers == []
+    # Two answers per /start
+    assert len(session.calls) == 2 * (3 * len(existing) + 6)
+    assert sum(statement.startswith("INSERT INTO telegramuser") for statement in statements) == 1
+    assert stored == len(existing) + 5
+    assert registry.stats()["written"] == 6
+
+
+class StubUsersTable:
+    """
+    Rejects a batch holding an id that does not fit the column, like asyncpg with a 32-bit one.
+    """
+
+    def __init__(self) -> None:
+        self.rows: dict[int, str] = {}
+        self.batches = 0
+        self.down = False
+
+    async def save(self, users: Iterable[tuple[int, str]]) -> None:
+        self.batches += 1
+        batch = dict(users)
+        if self.down:
+            raise OperationalError("INSERT", {}, ConnectionRefusedError())
+        if any(telegram_id >= 2**31 for telegram_id in batch):
+            raise DataError("INSERT", {}, OverflowError("value out of int32 range"))
+        self.rows.update(batch)
+
+
+def test_rejected_row_does_not_hold_back_its_batch() -> None:
+    table = StubUsersTable()
+    registry = UserRegistry(table.save)
+    for telegram_id in range(1, 9):
+        registry.remember(telegram_id, f"user{telegram_id}")
+    registry.remember(2**31 + 5, "new")
+
+    asyncio.run(registry.flush())
+
+    assert sorted(table.rows) == list(range(1, 9))
+    assert registry.stats()["rejected"] == 1 and registry.written == 8 and not registry._pending
+    # Forgotten, so it is tried again on the next /start
+    assert registry.remember(2**31 + 5, "new")
+
+
+def test_batch_is_kept_whole_while_the_database_is_down() -> None:
+    table = StubUsersTable()
+    table.down = True
+    registry = UserRegistry(table.save)
+    for telegram_id in range(1, 9):
+        registry.remember(telegram_id, f"user{telegram_id}")
+
+    with pytest.raises(OperationalError):
+        asyncio.run(registry.flush())
+
+    assert table.batches == 1 and len(registry._pending) == 8 and registry.stats()["rejected"] == 0
+    table.down = False
+    asyncio.run(registry.flush())
+    assert len(table.rows) == 8 and not registry._pending
@@ -0,0 +1,114 @@
+import asyncio
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Mapping
+
+import pytest
+from aiogram.types import Chat, Message, Update, User
+
+import telegram_bot
+import webhook
+from filter_pages import FilterPages
+from fsm_storage import BufferedStorage, Record
+from models import CurrencyEnum, SearchFilter, UserSearchFilters
+from webhook import SubscriptionFeed, UpdateDeduplicator, UpdateDedupMiddleware
+
+
+def _pages(changes: list[tuple[int, int | None, int | None, bool]]) -> FilterPages:
+    async def no_rows(telegram_id: int, anchor: int, backward: bool, limit: int) -> list[Any]:
+        return []
+
+    pages = FilterPages(no_rows)
+    pages.listeners.append(
+        lambda telegram_id, search_filter, subscription, active: changes.append(
+            (telegram_id, search_filter.id, subscription.id, active)
+        )
+    )
+    return pages
+
+
+def test_changes_are_replayed_on_the_other_workers(tmp_path: Path) -> None:
+    search_filter = SearchFilter(
+        id=5, filter_name="Квартири / Київ", category_id=1, city_id=268, region_id=25, currency=CurrencyEnum.UAH
+    )
+    subscription = UserSearchFilters(id=9, user_id=1, search_filter_id=5)
+    # What the database says now: paused, then deleted
+    rows: dict[tuple[int, int], tuple[UserSearchFilters, SearchFilter]] = {}
+
+    async def load(telegram_id: int, filter_id: int) -> tuple[UserSearchFilters, SearchFilter] | None:
+        return rows.get((telegram_id, filter_id))
+
+    async def run() -> None:
+        changes: list[list[tuple[int, int | None, int | None, bool]]] = [[], []]
+        pages = [_pages(changes[0]), _pages(changes[1])]
+        feeds = [SubscriptionFeed(page, load, tmp_path / "updates.sqlite3", interval=3600) for page in pages]
+        feeds[1].origin += 1
+        for feed in feeds:
+            feed.start()
+
+        paused = UserSearchFilters(id=9, user_id=1, search_filter_id=5, paused=True)
+        rows[(7, 5)] = (paused, search_filter)
+        pages[0].changed(7, search_filter, paused, False)
+        await feeds[0].sync()
+        await feeds[1].sync()
+        assert changes[1] == [(7, 5, 9, False)]
+
+        rows[(7, 5)] = (subscription, search_filter)
+        pages[1].changed(7, search_filter, subscription, True)
+        del rows[(7, 5)]
+        pages[1].changed(7, search_filter, subscription, False)
+        await feeds[1].sync()
+        await feeds[0].sync()
+        # The resume is replayed as the database has it by then, the deletion from the queued rows
+        assert changes[0][1:] == [(7, 5, 9, False), (7, 5, 9, False)]
+        # Replays are not published again
+        await feeds[1].sync()
+        assert len(changes[1]) == 3 and feeds[0].published == 1
+
+        for feed in feeds:
+            await feed.stop()
+            feed.close()
+
+    asyncio.run(run())
+
+
+class CountingBackend:
+    def __init__(self) -> None:
+        self.reads = 0
+
+    async def read(self, key: str) -> Record | None:
+        self.reads += 1
+        return None
+
+    async def write(self, key: str, state: str | None, data: Mapping[str, Any]) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+def test_duplicate_update_is_dropped_before_fsm_state_is_loaded(monkeypatch: pytest.MonkeyPatch) -> None:
+    backend = CountingBackend()
+    monkeypatch.setattr(telegram_bot, "create_fsm_storage", lambda: BufferedStorage(backend))
+    monkeypatch.setattr(webhook, "UpdateDeduplicator", lambda: UpdateDeduplicator(path=None))
+    app = telegram_bot.create_bot_app("42:TEST")
+    webhook.create_app(app.dp, app.bot, primary=False)
+    edited = Message(
+        message_id=1,
+        date=datetime.now(timezone.utc),
+        chat=Chat(id=7, type="private"),
+        from_user=User(id=7, is_bot=False, first_name="User"),
+        text="edited",
+    )
+    update = Update(update_id=1, edited_message=edited)
+
+    async def run() -> None:
+        # Telegram redelivering an update it got no answer for in time
+        await app.dp.feed_update(app.bot, update)
+        await app.dp.feed_update(app.bot, update)
+        await app.bot.session.close()
+
+    asyncio.run(run())
+
+    assert isinstance(app.dp.update.outer_middleware[0], UpdateDedupMiddleware)
+    assert backend.reads == 1